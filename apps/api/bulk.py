@@ -0,0 +1,241 @@
+"""
+Пакетная загрузка (upsert) узлов сети и связей между ними.
+
+Строки проверяются сериализаторами по одной, но все обращения к БД выполняются
+пакетами: поиск существующих узлов, проверка продуктов и циклов - одним запросом
+на пакет, запись - через bulk_create/bulk_update в отдельной транзакции на каждый чанк.
+Связи чанка перед вставкой еще раз проверяются на циклы под блокировкой графа
+(lock_supply_graph), так как параллельная запись могла изменить граф после проверки пакета.
+Ошибки не прерывают загрузку и возвращаются с номером строки.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from apps.network import hierarchy
+from apps.network.models import NetworkNode, Product, SupplierClosure, SupplierLink, lock_supply_graph
+from .serializers import BulkLinkRowSerializer, BulkNodeRowSerializer
+
+business_logger = logging.getLogger('business')
+
+# Поля узла, которые обновляются при upsert (email - ключ и не меняется).
+NODE_FIELDS = ('name', 'node_type', 'country', 'city', 'street', 'house_number')
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _reaches(graph, start, target):
+    """Проверяет обходом в глубину, достижим ли target из start."""
+    stack, seen = [start], {start}
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        for next_node in graph.get(node, ()):
+            if next_node not in seen:
+                seen.add(next_node)
+                stack.append(next_node)
+    return False
+
+
+def _split_cycles(edges):
+    """
+    Делит связи (index, supplier_id, client_id) на допустимые и создающие цикл.
+
+    Строится граф на концах связей: достижимость между ними по существующим связям берется
+    из таблицы замыкания одним запросом, затем связи добавляются по одной. Любой цикл,
+    проходящий через новые связи, проходит через их концы, поэтому такой граф находит все циклы.
+    """
+    touched = {node_id for _, supplier_id, client_id in edges for node_id in (supplier_id, client_id)}
+    graph = defaultdict(set)
+    for ancestor_id, descendant_id in (
+        SupplierClosure.objects
+        .filter(ancestor_id__in=touched, descendant_id__in=touched)
+        .values_list('ancestor_id', 'descendant_id')
+        .distinct()
+    ):
+        graph[ancestor_id].add(descendant_id)
+
+    accepted, cyclic = [], []
+    for edge in edges:
+        _, supplier_id, client_id = edge
+        if _reaches(graph, client_id, supplier_id):
+            cyclic.append(edge)
+            continue
+        graph[supplier_id].add(client_id)
+        accepted.append(edge)
+    return accepted, cyclic
+
+
+class BulkUpsert:
+    """
+    Выполняет пакетный upsert узлов (по email) и создание связей.
+
+    Результат run() содержит счетчики и список ошибок вида
+    {'section': 'nodes' | 'links', 'index': номер строки, 'errors': {...}}.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.errors = []
+        self.stats = {'nodes_created': 0, 'nodes_updated': 0, 'links_created': 0, 'links_existing': 0}
+
+    def run(self, nodes, links):
+        for chunk in _chunks(self._validate_nodes(nodes), self.chunk_size):
+            self._save_nodes(chunk)
+        # Связи проверяются после записи узлов, чтобы ссылаться на узлы из того же пакета.
+        for chunk in _chunks(self._validate_links(links), self.chunk_size):
+            self._save_links(chunk)
+
+        self.errors.sort(key=lambda error: (error['section'], error['index']))
+        business_logger.info(
+            f"Пакетная загрузка: узлов создано {self.stats['nodes_created']}, "
+            f"обновлено {self.stats['nodes_updated']}, связей создано {self.stats['links_created']}, "
+            f"уже существовало {self.stats['links_existing']}, ошибок {len(self.errors)}"
+        )
+        return {**self.stats, 'errors': self.errors}
+
+    def _error(self, section, index, errors):
+        self.errors.append({'section': section, 'index': index, 'errors': errors})
+
+    # --- Узлы ---
+
+    def _validate_nodes(self, nodes):
+        """Проверяет строки узлов, дубликаты email в пакете и существование продуктов."""
+        valid, seen = [], {}
+        for index, data in enumerate(nodes):
+            serializer = BulkNodeRowSerializer(data=data)
+            if not serializer.is_valid():
+                self._error('nodes', index, serializer.errors)
+                continue
+            email = serializer.validated_data['email']
+            if email in seen:
+                self._error('nodes', index, {'email': [f"Email уже указан в строке {seen[email]}."]})
+                continue
+            seen[email] = index
+            valid.append((index, serializer.validated_data))
+
+        product_ids = {product_id for _, row in valid for product_id in row.get('products', ())}
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+
+        result = []
+        for index, row in valid:
+            missing = sorted(set(row.get('products', ())) - existing)
+            if missing:
+                self._error('nodes', index, {'products': [f"Продукты не найдены: {missing}."]})
+                continue
+            result.append((index, row))
+        return result
+
+    def _save_nodes(self, chunk):
+        try:
+            with transaction.atomic():
+                existing = {
+                    node.email: node for node in
+                    NetworkNode.objects.filter(email__in=[row['email'] for _, row in chunk]).only('id', 'email')
+                }
+                to_create, to_update, with_products = [], [], []
+                for _, row in chunk:
+                    node = existing.get(row['email'])
+                    if node is None:
+                        node = NetworkNode(email=row['email'])
+                        to_create.append(node)
+                    else:
+                        to_update.append(node)
+                    for field in NODE_FIELDS:
+                        setattr(node, field, row[field])
+                    if 'products' in row:
+                        with_products.append((node, set(row['products'])))
+
+                NetworkNode.objects.bulk_create(to_create)
+                # Явный список полей: сводные поля иерархии не должны перезаписываться.
+                NetworkNode.objects.bulk_update(to_update, NODE_FIELDS)
+
+                # Продукты заменяются целиком у строк, где они переданы.
+                through = NetworkNode.products.through
+                through.objects.filter(networknode_id__in=[node.pk for node, _ in with_products]).delete()
+                through.objects.bulk_create([
+                    through(networknode_id=node.pk, product_id=product_id)
+                    for node, product_ids in with_products for product_id in product_ids
+                ])
+                # bulk_create/bulk_update не вызывают сигналы и save(): версии и кэш ответов обновляем явно.
+                hierarchy.touch_nodes({node.pk for node in to_create + to_update})
+        except IntegrityError as e:
+            for index, _ in chunk:
+                self._error('nodes', index, {'non_field_errors': [f"Ошибка записи пакета: {e}"]})
+            return
+
+        self.stats['nodes_created'] += len(to_create)
+        self.stats['nodes_updated'] += len(to_update)
+
+    # --- Связи ---
+
+    def _validate_links(self, links):
+        """Проверяет строки связей, отбрасывает существующие и находит циклы для всего пакета сразу."""
+        rows = []
+        for index, data in enumerate(links):
+            serializer = BulkLinkRowSerializer(data=data)
+            if not serializer.is_valid():
+                self._error('links', index, serializer.errors)
+                continue
+            data = serializer.validated_data
+            rows.append((index, data['supplier_email'], data['client_email']))
+
+        emails = {email for _, supplier, client in rows for email in (supplier, client)}
+        ids = dict(NetworkNode.objects.filter(email__in=emails).values_list('email', 'pk'))
+
+        edges = []
+        for index, supplier, client in rows:
+            missing = [email for email in (supplier, client) if email not in ids]
+            if missing:
+                self._error('links', index, {'non_field_errors': [f"Узлы не найдены: {missing}."]})
+                continue
+            edges.append((index, ids[supplier], ids[client]))
+
+        existing = set(
+            SupplierLink.objects
+            .filter(supplier_id__in={edge[1] for edge in edges}, client_id__in={edge[2] for edge in edges})
+            .values_list('supplier_id', 'client_id')
+        )
+        new_edges = []
+        for index, supplier_id, client_id in edges:
+            if (supplier_id, client_id) in existing:
+                self.stats['links_existing'] += 1
+                continue
+            existing.add((supplier_id, client_id))
+            new_edges.append((index, supplier_id, client_id))
+
+        accepted, cyclic = _split_cycles(new_edges)
+        self._cycle_errors(cyclic)
+        return accepted
+
+    def _cycle_errors(self, edges):
+        for index, _, _ in edges:
+            self._error('links', index, {'non_field_errors': ["Связь создает циклическую зависимость."]})
+
+    def _save_links(self, chunk):
+        try:
+            with transaction.atomic():
+                # Повторная проверка под блокировкой: граф мог измениться после _validate_links().
+                lock_supply_graph()
+                accepted, cyclic = _split_cycles(chunk)
+                SupplierLink.objects.bulk_create([
+                    SupplierLink(supplier_id=supplier_id, client_id=client_id)
+                    for _, supplier_id, client_id in accepted
+                ])
+                # bulk_create не вызывает сигналы, поэтому данные иерархии обновляем явно,
+                # замыкание - сразу для всех связей чанка.
+                hierarchy.links_added([(supplier_id, client_id) for _, supplier_id, client_id in accepted])
+                hierarchy.update_levels({client_id for _, _, client_id in accepted})
+                hierarchy.relink_debts([(supplier_id, client_id, 0) for _, supplier_id, client_id in accepted])
+        except IntegrityError as e:
+            for index, _, _ in chunk:
+                self._error('links', index, {'non_field_errors': [f"Ошибка записи пакета: {e}"]})
+            return
+
+        self._cycle_errors(cyclic)
+        self.stats['links_created'] += len(accepted)
@@ -0,0 +1,84 @@
+"""
+Кэширование ответов list/retrieve с инвалидацией по поколениям (apps/network/cache.py).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.network import cache as generations
+from config import routers
+
+HITS_KEY = 'api:cache:hits'
+MISSES_KEY = 'api:cache:misses'
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_stats():
+    """Счетчики попаданий и промахов кэша ответов."""
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'timeout': settings.API_RESPONSE_CACHE_TIMEOUT,
+    }
+
+
+class CachedResponseMixin:
+    """
+    Отдает list/retrieve из кэша. Ключ включает полный URL запроса (фильтры, страницу)
+    и токены поколений, поэтому ответ становится неактуальным ровно при записи
+    в затронутые узлы. В ответ добавляется заголовок X-Cache: HIT или MISS.
+    Кэшируются данные ответа до рендеринга, поэтому формат вывода на ключ не влияет.
+    Права доступа проверяются до обращения к кэшу. Ответы, прочитанные с реплики,
+    не сохраняются (config.routers.reading_from_replica).
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, [generations.GLOBAL_KEY, generations.COLLECTION_KEY],
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self.cached_response(
+            request, [generations.GLOBAL_KEY, generations.node_key(pk)],
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def cached_response(self, request, generation_keys, compute):
+        timeout = settings.API_RESPONSE_CACHE_TIMEOUT
+        if not timeout:
+            return compute()
+
+        tokens = ':'.join(generations.get_generations(generation_keys))
+        url_hash = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        key = f'api:response:{self.basename}:{self.action}:{tokens}:{url_hash}'
+
+        data = cache.get(key)
+        if data is not None:
+            _increment(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _increment(MISSES_KEY)
+        from_replica = routers.reading_from_replica()
+        response = compute()
+        if response.status_code == status.HTTP_200_OK and not from_replica:
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
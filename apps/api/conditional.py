@@ -0,0 +1,80 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) по версиям строк (apps/network/models.VersionedModel)
+и поколениям кэша ответов (apps/network/cache.py).
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+
+from apps.network import cache as generations
+from config import routers
+
+
+class ConditionalGetMixin:
+    """
+    Отвечает 304 на If-None-Match / If-Modified-Since до выборки и сериализации данных.
+
+    ETag объекта - его версия: у узла она увеличивается и при изменении вложенных
+    продуктов и связей. ETag списка - хеш токенов поколений list_generation_keys,
+    которые меняются при любой записи в коллекцию. Оба ETag включают также отсортированные
+    параметры запроса (страница, курсор, фильтры, fields/expand) и формат ответа; формат
+    выбирается и по заголовку Accept, поэтому ответ содержит Vary: Accept.
+
+    Токены читаются из кэша, поэтому проверка ETag списка не обращается к БД. Без
+    list_generation_keys или без общего для всех воркеров кэша (CACHE_GENERATIONS_SHARED)
+    список отдается без ETag: токены процесса не меняются при записи в другом воркере.
+    Список, прочитанный с реплики, тоже отдается без ETag: реплика могла еще не получить
+    запись, уже сменившую токены. Совпадающий ETag клиента при этом дает 304.
+    """
+    list_generation_keys = ()
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            state = self.queryset.model._default_manager.filter(pk=pk).values_list('version', 'updated_at').first()
+        except (TypeError, ValueError):
+            state = None
+        if state is None:
+            # Несуществующий объект: 404 сформирует стандартная обработка.
+            return super().retrieve(request, *args, **kwargs)
+
+        version, updated_at = state
+        return self.conditional_response(
+            request, f'{self.basename}-{pk}-{version}-{self.variant_hash(request)}', updated_at,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.list_generation_keys or not settings.CACHE_GENERATIONS_SHARED:
+            return super().list(request, *args, **kwargs)
+        tokens = generations.get_generations(list(self.list_generation_keys))
+        etag = f"{self.basename}-list-{self.variant_hash(request, *tokens, request.path)}"
+        from_replica = routers.reading_from_replica()
+        response = self.conditional_response(
+            request, etag, None, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+        if from_replica and response.status_code == 200:
+            del response['ETag']
+        return response
+
+    @staticmethod
+    def variant_hash(request, *parts):
+        """Хеш частей ETag с параметрами запроса (без учета их порядка) и форматом ответа."""
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        fingerprint = ':'.join([*parts, query, request.accepted_renderer.format])
+        return hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+
+    def conditional_response(self, request, etag, updated_at, compute):
+        etag = quote_etag(etag)
+        last_modified = int(updated_at.timestamp()) if updated_at else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = compute()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Accept',))
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
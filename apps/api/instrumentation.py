@@ -0,0 +1,34 @@
+"""
+Фазы auth и serialize для заголовка Server-Timing (config/instrumentation.py).
+"""
+from rest_framework import serializers
+
+from config.instrumentation import phase
+
+
+class InstrumentedViewMixin:
+    """Время аутентификации DRF учитывается в фазе auth."""
+
+    def perform_authentication(self, request):
+        with phase('auth'):
+            super().perform_authentication(request)
+
+
+class InstrumentedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with phase('serialize'):
+            return super().data
+
+
+class InstrumentedSerializerMixin:
+    """
+    Время построения данных ответа учитывается в фазе serialize. Для списков нужен
+    Meta.list_serializer_class = InstrumentedListSerializer. Вложенные сериализаторы
+    вызывают to_representation, а не data, поэтому время не учитывается дважды.
+    """
+
+    @property
+    def data(self):
+        with phase('serialize'):
+            return super().data
@@ -1,11 +1,144 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError as APIValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Постраничный вывод по ключу (keyset): следующая страница выбирается условием
+    "после последней записи" по индексированным полям, а не OFFSET.
+
+    Стоимость любой страницы равна стоимости первой. Порядок задается атрибутом
+    cursor_ordering представления, последнее поле должно быть уникальным (обычно id).
+    Общее количество считается только по запросу (?count=true).
+
+    Параметры, задающие другой порядок (?ordering= и ?search= с сортировкой
+    по релевантности), с курсором не сочетаются: запрос отклоняется с 400,
+    а не отдает молча страницы в порядке ключа.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = "Неверный курсор."
+    ordering_conflict_message = "Не сочетается с пагинацией по курсору: порядок задается ключом курсора."
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view):
+        self.request = request
+        conflicts = self.ordering_params(request, view)
+        if conflicts:
+            raise APIValidationError({name: [self.ordering_conflict_message] for name in conflicts})
+        self.ordering = tuple(view.cursor_ordering)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    @staticmethod
+    def ordering_params(request, view):
+        """Переданные параметры фильтров представления, которые меняют порядок выдачи."""
+        params = []
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter):
+                params.append(backend.ordering_param)
+            if getattr(backend, 'search_param', None):
+                params.append(backend.search_param)
+        return [name for name in dict.fromkeys(params) if request.query_params.get(name, '').strip()]
+
+    def after(self, position):
+        """
+        Условие "строго после position" для составного ключа.
+
+        Дополнительная нестрогая граница по первому полю дает индексу точку входа,
+        иначе PostgreSQL сканировал бы индекс с начала, отбрасывая строки фильтром.
+        """
+        condition, equal = Q(), {}
+        for (name, descending), value in zip(self.fields, position):
+            condition |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+        first_name, first_descending = self.fields[0]
+        return Q(**{f"{first_name}__{'lte' if first_descending else 'gte'}": position[0]}) & condition
+
+    def encode_cursor(self, obj):
+        # isoformat вместо DjangoJSONEncoder: тот отбрасывает микросекунды, и ключ перестал бы быть точным.
+        values = [getattr(obj, name) for name, _ in self.fields]
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value) for (name, _), value in zip(self.fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
 
 
 class CustomPagination(PageNumberPagination):
     """
     Кастомный класс пагинации для установки стандартного размера страницы
     и возможности его изменения клиентом.
+
+    Для представлений с атрибутом cursor_ordering доступен режим по ключу
+    (?pagination=cursor или переданный cursor), см. KeysetPagination.
     """
     page_size = 10  # Количество объектов на странице по умолчанию
     page_size_query_param = 'page_size'  # Параметр для изменения размера страницы (e.g., /api/nodes/?page_size=100)
     max_page_size = 1000  # Максимально допустимый размер страницы
+    mode_query_param = 'pagination'
+    keyset = None
+
+    def use_keyset(self, request, view):
+        if not getattr(view, 'cursor_ordering', None):
+            return False
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            return True
+        return KeysetPagination.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request, view):
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
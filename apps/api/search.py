@@ -0,0 +1,49 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from apps.network import search
+
+
+class PostgresSearchFilter(BaseFilterBackend):
+    """
+    Поиск ?search= по полям view.search_fields ({поле: вес}) в режиме ?search_mode=
+    (fts по умолчанию, prefix для автодополнения, fuzzy с допуском опечаток).
+
+    Без явного ?ordering= результаты упорядочены по релевантности, затем по прежнему
+    порядку, поэтому бэкенд должен стоять после OrderingFilter.
+    """
+    search_param = 'search'
+    mode_param = 'search_mode'
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+
+        mode = request.query_params.get(self.mode_param, search.FTS)
+        if mode not in search.MODES:
+            raise ValidationError({self.mode_param: [f"Допустимые режимы: {list(search.MODES)}."]})
+
+        queryset = search.search(queryset, view.search_fields, text, mode)
+        if self.ordering_param in request.query_params:
+            return queryset
+        return queryset.order_by(f'-{search.RANK_ANNOTATION}', *queryset.query.order_by)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Строка поиска.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.mode_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Режим поиска: fts (полнотекстовый), prefix (автодополнение), fuzzy (с опечатками).',
+                'schema': {'type': 'string', 'enum': list(search.MODES), 'default': search.FTS},
+            },
+        ]
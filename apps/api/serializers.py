@@ -1,18 +1,23 @@
 
 import logging
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from apps.network.models import NetworkNode, SupplierLink, Product
+from apps.network import debt
+from apps.network.hierarchy import creates_cycle
+from apps.network.models import DebtOperation, NetworkNode, SupplierLink, Product
+from .instrumentation import InstrumentedListSerializer, InstrumentedSerializerMixin
 
 # Получаем логгер с именем 'business'
 business_logger = logging.getLogger('business')
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для модели Product с логированием."""
     class Meta:
         model = Product
         fields = '__all__'
+        list_serializer_class = InstrumentedListSerializer
 
     def create(self, validated_data):
         product = super().create(validated_data)
@@ -33,11 +38,20 @@ class SupplierLinkSerializer(serializers.ModelSerializer):
         read_only_fields = ('debt',)
 
 
-class NetworkNodeSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели NetworkNode с логированием и обработкой бизнес-логики."""
+class NetworkNodeSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    """
+    Сериализатор для модели NetworkNode с логированием и обработкой бизнес-логики.
+
+    Если в контексте передан 'field_selection' (см. FieldSelectionQuerySerializer),
+    выводятся только выбранные поля, а вложенные объекты без expand заменяются их ID.
+    """
+    # Вложенные поля, которые выводятся объектами только по ?expand=, иначе - списком ID.
+    EXPANDABLE_FIELDS = ('products', 'suppliers_links')
+
     suppliers_links = SupplierLinkSerializer(source='client_links', many=True, read_only=True)
     products = ProductSerializer(many=True, read_only=True)
-    level = serializers.SerializerMethodField()
+    # Уровень хранится в БД и поддерживается сигналами, поэтому не требует запросов.
+    level = serializers.IntegerField(read_only=True)
 
     # Поле только для записи. Позволяет указать ID поставщика при создании/обновлении.
     supplier_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
@@ -47,11 +61,28 @@ class NetworkNodeSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'name', 'node_type', 'level', 'email', 'country', 'city',
             'street', 'house_number', 'products', 'suppliers_links', 'created_at',
+            'debt_to_suppliers', 'debt_from_clients', 'subtree_debt_to_suppliers', 'subtree_debt_from_clients',
             'supplier_id'  # Добавляем поле для возможности записи
         )
+        # Сводные суммы долга поддерживаются сигналами и через API не изменяются.
+        read_only_fields = (
+            'debt_to_suppliers', 'debt_from_clients', 'subtree_debt_to_suppliers', 'subtree_debt_from_clients',
+        )
+        list_serializer_class = InstrumentedListSerializer
 
-    def get_level(self, obj):
-        return obj.get_level()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selection = self.context.get('field_selection')
+        if selection is None:
+            return
+        for name in list(self.fields):
+            if name not in selection['fields']:
+                self.fields.pop(name)
+        for name in self.EXPANDABLE_FIELDS:
+            if name in self.fields and name not in selection['expand']:
+                source = self.fields[name].source
+                extra = {'source': source} if source != name else {}
+                self.fields[name] = serializers.PrimaryKeyRelatedField(many=True, read_only=True, **extra)
 
     def validate_supplier_id(self, value):
         """Проверяет, существует ли узел поставщика с указанным ID."""
@@ -67,35 +98,39 @@ class NetworkNodeSerializer(serializers.ModelSerializer):
         supplier_id = data.get('supplier_id')
         instance = self.instance  # Узел, который мы обновляем
 
-        if instance and supplier_id:
-            # Проверяем, не пытаемся ли мы сделать дочерний узел своим же поставщиком
-            current = NetworkNode.objects.get(pk=supplier_id)
-            while current:
-                if current == instance:
-                    # Логируем попытку нарушения бизнес-правила
-                    business_logger.warning(
-                        f"Попытка создать циклическую зависимость: "
-                        f"сделать узел '{instance.name}' (ID: {instance.id}) зависимым от своего дочернего узла "
-                        f"(ID: {supplier_id}). Операция отклонена."
-                    )
-                    raise serializers.ValidationError(
-                        {'supplier_id': "Невозможно установить циклическую зависимость."}
-                    )
-
-                # вверх по иерархии
-                # В модели может быть несколько поставщиков, берем первого
-                link = current.client_links.first()
-                current = link.supplier if link else None
+        # Проверяем, не пытаемся ли мы сделать дочерний узел своим же поставщиком.
+        # Таблица замыкания учитывает все цепочки, а не только первого поставщика.
+        if instance and supplier_id and creates_cycle(supplier_id, instance.id):
+            # Логируем попытку нарушения бизнес-правила
+            business_logger.warning(
+                f"Попытка создать циклическую зависимость: "
+                f"сделать узел '{instance.name}' (ID: {instance.id}) зависимым от своего дочернего узла "
+                f"(ID: {supplier_id}). Операция отклонена."
+            )
+            raise serializers.ValidationError(
+                {'supplier_id': "Невозможно установить циклическую зависимость."}
+            )
 
         return data
 
+    @staticmethod
+    def _link_supplier(supplier_id, node):
+        # Повторная проверка цикла под блокировкой графа (SupplierLink.save) ловит
+        # параллельную запись, прошедшую validate() одновременно с этой.
+        try:
+            SupplierLink.objects.create(supplier_id=supplier_id, client=node)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'supplier_id': error.messages})
+
     @transaction.atomic
     def create(self, validated_data):
         supplier_id = validated_data.pop('supplier_id', None)
         node = NetworkNode.objects.create(**validated_data)
 
         if supplier_id:
-            SupplierLink.objects.create(supplier_id=supplier_id, client=node)
+            self._link_supplier(supplier_id, node)
+            # Уровень и суммы долга пересчитаны сигналами в БД, обновляем значения в памяти.
+            node.refresh_from_db(fields=NetworkNode.MAINTAINED_FIELDS)
 
         business_logger.info(f"Через API создан новый узел сети: '{node.name}' (ID: {node.id}).")
         return node
@@ -112,7 +147,124 @@ class NetworkNodeSerializer(serializers.ModelSerializer):
             # Удаляем старую связь
             instance.client_links.all().delete()
             # Создаем новую связь
-            SupplierLink.objects.create(supplier_id=supplier_id, client=instance)
+            self._link_supplier(supplier_id, instance)
+            instance.refresh_from_db(fields=NetworkNode.MAINTAINED_FIELDS)
 
         business_logger.info(f"Через API обновлен узел сети: '{instance.name}' (ID: {instance.id}).")
         return instance
+
+
+class SupplyChainQuerySerializer(serializers.Serializer):
+    """Параметры запроса для эндпоинтов цепочки поставок (upstream/downstream)."""
+    SHAPE_FLAT = 'flat'
+    SHAPE_TREE = 'tree'
+    MAX_DEPTH = 50
+
+    depth = serializers.IntegerField(min_value=1, max_value=MAX_DEPTH, default=10)
+    node_type = serializers.CharField(required=False)
+    shape = serializers.ChoiceField(choices=(SHAPE_FLAT, SHAPE_TREE), default=SHAPE_FLAT)
+
+    def validate_node_type(self, value):
+        """Разбирает список типов узлов через запятую, например '1,2'."""
+        allowed = set(NetworkNode.NodeType.values)
+        try:
+            node_types = {int(item) for item in value.split(',') if item.strip()}
+        except ValueError:
+            raise serializers.ValidationError("Типы узлов должны быть числами, перечисленными через запятую.")
+        if not node_types <= allowed:
+            raise serializers.ValidationError(f"Допустимые типы узлов: {sorted(allowed)}.")
+        return sorted(node_types)
+
+
+class FieldSelectionQuerySerializer(serializers.Serializer):
+    """
+    Параметры ?fields= и ?expand= для списка и детального ответа узлов.
+
+    fields - поля ответа через запятую (по умолчанию все), expand - вложенные поля,
+    которые нужно вывести объектами. Поля из expand добавляются к fields автоматически.
+    """
+    fields = serializers.CharField(required=False)
+    expand = serializers.CharField(required=False)
+
+    @staticmethod
+    def _split(value):
+        return {item.strip() for item in value.split(',') if item.strip()}
+
+    def validate_fields(self, value):
+        readable = {name for name, field in NetworkNodeSerializer().fields.items() if not field.write_only}
+        fields = self._split(value)
+        if not fields or not fields <= readable:
+            raise serializers.ValidationError(f"Допустимые поля: {sorted(readable)}.")
+        return fields
+
+    def validate_expand(self, value):
+        expand = self._split(value)
+        if not expand <= set(NetworkNodeSerializer.EXPANDABLE_FIELDS):
+            raise serializers.ValidationError(f"Допустимые значения: {list(NetworkNodeSerializer.EXPANDABLE_FIELDS)}.")
+        return expand
+
+    def validate(self, data):
+        # Без fields (None) выводятся все поля, вложенные - целиком, как и раньше.
+        fields, expand = data.get('fields'), data.get('expand', set())
+        return {'fields': fields | expand if fields is not None else None, 'expand': expand}
+
+
+class BulkNodeRowSerializer(serializers.ModelSerializer):
+    """
+    Строка пакетной загрузки узла сети.
+
+    Email - ключ upsert, поэтому проверка уникальности отключена. Продукты передаются
+    списком ID и проверяются одним запросом для всего пакета, а не для каждой строки.
+    """
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    class Meta:
+        model = NetworkNode
+        fields = ('name', 'node_type', 'email', 'country', 'city', 'street', 'house_number', 'products')
+        extra_kwargs = {'email': {'validators': []}}
+
+
+class BulkLinkRowSerializer(serializers.Serializer):
+    """Строка пакетной загрузки связи: поставщик и клиент задаются email."""
+    supplier_email = serializers.EmailField()
+    client_email = serializers.EmailField()
+
+    def validate(self, data):
+        if data['supplier_email'] == data['client_email']:
+            raise serializers.ValidationError("Узел не может быть поставщиком самому себе.")
+        return data
+
+
+class DebtOperationSerializer(serializers.Serializer):
+    """
+    Параметры массовой операции с задолженностью.
+
+    Связи выбираются списком ID (links) и/или по узлам (supplier, client); условия
+    объединяются через И. percent обязателен для adjust, target - для transfer.
+    """
+    operation = serializers.ChoiceField(choices=DebtOperation.Kind.choices)
+    links = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    supplier = serializers.IntegerField(min_value=1, required=False)
+    client = serializers.IntegerField(min_value=1, required=False)
+    percent = serializers.DecimalField(
+        max_digits=6, decimal_places=2, min_value=debt.MIN_PERCENT, max_value=debt.MAX_PERCENT, required=False
+    )
+    target = serializers.PrimaryKeyRelatedField(queryset=SupplierLink.objects.all(), required=False)
+
+    def validate(self, data):
+        if not {'links', 'supplier', 'client'} & data.keys():
+            raise serializers.ValidationError("Укажите связи: links, supplier или client.")
+        if data['operation'] == DebtOperation.Kind.ADJUST and 'percent' not in data:
+            raise serializers.ValidationError({'percent': "Обязателен для операции adjust."})
+        if data['operation'] == DebtOperation.Kind.TRANSFER and 'target' not in data:
+            raise serializers.ValidationError({'target': "Обязателен для операции transfer."})
+        return data
+
+    def get_links(self):
+        links = SupplierLink.objects.all()
+        if 'links' in self.validated_data:
+            links = links.filter(pk__in=self.validated_data['links'])
+        for field in ('supplier', 'client'):
+            if field in self.validated_data:
+                links = links.filter(**{f'{field}_id': self.validated_data[field]})
+        return links
@@ -1,14 +1,32 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from apps.network.models import NetworkNode, Product
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from apps.api.bulk import BulkUpsert
+from apps.network.models import DebtOperation, NetworkNode, Product, SupplierLink
 from decimal import Decimal
+from config import routers
+from config.db import pool as pooling
+from health import profiling, prometheus
 
 # Получаем модель пользователя, которая используется в проекте
 User = get_user_model()
 
+# Токен внутренних эндпоинтов мониторинга (MONITORING_TOKEN) для тестов
+MONITORING_TOKEN = 'monitoring-secret'
+MONITORING_AUTH = {'HTTP_AUTHORIZATION': f"Bearer {MONITORING_TOKEN}"}
+
 
 class NetworkNodeAPITests(APITestCase):
     """
@@ -28,17 +46,28 @@ class NetworkNodeAPITests(APITestCase):
             username='inactive_user', password='password123', is_active=False
         )
 
-        # 2. Создаем объекты NetworkNode
-        cls.node1 = NetworkNode.objects.create(name="Завод", country="Россия", city="Москва", debt=Decimal("100.50"))
-        cls.node2 = NetworkNode.objects.create(name="Дистрибьютор", country="Россия", city="СПБ", supplier=cls.node1)
-        cls.node3 = NetworkNode.objects.create(name="Магазин", country="Беларусь", city="Минск", supplier=cls.node2)
+        # 2. Создаем цепочку узлов: node1 -> node2 -> node3
+        cls.node1 = cls.create_node("Завод", "Россия", "Москва", NetworkNode.NodeType.FACTORY)
+        cls.node2 = cls.create_node("Дистрибьютор", "Россия", "СПБ", supplier=cls.node1, debt=Decimal("100.50"))
+        cls.node3 = cls.create_node("Магазин", "Беларусь", "Минск", supplier=cls.node2)
 
         # 3. Определяем URL'ы
         cls.nodes_list_url = reverse('networknode-list')
         cls.node_detail_url = reverse('networknode-detail', args=[cls.node2.id])
 
+    @staticmethod
+    def create_node(name, country, city, node_type=NetworkNode.NodeType.RETAIL, supplier=None, debt=0):
+        node = NetworkNode.objects.create(
+            name=name, node_type=node_type, email=f"{city.lower()}@example.com",
+            country=country, city=city, street="Ленина", house_number="1",
+        )
+        if supplier is not None:
+            SupplierLink.objects.create(supplier=supplier, client=node, debt=debt)
+        return node
+
     def setUp(self):
         """Аутентифицируем клиента перед каждым тестом."""
+        cache.clear()
         self.client.force_authenticate(user=self.active_user)
 
     # --- Тесты прав доступа ---
@@ -72,10 +101,14 @@ class NetworkNodeAPITests(APITestCase):
 
     def test_create_node(self):
         """Тест: Успешное создание узла."""
-        data = {'name': 'Новый Ритейлер', 'country': 'Казахстан', 'city': 'Астана', 'supplier': self.node1.id}
+        data = {
+            'name': 'Новый Ритейлер', 'node_type': NetworkNode.NodeType.RETAIL, 'email': 'astana@example.com',
+            'country': 'Казахстан', 'city': 'Астана', 'street': 'Абая', 'house_number': '2',
+            'supplier_id': self.node1.id,
+        }
         response = self.client.post(self.nodes_list_url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertTrue(NetworkNode.objects.filter(name='Новый Ритейлер').exists())
+        self.assertEqual(NetworkNode.objects.get(name='Новый Ритейлер').level, 1)
 
     def test_update_node(self):
         """Тест: Успешное обновление узла."""
@@ -101,29 +134,24 @@ class NetworkNodeAPITests(APITestCase):
         self.assertEqual(response.data['results'][0]['name'], self.node3.name)
 
     def test_update_node_debt_is_ignored(self):
-        """Тест: Попытка обновления поля debt через API игнорируется."""
-        initial_debt = self.node1.debt
-        response = self.client.patch(reverse(
-            'networknode-detail',
-            args=[self.node1.id]),
-            {'debt': '9999.99'}, format='json'
-        )
+        """Тест: Попытка обновления суммы долга через API игнорируется."""
+        response = self.client.patch(self.node_detail_url, {'debt_to_suppliers': '9999.99'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.node1.refresh_from_db()
-        self.assertEqual(self.node1.debt, initial_debt)
+        self.node2.refresh_from_db()
+        self.assertEqual(self.node2.debt_to_suppliers, Decimal("100.50"))
 
     def test_cannot_set_self_as_supplier(self):
         """Интеграционный тест: Нельзя установить узел поставщиком самому себе."""
-        response = self.client.patch(self.node_detail_url, {'supplier': self.node2.id}, format='json')
+        response = self.client.patch(self.node_detail_url, {'supplier_id': self.node2.id}, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_cannot_create_circular_dependency(self):
         """Интеграционный тест: Нельзя создать циклическую зависимость."""
-        # node1 -> node2 -> node3. Пытаемся сделать node1.supplier = node3
+        # node1 -> node2 -> node3. Пытаемся сделать node3 поставщиком node1
         url = reverse('networknode-detail', args=[self.node1.id])
-        response = self.client.patch(url, {'supplier': self.node3.id}, format='json')
+        response = self.client.patch(url, {'supplier_id': self.node3.id}, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertIn('supplier', response.data)
+        self.assertIn('supplier_id', response.data)
 
 
 class ProductAPITests(APITestCase):
@@ -171,3 +199,1215 @@ class ProductAPITests(APITestCase):
         response = self.client.delete(self.product_detail_url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Product.objects.filter(id=self.product.id).exists())
+
+
+class NetworkNodeLevelAPITests(APITestCase):
+    """
+    Тесты фильтрации и сортировки узлов по сохраненному уровню иерархии.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='level_user', password='password123', is_active=True)
+        cls.nodes = []
+        supplier = None
+        for index in range(4):
+            node = NetworkNode.objects.create(
+                name=f"Узел {index}", node_type=NetworkNode.NodeType.RETAIL, email=f"level{index}@example.com",
+                country="Россия", city="Москва", street="Ленина", house_number=str(index)
+            )
+            if supplier:
+                SupplierLink.objects.create(supplier=supplier, client=node)
+            cls.nodes.append(node)
+            supplier = node
+        cls.nodes_list_url = reverse('networknode-list')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def test_filter_by_level(self):
+        """Тест: Фильтрация узлов по уровню."""
+        response = self.client.get(self.nodes_list_url, {'level__gte': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([node['level'] for node in response.data['results']], [2, 3])
+
+    def test_order_by_level(self):
+        """Тест: Сортировка узлов по уровню."""
+        response = self.client.get(self.nodes_list_url, {'ordering': '-level'})
+        self.assertEqual([node['level'] for node in response.data['results']], [3, 2, 1, 0])
+
+    def test_create_with_supplier_sets_level(self):
+        """Тест: Уровень нового узла вычисляется по поставщику."""
+        data = {
+            'name': 'Новый узел', 'node_type': NetworkNode.NodeType.ENTREPRENEUR, 'email': 'new@example.com',
+            'country': 'Россия', 'city': 'Казань', 'street': 'Баумана', 'house_number': '5',
+            'supplier_id': self.nodes[-1].id,
+        }
+        response = self.client.post(self.nodes_list_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['level'], 4)
+
+    def test_cannot_create_cycle_via_supplier_id(self):
+        """Тест: Нельзя сделать вершину цепочки клиентом ее потомка."""
+        url = reverse('networknode-detail', args=[self.nodes[0].id])
+        response = self.client.patch(url, {'supplier_id': self.nodes[3].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('supplier_id', response.data)
+
+    def test_list_query_count_does_not_grow_with_page(self):
+        """Тест: Количество запросов на страницу списка не зависит от числа узлов."""
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(self.nodes_list_url, {'page_size': 2})
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(self.nodes_list_url, {'page_size': 100})
+        self.assertEqual(len(small_page), len(full_page))
+
+
+class SupplyChainAPITests(APITestCase):
+    """
+    Тесты эндпоинтов транзитивной цепочки поставок (upstream/downstream).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='chain_user', password='password123', is_active=True)
+
+        def node(name, node_type):
+            return NetworkNode.objects.create(
+                name=name, node_type=node_type, email=f"{name.lower()}@example.com",
+                country="Россия", city="Москва", street="Ленина", house_number="1"
+            )
+
+        # factory -> (retail_a, retail_b) -> shop
+        cls.factory = node("Factory", NetworkNode.NodeType.FACTORY)
+        cls.retail_a = node("RetailA", NetworkNode.NodeType.RETAIL)
+        cls.retail_b = node("RetailB", NetworkNode.NodeType.RETAIL)
+        cls.shop = node("Shop", NetworkNode.NodeType.ENTREPRENEUR)
+        SupplierLink.objects.create(supplier=cls.factory, client=cls.retail_a, debt=Decimal("10.00"))
+        SupplierLink.objects.create(supplier=cls.factory, client=cls.retail_b, debt=Decimal("20.00"))
+        SupplierLink.objects.create(supplier=cls.retail_a, client=cls.shop, debt=Decimal("5.50"))
+        SupplierLink.objects.create(supplier=cls.retail_b, client=cls.shop)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def test_upstream_flat(self):
+        """Тест: Цепочка поставщиков возвращается плоским списком связей с глубиной."""
+        response = self.client.get(reverse('networknode-upstream', args=[self.shop.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        edges = {(edge['node']['name'], edge['depth'], edge['debt']) for edge in response.data['results']}
+        self.assertEqual(edges, {('RetailA', 1, '5.50'), ('RetailB', 1, '0.00'),
+                                 ('Factory', 2, '10.00'), ('Factory', 2, '20.00')})
+
+    def test_downstream_depth_limit(self):
+        """Тест: Глубина обхода ограничивается параметром depth."""
+        response = self.client.get(reverse('networknode-downstream', args=[self.factory.id]), {'depth': 1})
+        self.assertEqual({edge['node']['name'] for edge in response.data['results']}, {'RetailA', 'RetailB'})
+
+    def test_node_type_filter_stops_traversal(self):
+        """Тест: Обход не продолжается через узлы неразрешенных типов."""
+        response = self.client.get(
+            reverse('networknode-downstream', args=[self.factory.id]),
+            {'node_type': str(NetworkNode.NodeType.ENTREPRENEUR.value)}
+        )
+        self.assertEqual(response.data['results'], [])
+
+    def test_downstream_tree(self):
+        """Тест: Вложенное представление дерева клиентов."""
+        response = self.client.get(reverse('networknode-downstream', args=[self.factory.id]), {'shape': 'tree'})
+        tree = response.data['tree']
+        self.assertEqual(tree['name'], 'Factory')
+        self.assertEqual(sorted(child['name'] for child in tree['children']), ['RetailA', 'RetailB'])
+        self.assertEqual([grandchild['name'] for grandchild in tree['children'][0]['children']], ['Shop'])
+        # Магазин достижим через обе сети: второй раз он выводится ссылкой без поддерева.
+        repeated = tree['children'][1]['children'][0]
+        self.assertEqual((repeated['id'], repeated.get('ref'), 'children' in repeated), (self.shop.id, True, False))
+
+    def test_invalid_params(self):
+        """Тест: Некорректные параметры отклоняются с ошибкой 400."""
+        url = reverse('networknode-upstream', args=[self.shop.id])
+        self.assertEqual(self.client.get(url, {'depth': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'node_type': '7'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_query_for_chain(self):
+        """Тест: Цепочка вычисляется фиксированным числом запросов независимо от ее длины."""
+        with self.assertNumQueries(2):
+            self.client.get(reverse('networknode-downstream', args=[self.factory.id]))
+
+    def test_debt_rollups_filter_and_ordering(self):
+        """Тест: Сводные суммы долга доступны для фильтрации и сортировки в списке узлов."""
+        response = self.client.get(reverse('networknode-list'), {
+            'ordering': '-subtree_debt_to_suppliers', 'debt_from_clients__gte': '1',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(node['name'], node['subtree_debt_to_suppliers']) for node in response.data['results']],
+            [('Factory', '35.50'), ('RetailA', '15.50')]
+        )
+
+
+class BulkUpsertAPITests(APITestCase):
+    """
+    Тесты пакетной загрузки узлов и связей.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bulk_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Телевизор", model="TV-1", release_date="2024-01-01")
+        cls.factory = NetworkNode.objects.create(
+            name="Старый завод", node_type=NetworkNode.NodeType.FACTORY, email="factory@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="1"
+        )
+        cls.bulk_url = reverse('networknode-bulk')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def node_row(self, name, email, **extra):
+        return {
+            'name': name, 'node_type': NetworkNode.NodeType.RETAIL, 'email': email,
+            'country': 'Россия', 'city': 'Казань', 'street': 'Баумана', 'house_number': '2', **extra,
+        }
+
+    def test_upsert_nodes_and_links(self):
+        """Тест: Узлы создаются и обновляются по email, связи строят иерархию."""
+        response = self.client.post(self.bulk_url, {
+            'nodes': [
+                self.node_row('Завод', 'factory@example.com', node_type=NetworkNode.NodeType.FACTORY),
+                self.node_row('Сеть', 'retail@example.com', products=[self.product.id]),
+                self.node_row('ИП', 'shop@example.com', node_type=NetworkNode.NodeType.ENTREPRENEUR),
+            ],
+            'links': [
+                {'supplier_email': 'factory@example.com', 'client_email': 'retail@example.com'},
+                {'supplier_email': 'retail@example.com', 'client_email': 'shop@example.com'},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['nodes_created'], 2)
+        self.assertEqual(response.data['nodes_updated'], 1)
+        self.assertEqual(response.data['links_created'], 2)
+        self.assertEqual(response.data['errors'], [])
+
+        self.factory.refresh_from_db()
+        self.assertEqual(self.factory.name, 'Завод')
+        self.assertEqual(NetworkNode.objects.get(email='shop@example.com').level, 2)
+        retail = NetworkNode.objects.get(email='retail@example.com')
+        self.assertEqual(list(retail.products.values_list('id', flat=True)), [self.product.id])
+        self.assertEqual(
+            set(NetworkNode.objects.get(email='shop@example.com').get_upstream().values_list('name', flat=True)),
+            {'Завод', 'Сеть'}
+        )
+
+    def test_errors_are_reported_per_row(self):
+        """Тест: Ошибочные строки пропускаются и возвращаются с номером строки."""
+        response = self.client.post(self.bulk_url, {
+            'nodes': [
+                self.node_row('Сеть', 'retail@example.com'),
+                self.node_row('Дубликат', 'retail@example.com'),
+                self.node_row('Без продукта', 'bad@example.com', products=[999999]),
+                {'name': 'Без email'},
+            ],
+            'links': [
+                {'supplier_email': 'factory@example.com', 'client_email': 'missing@example.com'},
+            ],
+        }, format='json')
+        self.assertEqual(response.data['nodes_created'], 1)
+        self.assertEqual(
+            [(error['section'], error['index']) for error in response.data['errors']],
+            [('links', 0), ('nodes', 1), ('nodes', 2), ('nodes', 3)]
+        )
+        self.assertFalse(NetworkNode.objects.filter(email='bad@example.com').exists())
+
+    def test_cycle_is_rejected_for_whole_batch(self):
+        """Тест: Цикл, замыкаемый несколькими связями пакета, отклоняется."""
+        response = self.client.post(self.bulk_url, {
+            'nodes': [self.node_row('A', 'a@example.com'), self.node_row('B', 'b@example.com')],
+            'links': [
+                {'supplier_email': 'factory@example.com', 'client_email': 'a@example.com'},
+                {'supplier_email': 'a@example.com', 'client_email': 'b@example.com'},
+                {'supplier_email': 'b@example.com', 'client_email': 'factory@example.com'},
+                {'supplier_email': 'factory@example.com', 'client_email': 'a@example.com'},
+            ],
+        }, format='json')
+        self.assertEqual(response.data['links_created'], 2)
+        self.assertEqual(response.data['links_existing'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2])
+        self.assertEqual(NetworkNode.objects.get(email='b@example.com').level, 2)
+
+    def test_cycle_with_existing_links_is_rejected(self):
+        """Тест: Цикл через уже существующие связи находится по таблице замыкания."""
+        shop = NetworkNode.objects.create(
+            name="Магазин", node_type=NetworkNode.NodeType.RETAIL, email="shop@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="2"
+        )
+        SupplierLink.objects.create(supplier=self.factory, client=shop)
+        response = self.client.post(self.bulk_url, {
+            'links': [{'supplier_email': 'shop@example.com', 'client_email': 'factory@example.com'}],
+        }, format='json')
+        self.assertEqual(response.data['links_created'], 0)
+        self.assertEqual(len(response.data['errors']), 1)
+
+    def test_link_queries_do_not_grow_with_batch(self):
+        """Тест: Замыкание обновляется одним набором запросов на пакет, а не на каждую связь."""
+        def post_links(prefix, count):
+            nodes = [self.node_row(f'{prefix}{i}', f'{prefix}{i}@example.com') for i in range(count)]
+            self.client.post(self.bulk_url, {'nodes': nodes}, format='json')
+            links = [{'supplier_email': 'factory@example.com', 'client_email': row['email']} for row in nodes]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.bulk_url, {'links': links}, format='json')
+            self.assertEqual(response.data['links_created'], count)
+            return len(queries)
+
+        self.assertEqual(post_links('small', 2), post_links('large', 12))
+        self.assertEqual(NetworkNode.objects.get(email='large11@example.com').level, 1)
+
+    def test_cycle_from_concurrent_write_is_rejected(self):
+        """Тест: Связь, ставшая циклической после проверки пакета, отклоняется при записи чанка."""
+        shop = NetworkNode.objects.create(
+            name="Магазин", node_type=NetworkNode.NodeType.RETAIL, email="shop@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="2"
+        )
+        upsert = BulkUpsert(chunk_size=10)
+        accepted = upsert._validate_links([
+            {'supplier_email': 'shop@example.com', 'client_email': 'factory@example.com'},
+        ])
+        self.assertEqual(len(accepted), 1)
+        # Параллельный запрос успел создать обратную связь.
+        SupplierLink.objects.create(supplier=self.factory, client=shop)
+        upsert._save_links(accepted)
+        self.assertEqual(upsert.stats['links_created'], 0)
+        self.assertEqual(upsert.errors[0]['errors'], {'non_field_errors': ["Связь создает циклическую зависимость."]})
+        self.assertFalse(SupplierLink.objects.filter(supplier=shop).exists())
+
+    def test_non_object_body(self):
+        """Тест: Тело запроса не в виде объекта отклоняется с 400."""
+        response = self.client.post(self.bulk_url, [{'nodes': []}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_row_limit(self):
+        """Тест: Слишком большой пакет отклоняется целиком."""
+        with self.settings(BULK_UPSERT_MAX_ROWS=1):
+            response = self.client.post(self.bulk_url, {
+                'nodes': [self.node_row('A', 'a@example.com'), self.node_row('B', 'b@example.com')],
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NetworkExportAPITests(APITestCase):
+    """
+    Тесты потоковой выгрузки узлов сети.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='export_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Ноутбук", model="NB-1", release_date="2024-01-01")
+        cls.factory = NetworkNode.objects.create(
+            name="Завод", node_type=NetworkNode.NodeType.FACTORY, email="factory@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="1"
+        )
+        cls.factory.products.add(cls.product)
+        cls.shop = NetworkNode.objects.create(
+            name="Магазин", node_type=NetworkNode.NodeType.RETAIL, email="shop@example.com",
+            country="Беларусь", city="Минск", street="Немиги", house_number="3"
+        )
+        SupplierLink.objects.create(supplier=cls.factory, client=cls.shop, debt=Decimal("12.50"))
+        cls.export_url = reverse('networknode-export')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_export(self):
+        """Тест: Выгрузка NDJSON содержит по одной строке на узел с продуктами и поставщиками."""
+        response = self.client.get(self.export_url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        records = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([record['name'] for record in records], ['Завод', 'Магазин'])
+        self.assertEqual(records[0]['products'], [self.product.id])
+        self.assertEqual(records[1]['suppliers'], [{'supplier_id': self.factory.id, 'debt': '12.50'}])
+        self.assertEqual(records[1]['level'], 1)
+
+    def test_csv_export_respects_filters(self):
+        """Тест: Выгрузка CSV учитывает фильтры списка узлов."""
+        response = self.client.get(self.export_url, {'export_format': 'csv', 'country': 'Беларусь'})
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['email'], 'shop@example.com')
+        self.assertEqual(rows[0]['suppliers'], f"{self.factory.id}:12.50")
+
+    def test_invalid_format(self):
+        """Тест: Неизвестный формат отклоняется с ошибкой 400."""
+        response = self.client.get(self.export_url, {'export_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class KeysetPaginationAPITests(APITestCase):
+    """
+    Тесты постраничного вывода по курсору (keyset).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cursor_user', password='password123', is_active=True)
+        cls.nodes = [
+            NetworkNode.objects.create(
+                name=f"Узел {index}", node_type=NetworkNode.NodeType.RETAIL, email=f"cursor{index}@example.com",
+                country="Россия", city="Москва", street="Ленина", house_number=str(index)
+            )
+            for index in range(7)
+        ]
+        for index in range(3):
+            Product.objects.create(name=f"Продукт {index}", model="M", release_date="2024-01-01")
+        cls.nodes_list_url = reverse('networknode-list')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url, params):
+        pages, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in response.data['results']])
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_walks_nodes_newest_first(self):
+        """Тест: Курсор проходит все узлы от новых к старым без пропусков и повторов."""
+        pages = self.walk(self.nodes_list_url, {'pagination': 'cursor', 'page_size': 3})
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), [node.id for node in reversed(self.nodes)])
+
+    def test_count_is_optional(self):
+        """Тест: Общее количество не считается без явного запроса."""
+        response = self.client.get(self.nodes_list_url, {'pagination': 'cursor'})
+        self.assertNotIn('count', response.data)
+        response = self.client.get(self.nodes_list_url, {'pagination': 'cursor', 'count': 'true'})
+        self.assertEqual(response.data['count'], 7)
+
+    def test_deep_page_costs_same_as_first(self):
+        """Тест: Следующие страницы выполняют столько же запросов, сколько первая."""
+        with CaptureQueriesContext(connection) as first_page:
+            first = self.client.get(self.nodes_list_url, {'pagination': 'cursor', 'page_size': 2})
+        with CaptureQueriesContext(connection) as next_page:
+            self.client.get(first.data['next'])
+        self.assertEqual(len(first_page), len(next_page))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in next_page.captured_queries))
+
+    def test_invalid_cursor(self):
+        """Тест: Поврежденный курсор отклоняется с ошибкой 404."""
+        response = self.client.get(self.nodes_list_url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_ordering_with_cursor_rejected(self):
+        """Тест: Сортировка вместе с курсором отклоняется с ошибкой 400."""
+        response = self.client.get(self.nodes_list_url, {'pagination': 'cursor', 'ordering': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', response.data)
+
+    def test_search_with_cursor_rejected(self):
+        """Тест: Поиск с сортировкой по релевантности вместе с курсором отклоняется с ошибкой 400."""
+        for url in (self.nodes_list_url, reverse('product-list')):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'pagination': 'cursor', 'search': 'завод'})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('search', response.data)
+
+    def test_products_cursor_by_id(self):
+        """Тест: Продукты выводятся по курсору в порядке ID."""
+        pages = self.walk(reverse('product-list'), {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(sum(pages, []), list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_page_number_mode_is_default(self):
+        """Тест: Без параметров сохраняется обычная постраничная пагинация."""
+        response = self.client.get(self.nodes_list_url)
+        self.assertEqual(response.data['count'], 7)
+        self.assertIn('previous', response.data)
+
+
+class ResponseCacheAPITests(APITestCase):
+    """
+    Тесты кэша ответов по узлам сети и его инвалидации.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cache_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Планшет", model="TB-1", release_date="2024-01-01")
+        cls.factory = NetworkNode.objects.create(
+            name="Завод", node_type=NetworkNode.NodeType.FACTORY, email="factory@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="1"
+        )
+        cls.retail = NetworkNode.objects.create(
+            name="Сеть", node_type=NetworkNode.NodeType.RETAIL, email="retail@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="2"
+        )
+        cls.shop = NetworkNode.objects.create(
+            name="ИП", node_type=NetworkNode.NodeType.ENTREPRENEUR, email="shop@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="3"
+        )
+        SupplierLink.objects.create(supplier=cls.factory, client=cls.retail, debt=Decimal("10.00"))
+        cls.shop_link = SupplierLink.objects.create(supplier=cls.retail, client=cls.shop, debt=Decimal("5.00"))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def detail(self, node):
+        return self.client.get(reverse('networknode-detail', args=[node.id]))
+
+    def test_repeated_detail_is_served_from_cache(self):
+        """Тест: Повторный запрос отдается из кэша; к БД остается только запрос версии для ETag."""
+        self.assertEqual(self.detail(self.shop)['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            response = self.detail(self.shop)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['name'], 'ИП')
+
+    def test_link_debt_change_invalidates_node_and_ancestors(self):
+        """Тест: Изменение долга инвалидирует узлы связи и предков, чьи суммы изменились."""
+        self.detail(self.factory)
+        self.detail(self.shop)
+        with self.captureOnCommitCallbacks(execute=True):
+            link = SupplierLink.objects.get(pk=self.shop_link.pk)
+            link.debt = Decimal("7.00")
+            link.save()
+        response = self.detail(self.factory)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['subtree_debt_from_clients'], '17.00')
+        self.assertEqual(self.detail(self.shop).data['suppliers_links'][0]['debt'], '7.00')
+
+    def test_unrelated_node_stays_cached(self):
+        """Тест: Запись в другой узел не инвалидирует детальный ответ, но инвалидирует списки."""
+        self.detail(self.factory)
+        self.client.get(reverse('networknode-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.products.add(self.product)
+        self.assertEqual(self.detail(self.factory)['X-Cache'], 'HIT')
+        self.assertEqual(self.detail(self.shop)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('networknode-list'))['X-Cache'], 'MISS')
+
+    def test_product_change_invalidates_nodes_with_product(self):
+        """Тест: Изменение продукта инвалидирует узлы, в ответы которых он вложен."""
+        self.retail.products.add(self.product)
+        self.detail(self.retail)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Новый планшет"
+            self.product.save()
+        response = self.detail(self.retail)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['products'][0]['name'], "Новый планшет")
+
+    def test_admin_clear_debt_invalidates(self):
+        """Тест: Массовое действие администратора инвалидирует затронутые узлы."""
+        self.detail(self.shop)
+        admin_user = User.objects.create_superuser(username='cache_admin', password='password123')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:network_supplierlink_changelist'), {
+                'action': 'clear_debt', '_selected_action': [self.shop_link.pk],
+            })
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.detail(self.shop).data['suppliers_links'][0]['debt'], '0.00')
+
+    @override_settings(MONITORING_TOKEN=MONITORING_TOKEN)
+    def test_stats_endpoint(self):
+        """Тест: Счетчики попаданий и промахов доступны в мониторинге."""
+        self.detail(self.shop)
+        self.detail(self.shop)
+        response = self.client.get(reverse('cache-stats'), **MONITORING_AUTH)
+        self.assertEqual((response.json()['hits'], response.json()['misses']), (1, 1))
+
+
+class ConditionalGetAPITests(APITestCase):
+    """
+    Тесты ETag и условных GET-запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etag_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Смартфон", model="SP-1", release_date="2024-01-01")
+        cls.factory = NetworkNode.objects.create(
+            name="Завод", node_type=NetworkNode.NodeType.FACTORY, email="factory@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="1"
+        )
+        cls.shop = NetworkNode.objects.create(
+            name="Магазин", node_type=NetworkNode.NodeType.RETAIL, email="shop@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="2"
+        )
+        cls.link = SupplierLink.objects.create(supplier=cls.factory, client=cls.shop, debt=Decimal("3.00"))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def detail_url(self, node):
+        return reverse('networknode-detail', args=[node.id])
+
+    def test_not_modified_without_serialization(self):
+        """Тест: Совпадающий ETag дает 304 одним запросом версии, без выборки связей и продуктов."""
+        response = self.client.get(self.detail_url(self.shop))
+        self.assertTrue(response['ETag'])
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.detail_url(self.shop), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_etag_changes_with_nested_data(self):
+        """Тест: ETag узла меняется при изменении его связей и продуктов."""
+        etags = [self.client.get(self.detail_url(self.shop))['ETag']]
+        link = SupplierLink.objects.get(pk=self.link.pk)
+        link.debt = Decimal("4.00")
+        link.save()
+        etags.append(self.client.get(self.detail_url(self.shop))['ETag'])
+        self.shop.products.add(self.product)
+        etags.append(self.client.get(self.detail_url(self.shop))['ETag'])
+        self.product.model = "SP-2"
+        self.product.save()
+        etags.append(self.client.get(self.detail_url(self.shop))['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_collection_etag(self):
+        """Тест: ETag списка учитывает фильтры и меняется при изменении любого узла выборки."""
+        url = reverse('networknode-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(url, {'city': 'Москва'})['ETag'], etag)
+
+        node = NetworkNode.objects.get(pk=self.factory.pk)
+        node.name = "Новый завод"
+        node.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_collection_etag_without_aggregate(self):
+        """Тест: ETag списка берется из поколений: кэшированная страница и 304 не обращаются к БД."""
+        url = reverse('networknode-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        # Порядок параметров на ETag не влияет.
+        self.assertEqual(
+            self.client.get(f'{url}?city=Москва&country=Россия')['ETag'],
+            self.client.get(f'{url}?country=Россия&city=Москва')['ETag'],
+        )
+
+    def test_cursor_page_without_aggregate(self):
+        """Тест: Страница по курсору не считает строки всей выборки."""
+        url = reverse('networknode-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'pagination': 'cursor', 'page_size': 1})
+        self.assertTrue(response['ETag'])
+        self.assertFalse(any(
+            aggregate in query['sql'] for query in queries.captured_queries for aggregate in ('COUNT(', 'SUM(')
+        ))
+
+    def test_product_list_etag_changes(self):
+        """Тест: ETag списка продуктов меняется при изменении продуктов."""
+        url = reverse('product-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        Product.objects.create(name="Планшет", model="TB-1", release_date="2024-01-01")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_field_selection_and_format(self):
+        """Тест: ETag объекта различается для выборки полей и формата ответа, ответ с Vary: Accept."""
+        url = self.detail_url(self.shop)
+        response = self.client.get(url)
+        self.assertIn('Accept', response['Vary'])
+        etags = {
+            response['ETag'],
+            self.client.get(url, {'fields': 'id,name'})['ETag'],
+            self.client.get(url, {'expand': 'products'})['ETag'],
+            self.client.get(url, HTTP_ACCEPT='text/html')['ETag'],
+        }
+        self.assertEqual(len(etags), 4)
+        self.assertEqual(
+            self.client.get(url, {'fields': 'id,name'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            status.HTTP_200_OK
+        )
+
+    @override_settings(CACHE_GENERATIONS_SHARED=False)
+    def test_no_list_etag_without_shared_cache(self):
+        """Тест: Без общего кэша поколений ETag списка не выдается (токены воркера могут устареть)."""
+        response = self.client.get(reverse('networknode-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+
+    def test_product_etag(self):
+        """Тест: Продукты также поддерживают условные запросы."""
+        url = reverse('product-detail', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_missing_node(self):
+        """Тест: Для несуществующего узла возвращается 404 без ETag."""
+        response = self.client.get(reverse('networknode-detail', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+
+class FieldSelectionAPITests(APITestCase):
+    """
+    Тесты параметров ?fields= и ?expand= у узлов сети.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='fields_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Камера", model="CM-1", release_date="2024-01-01")
+        cls.factory = NetworkNode.objects.create(
+            name="Завод", node_type=NetworkNode.NodeType.FACTORY, email="factory@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="1"
+        )
+        cls.shop = NetworkNode.objects.create(
+            name="Магазин", node_type=NetworkNode.NodeType.RETAIL, email="shop@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="2"
+        )
+        cls.shop.products.add(cls.product)
+        cls.link = SupplierLink.objects.create(supplier=cls.factory, client=cls.shop, debt=Decimal("8.00"))
+        cls.nodes_list_url = reverse('networknode-list')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_sparse_fields_trim_payload_and_queries(self):
+        """Тест: Только запрошенные поля, без подгрузки продуктов и связей."""
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(self.nodes_list_url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.get(self.nodes_list_url, {'fields': 'id,name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'id': self.factory.id, 'name': 'Завод'})
+        self.assertEqual(len(full) - len(sparse), 2)
+        self.assertNotIn('email', sparse.captured_queries[-1]['sql'])
+
+    def test_nested_fields_without_expand_are_ids(self):
+        """Тест: Вложенные поля без expand выводятся списком ID."""
+        response = self.client.get(
+            reverse('networknode-detail', args=[self.shop.id]), {'fields': 'id,products,suppliers_links'}
+        )
+        self.assertEqual(response.data, {
+            'id': self.shop.id, 'products': [self.product.id], 'suppliers_links': [self.link.id],
+        })
+
+    def test_expand_includes_nested_objects(self):
+        """Тест: expand выводит вложенные объекты и добавляет поле к выборке."""
+        response = self.client.get(
+            reverse('networknode-detail', args=[self.shop.id]), {'fields': 'name', 'expand': 'suppliers_links'}
+        )
+        self.assertEqual(response.data['name'], 'Магазин')
+        self.assertEqual(response.data['suppliers_links'][0]['debt'], '8.00')
+        self.assertNotIn('products', response.data)
+
+    def test_full_response_by_default(self):
+        """Тест: Без параметров ответ не меняется."""
+        response = self.client.get(reverse('networknode-detail', args=[self.shop.id]))
+        self.assertEqual(response.data['products'][0]['name'], 'Камера')
+        self.assertEqual(response.data['suppliers_links'][0]['supplier'], self.factory.id)
+
+    def test_unknown_fields_are_rejected(self):
+        """Тест: Неизвестные поля и значения expand отклоняются с ошибкой 400."""
+        self.assertEqual(
+            self.client.get(self.nodes_list_url, {'fields': 'id,password'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(self.nodes_list_url, {'fields': 'id', 'expand': 'clients'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+
+@override_settings(MONITORING_TOKEN=MONITORING_TOKEN)
+class QueryProfilerAPITests(APITestCase):
+    """
+    Тесты профилирования запросов к БД в InstrumentationMiddleware.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='profiler_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Роутер", model="RT-1", release_date="2024-01-01")
+
+    def setUp(self):
+        cache.clear()
+        profiling.reset()
+        self.client.force_authenticate(user=self.user)
+
+    def test_queries_counted_without_debug(self):
+        """Тест: Запросы считаются по представлениям при DEBUG=False."""
+        self.client.get(reverse('product-detail', args=[self.product.id]))
+        stats = self.client.get(reverse('query-profile'), **MONITORING_AUTH).json()['views']['GET product-detail']
+        self.assertEqual(stats['requests'], 1)
+        # Версия для ETag и сам объект.
+        self.assertEqual(stats['max_queries'], 2)
+        self.assertEqual(stats['slow_requests'], 0)
+
+    @override_settings(QUERY_PROFILER_SLOW_MS=0)
+    def test_slow_requests_keep_fingerprints(self):
+        """Тест: Для медленных запросов сохраняются нормализованные отпечатки SQL."""
+        self.client.get(reverse('product-detail', args=[self.product.id]))
+        stats = self.client.get(reverse('query-profile'), **MONITORING_AUTH).json()['views']['GET product-detail']
+        self.assertEqual(stats['slow_requests'], 1)
+        self.assertTrue(any('network_product' in item['sql'] for item in stats['slow_fingerprints']))
+        self.assertFalse(any('%s' in item['sql'] for item in stats['slow_fingerprints']))
+        self.assertEqual(stats['slow_samples'][0]['path'], reverse('product-detail', args=[self.product.id]))
+
+    def test_prometheus_exporter(self):
+        """Тест: Гистограммы времени и числа запросов к БД в формате Prometheus."""
+        self.client.get(reverse('product-detail', args=[self.product.id]))
+        response = self.client.get(reverse('metrics'), **MONITORING_AUTH)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",status="200",view="product-detail"}', body
+        )
+        self.assertIn('http_request_db_queries_bucket{le="2.0",method="GET",view="product-detail"}', body)
+
+    def test_server_timing_breakdown(self):
+        """Тест: Заголовок Server-Timing содержит общее время и фазы db, auth, serialize."""
+        response = self.client.get(reverse('product-list'))
+        timing = {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(timing), {'total', 'db', 'auth', 'serialize'})
+        self.assertIn('desc="', timing['db'])
+
+    def test_fingerprint_normalizes_literals(self):
+        """Тест: Литералы и списки IN сворачиваются в один отпечаток."""
+        self.assertEqual(
+            profiling.fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'  AND n > 10"),
+            profiling.fingerprint("SELECT * FROM t WHERE id IN (%s) AND name = 'yy' AND n > 2"),
+        )
+
+    def test_missing_multiprocess_dir_is_created(self):
+        """Тест: Отсутствующий каталог PROMETHEUS_MULTIPROC_DIR создается (runserver, manage.py)."""
+        with tempfile.TemporaryDirectory() as root:
+            directory = os.path.join(root, 'prometheus')
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                self.assertEqual(prometheus._multiprocess_dir(), directory)
+            self.assertTrue(os.path.isdir(directory))
+
+    def test_unusable_multiprocess_dir_falls_back_to_process_metrics(self):
+        """Тест: Если каталог создать нельзя, метрики пишутся в память процесса."""
+        with tempfile.NamedTemporaryFile() as file:
+            directory = os.path.join(file.name, 'prometheus')
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}), \
+                    mock.patch.object(prometheus.values, 'ValueClass', None):
+                self.assertIsNone(prometheus._multiprocess_dir())
+                self.assertIs(prometheus.values.ValueClass, prometheus.values.MutexValue)
+
+
+@override_settings(MONITORING_TOKEN=MONITORING_TOKEN)
+class BusinessMetricsTests(APITestCase):
+    """
+    Тесты кэшируемых бизнес-метрик мониторинга.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='metrics_user', password='password123', is_active=False)
+        cls.factory = NetworkNode.objects.create(
+            name="Завод", node_type=NetworkNode.NodeType.FACTORY, email="factory@example.com",
+            country="Россия", city="Москва", street="Ленина", house_number="1"
+        )
+        cls.shop = NetworkNode.objects.create(
+            name="Магазин", node_type=NetworkNode.NodeType.RETAIL, email="shop@example.com",
+            country="Россия", city="Казань", street="Ленина", house_number="2"
+        )
+        SupplierLink.objects.create(supplier=cls.factory, client=cls.shop, debt=Decimal("12.50"))
+        cls.url = reverse('business-metrics')
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(**MONITORING_AUTH)
+
+    def test_breakdowns(self):
+        """Тест: Срезы по типам узлов, городам, уровням и общий долг."""
+        business = self.client.get(self.url).json()['business']
+        self.assertEqual(business['users'], {'total': 1, 'active': 0})
+        self.assertEqual(
+            business['network_nodes'],
+            {'total': 2, 'factories': 1, 'retailers': 1, 'entrepreneurs': 0, 'max_level': 1}
+        )
+        self.assertIn({'country': 'Россия', 'city': 'Казань', 'nodes': 1}, business['nodes_by_location'])
+        self.assertEqual(business['links']['total_debt'], '12.50')
+        self.assertEqual(business['links']['by_client_level'], [{'level': 1, 'links': 1, 'debt': '12.50'}])
+
+    def test_cached_between_scrapes(self):
+        """Тест: Повторный опрос не обращается к БД."""
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        self.assertEqual(len(first), 6)
+        NetworkNode.objects.filter(pk=self.shop.pk).update(node_type=NetworkNode.NodeType.ENTREPRENEUR)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url)
+        self.assertEqual(len(second), 0)
+        self.assertEqual(response.json()['business']['network_nodes']['retailers'], 1)
+
+    @override_settings(BUSINESS_METRICS_CACHE_TIMEOUT=0)
+    def test_stale_value_served_while_recomputing(self):
+        """Тест: Пока другой процесс пересчитывает метрики, отдаются прежние значения."""
+        self.client.get(self.url)
+        cache.add('health:business-metrics:lock', 1, 30)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(captured), 0)
+        cache.delete('health:business-metrics:lock')
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.url)
+        self.assertEqual(len(captured), 6)
+
+    def test_first_computation_in_progress(self):
+        """Тест: Пока идет первый расчет, ответ 503 сразу, без ожидания и запросов к БД."""
+        cache.add('health:business-metrics:lock', 1, 30)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(len(captured), 0)
+
+
+@override_settings(MONITORING_TOKEN=MONITORING_TOKEN)
+class DatabaseConnectionsTests(APITestCase):
+    """
+    Тесты бэкенда config.db: пул соединений процесса и проверка постоянных соединений.
+    """
+
+    def tearDown(self):
+        pooling.close_pools()
+
+    def make_wrapper(self, **overrides):
+        # Отдельное соединение под псевдонимом default: обработчики connection_created
+        # (django.contrib.postgres) обращаются к соединению по псевдониму.
+        settings_dict = {**connections['default'].settings_dict, **overrides}
+        return type(connections['default'])(settings_dict, alias='default')
+
+    def make_pool(self, **options):
+        params = connection.get_connection_params()
+        return pooling.ConnectionPool(lambda: pooling.connect(params), **options)
+
+    def test_pool_reuses_connections(self):
+        """Тест: Возвращенное соединение выдается повторно без нового подключения."""
+        pool = self.make_pool(max_size=2)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        stats = pool.stats()
+        self.assertEqual((stats['connects'], stats['checkouts'], stats['in_use']), (1, 2, 1))
+        pool.release(first)
+        pool.close()
+
+    def test_pool_rolls_back_open_transaction(self):
+        """Тест: Незавершенная транзакция откатывается при возврате в пул."""
+        pool = self.make_pool(max_size=1)
+        conn = pool.acquire()
+        conn.cursor().execute('SELECT 1')
+        pool.release(conn)
+        self.assertEqual(conn.get_transaction_status(), 0)
+        pool.close()
+
+    def test_pool_wait_times_out(self):
+        """Тест: При исчерпании пула ожидание ограничено таймаутом."""
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(pooling.PoolTimeout):
+            pool.acquire()
+        stats = pool.stats()
+        self.assertEqual((stats['timeouts'], stats['saturation']), (1, 1.0))
+        pool.release(conn)
+        pool.close()
+
+    def test_backend_returns_connection_to_pool(self):
+        """Тест: Закрытие соединения Django возвращает его в пул."""
+        options = {'pool': {'max_size': 2}}
+        for _ in range(2):
+            wrapper = self.make_wrapper(CONN_MAX_AGE=0, OPTIONS=options)
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close()
+        [stats] = pooling.pool_stats('default')
+        self.assertEqual((stats['connects'], stats['checkouts'], stats['idle']), (1, 2, 1))
+
+    def test_pool_requires_zero_conn_max_age(self):
+        """Тест: Пул нельзя сочетать с постоянными соединениями."""
+        wrapper = self.make_wrapper(CONN_MAX_AGE=60, OPTIONS={'pool': {'max_size': 2}})
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.ensure_connection()
+
+    def test_health_check_replaces_broken_connection(self):
+        """Тест: Разорванное постоянное соединение заменяется в начале следующего запроса."""
+        wrapper = self.make_wrapper(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True, OPTIONS={})
+        wrapper.ensure_connection()
+        wrapper.connection.close()
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        wrapper.close()
+
+    def test_endpoint_reports_pools(self):
+        """Тест: Эндпоинт показывает настройки соединений и заполненность пулов."""
+        wrapper = self.make_wrapper(CONN_MAX_AGE=0, OPTIONS={'pool': {'max_size': 4}})
+        wrapper.ensure_connection()
+        data = self.client.get(reverse('database-connections'), **MONITORING_AUTH).json()['databases']['default']
+        self.assertEqual(data['engine'], 'config.db')
+        [stats] = data['pools']
+        self.assertEqual((stats['in_use'], stats['max_size'], stats['saturation']), (1, 4, 0.25))
+        self.assertFalse(data['saturated'])
+        wrapper.close()
+
+
+class MonitoringAccessTests(APITestCase):
+    """
+    Тесты доступа к внутренним эндпоинтам мониторинга.
+    """
+
+    endpoints = ('cache-stats', 'query-profile', 'database-connections', 'metrics', 'business-metrics')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='monitoring_staff', password='password123', is_staff=True)
+        cls.user = User.objects.create_user(username='monitoring_user', password='password123')
+
+    def assertStatuses(self, expected, **headers):
+        for name in self.endpoints:
+            self.assertEqual(self.client.get(reverse(name), **headers).status_code, expected, name)
+
+    def test_anonymous_and_regular_users_denied(self):
+        """Тест: Без сессии сотрудника и без токена эндпоинты недоступны."""
+        self.assertStatuses(status.HTTP_403_FORBIDDEN)
+        self.client.force_login(self.user)
+        self.assertStatuses(status.HTTP_403_FORBIDDEN)
+
+    def test_staff_session(self):
+        """Тест: Сотрудник видит мониторинг по сессии (например, после входа в админку)."""
+        self.client.force_login(self.staff)
+        self.assertStatuses(status.HTTP_200_OK)
+
+    @override_settings(MONITORING_TOKEN=MONITORING_TOKEN)
+    def test_bearer_token(self):
+        """Тест: Доступ по токену MONITORING_TOKEN, неверный токен отклоняется."""
+        self.assertStatuses(status.HTTP_200_OK, **MONITORING_AUTH)
+        self.assertStatuses(status.HTTP_403_FORBIDDEN, HTTP_AUTHORIZATION='Bearer wrong')
+
+    def test_health_probes_stay_open(self):
+        """Тест: Пробы для балансировщика доступны без аутентификации."""
+        self.assertEqual(self.client.get(reverse('liveness-check')).status_code, status.HTTP_200_OK)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], MONITORING_TOKEN=MONITORING_TOKEN)
+class ReplicaRoutingTests(APITestCase):
+    """
+    Тесты маршрутизации чтений на реплики. Реплика - отдельное соединение с той же тестовой БД:
+    оно не видит незафиксированных данных теста, поэтому пустой ответ означает чтение с реплики.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.databases['replica'] = {**connections.databases['default'], 'OPTIONS': {}}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='replica_user', password='password123', is_active=True)
+        cls.product = Product.objects.create(name="Роутер", model="RT-1", release_date="2024-01-01")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def test_safe_api_reads_use_replica(self):
+        """Тест: GET к API читает с реплики."""
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_business_metrics_read_from_replica(self):
+        """Тест: Бизнес-метрики считаются на реплике."""
+        business = self.client.get(reverse('business-metrics'), **MONITORING_AUTH).json()['business']
+        self.assertEqual(business['products'], {'total': 0})
+
+    def test_reads_after_write_are_pinned_to_primary(self):
+        """Тест: После записи клиент читает с основной БД и видит свои изменения."""
+        data = {'name': "Модем", 'model': "MD-1", 'release_date': "2024-02-01"}
+        response = self.client.post(reverse('product-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('db_pin', response.cookies)
+        names = [item['name'] for item in self.client.get(reverse('product-list')).data['results']]
+        self.assertCountEqual(names, ["Роутер", "Модем"])
+
+    def test_replica_reads_not_cached(self):
+        """Тест: Ответ, прочитанный с реплики, не кэшируется и не получает ETag списка."""
+        url = reverse('networknode-list')
+        response = self.client.get(url)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        # Закрепленный за основной БД клиент заполняет кэш и получает ETag.
+        self.client.cookies['db_pin'] = '1'
+        self.assertIn('ETag', self.client.get(url))
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_router_keeps_writes_on_primary(self):
+        """Тест: Записи идут на основную БД, а после записи и чтения внутри контекста."""
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'default')
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            self.assertEqual(router.db_for_write(Product, instance=self.product), 'default')
+            self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'network'))
+
+
+class SearchAPITests(APITestCase):
+    """
+    Тесты поиска по узлам и продуктам (полнотекстовый, префиксный, с опечатками).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='search_user', password='password123', is_active=True)
+        defaults = {
+            'node_type': NetworkNode.NodeType.RETAIL, 'country': "Россия", 'street': "Ленина", 'house_number': "1",
+        }
+        for attr, name, city in (
+            ('factory', "Завод Электроника", "Москва"),
+            ('market', "Москва Маркет", "Казань"),
+            ('shop', "Техносила", "Самара"),
+        ):
+            node = NetworkNode.objects.create(name=name, city=city, email=f"{attr}@example.com", **defaults)
+            setattr(cls, attr, node)
+        cls.router = Product.objects.create(name="Роутер", model="RT-100", release_date="2024-01-01")
+        cls.modem = Product.objects.create(name="Модем", model="MD-5", release_date="2024-01-01")
+        cls.url = reverse('networknode-list')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.user)
+
+    def names(self, url=None, **params):
+        response = self.client.get(url or self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data['results']]
+
+    def test_full_text_ranks_name_above_city(self):
+        """Тест: Совпадение в названии ранжируется выше совпадения в городе."""
+        self.assertEqual(self.names(search="москва"), ["Москва Маркет", "Завод Электроника"])
+
+    def test_explicit_ordering_overrides_rank(self):
+        """Тест: Явный ?ordering= заменяет порядок по релевантности."""
+        self.assertEqual(self.names(search="москва", ordering='name'), ["Завод Электроника", "Москва Маркет"])
+
+    def test_prefix_mode_for_autocomplete(self):
+        """Тест: В режиме prefix слова запроса ищутся как начала слов."""
+        self.assertEqual(self.names(search="тех", search_mode='prefix'), ["Техносила"])
+        self.assertEqual(self.names(search="тех"), [])
+
+    def test_fuzzy_mode_tolerates_typos(self):
+        """Тест: Режим fuzzy находит название с опечаткой."""
+        self.assertEqual(self.names(search="Тенхосила", search_mode='fuzzy')[:1], ["Техносила"])
+
+    def test_products_search_by_model(self):
+        """Тест: Продукты ищутся по названию и модели."""
+        url = reverse('product-list')
+        self.assertEqual(self.names(url, search="rt", search_mode='prefix'), ["Роутер"])
+        self.assertEqual(self.names(url, search="модем"), ["Модем"])
+
+    def test_invalid_mode(self):
+        """Тест: Неизвестный режим поиска отклоняется."""
+        response = self.client.get(self.url, {'search': "москва", 'search_mode': 'regex'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DebtOperationAPITests(APITestCase):
+    """
+    Тесты массовых операций с задолженностью через API.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='debt_staff', password='password123', is_staff=True)
+        cls.user = User.objects.create_user(username='debt_user', password='password123')
+        defaults = {'country': "Россия", 'city': "Москва", 'street': "Ленина", 'house_number': "1"}
+        nodes = {}
+        for name, node_type in (
+            ('factory', NetworkNode.NodeType.FACTORY),
+            ('second', NetworkNode.NodeType.FACTORY),
+            ('shop', NetworkNode.NodeType.RETAIL),
+        ):
+            nodes[name] = NetworkNode.objects.create(
+                name=name, node_type=node_type, email=f"debt_{name}@example.com", **defaults
+            )
+        cls.shop = nodes['shop']
+        cls.first_link = SupplierLink.objects.create(supplier=nodes['factory'], client=cls.shop, debt=Decimal("80.00"))
+        cls.second_link = SupplierLink.objects.create(supplier=nodes['second'], client=cls.shop, debt=Decimal("20.00"))
+        cls.url = reverse('networknode-debt-operations')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.staff)
+
+    def test_staff_only(self):
+        """Тест: Операции с задолженностью доступны только сотрудникам."""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.url, {'operation': 'clear', 'client': self.shop.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_adjust_by_client(self):
+        """Тест: Связи выбираются по клиенту, изменения попадают в журнал."""
+        response = self.client.post(
+            self.url, {'operation': 'adjust', 'client': self.shop.pk, 'percent': '-50'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['links_changed'], response.data['total_change']), (2, '-50.00'))
+        self.assertEqual(NetworkNode.objects.get(pk=self.shop.pk).debt_to_suppliers, Decimal("50.00"))
+        self.assertEqual(
+            DebtOperation.objects.filter(batch=response.data['operation'], user=self.staff).count(), 2
+        )
+
+    def test_transfer_updates_cached_node(self):
+        """Тест: Перенос долга виден в закэшированном ответе клиента."""
+        detail = reverse('networknode-detail', args=[self.shop.pk])
+        self.client.get(detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {
+                'operation': 'transfer', 'links': [self.second_link.pk], 'target': self.first_link.pk,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        debts = {link['id']: link['debt'] for link in self.client.get(detail).data['suppliers_links']}
+        self.assertEqual(debts, {self.first_link.pk: '100.00', self.second_link.pk: '0.00'})
+
+    def test_operation_pins_reads_to_primary(self):
+        """Тест: После операции клиент закрепляется за основной БД, как после любой записи."""
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            response = self.client.post(self.url, {'operation': 'clear', 'client': self.shop.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('db_pin', response.cookies)
+
+    def test_invalid_parameters(self):
+        """Тест: Неполные или недопустимые параметры отклоняются с 400."""
+        for payload in (
+            {'operation': 'clear'},
+            {'operation': 'adjust', 'client': self.shop.pk},
+            {'operation': 'adjust', 'client': self.shop.pk, 'percent': '-150'},
+            {'operation': 'transfer', 'links': [self.second_link.pk]},
+            {'operation': 'merge', 'client': self.shop.pk},
+        ):
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+        self.assertFalse(DebtOperation.objects.exists())
@@ -1,9 +1,27 @@
 import logging
-from rest_framework import viewsets, permissions, filters
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets, permissions, filters, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from apps.network.models import NetworkNode, Product
-from .serializers import NetworkNodeSerializer, ProductSerializer
+from apps.network import cache as generations
+from apps.network import debt, export, hierarchy, search
+from apps.network.models import DebtOperation, NetworkNode, Product, SupplierLink
+from .serializers import (
+    DebtOperationSerializer, FieldSelectionQuerySerializer, NetworkNodeSerializer, ProductSerializer,
+    SupplyChainQuerySerializer
+)
+from .bulk import BulkUpsert
+from .cache import CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .instrumentation import InstrumentedViewMixin
 from .pagination import CustomPagination
+from .search import PostgresSearchFilter
 
 # Получаем логгер 'apps', который мы настроили для общих событий приложения
 app_logger = logging.getLogger('apps')
@@ -24,17 +42,72 @@ class IsActiveUser(permissions.BasePermission):
         return True
 
 
-class NetworkNodeViewSet(viewsets.ModelViewSet):
+class NetworkNodeViewSet(InstrumentedViewMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet для модели NetworkNode с расширенным логированием.
+
+    Ответы list/retrieve кэшируются и инвалидируются при изменении затронутых узлов,
+    на условные запросы по ETag отвечают 304 без сериализации.
     """
-    queryset = NetworkNode.objects.all().prefetch_related('products', 'client_links__supplier')
+    queryset = NetworkNode.objects.all()
     serializer_class = NetworkNodeSerializer
+    list_generation_keys = (generations.GLOBAL_KEY, generations.COLLECTION_KEY)
     permission_classes = [IsActiveUser]
     pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['country', 'city']
-    search_fields = ['name']
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, PostgresSearchFilter]
+    filterset_fields = {
+        'country': ['exact'],
+        'city': ['exact'],
+        'level': ['exact', 'lt', 'lte', 'gt', 'gte'],
+        'debt_to_suppliers': ['lte', 'gte'],
+        'debt_from_clients': ['lte', 'gte'],
+        'subtree_debt_to_suppliers': ['lte', 'gte'],
+        'subtree_debt_from_clients': ['lte', 'gte'],
+    }
+    search_fields = search.NODE_SEARCH_FIELDS
+    ordering_fields = [
+        'level', 'name', 'created_at',
+        'debt_to_suppliers', 'debt_from_clients', 'subtree_debt_to_suppliers', 'subtree_debt_from_clients',
+    ]
+    ordering = ['id']
+    # Порядок для ?pagination=cursor: новые узлы первыми, индекс network_node_created_id_idx.
+    cursor_ordering = ('-created_at', '-id')
+
+    def get_field_selection(self):
+        """Разбирает ?fields= и ?expand= для list/retrieve; None означает полный ответ."""
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = None
+            if self.action in ('list', 'retrieve'):
+                params = FieldSelectionQuerySerializer(data=self.request.query_params)
+                params.is_valid(raise_exception=True)
+                if params.validated_data['fields'] is not None:
+                    self._field_selection = params.validated_data
+        return self._field_selection
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'field_selection': self.get_field_selection()}
+
+    def get_queryset(self):
+        """Выбирает только колонки и связи, которые попадут в ответ."""
+        queryset = super().get_queryset()
+        selection = self.get_field_selection()
+        if selection is None:
+            # Поставщик в связях выводится своим ID, поэтому сами узлы-поставщики не подгружаются.
+            return queryset.prefetch_related('products', 'client_links')
+
+        fields, expand = selection['fields'], selection['expand']
+        columns = {field.name for field in NetworkNode._meta.concrete_fields} & fields
+        queryset = queryset.only('id', *columns)
+        if 'products' in fields:
+            queryset = queryset.prefetch_related(
+                'products' if 'products' in expand else Prefetch('products', queryset=Product.objects.only('id'))
+            )
+        if 'suppliers_links' in fields:
+            links = SupplierLink.objects.all()
+            if 'suppliers_links' not in expand:
+                links = links.only('id', 'client_id')
+            queryset = queryset.prefetch_related(Prefetch('client_links', queryset=links))
+        return queryset
 
     def list(self, request, *args, **kwargs):
         """Переопределяем метод для логирования параметров запроса."""
@@ -56,14 +129,138 @@ class NetworkNodeViewSet(viewsets.ModelViewSet):
 
         return super().list(request, *args, **kwargs)
 
+    @action(detail=True, methods=['get'])
+    def upstream(self, request, pk=None):
+        """Все вышестоящие поставщики узла с глубиной и задолженностью по каждой связи."""
+        return self._supply_chain_response(request, pk, hierarchy.UPSTREAM)
+
+    @action(detail=True, methods=['get'])
+    def downstream(self, request, pk=None):
+        """Все нижестоящие клиенты узла с глубиной и задолженностью по каждой связи."""
+        return self._supply_chain_response(request, pk, hierarchy.DOWNSTREAM)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Пакетный upsert узлов по email и создание связей между ними.
+
+        Тело запроса: {"nodes": [...], "links": [{"supplier_email": ..., "client_email": ...}]}.
+        Ошибочные строки пропускаются и возвращаются в "errors" с номером строки.
+        """
+        if not isinstance(request.data, dict):
+            return Response({'detail': "Тело запроса должно быть объектом."}, status=status.HTTP_400_BAD_REQUEST)
+        nodes = request.data.get('nodes', [])
+        links = request.data.get('links', [])
+        if not isinstance(nodes, list) or not isinstance(links, list):
+            return Response(
+                {'detail': "Поля 'nodes' и 'links' должны быть списками."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(nodes) + len(links) > settings.BULK_UPSERT_MAX_ROWS:
+            return Response(
+                {'detail': f"Не больше {settings.BULK_UPSERT_MAX_ROWS} строк за один запрос."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        app_logger.info(
+            f"Пользователь '{request.user.username}' запустил пакетную загрузку: "
+            f"{len(nodes)} узлов, {len(links)} связей."
+        )
+        result = BulkUpsert(settings.BULK_UPSERT_CHUNK_SIZE).run(nodes, links)
+        return Response(result)
+
+    @action(
+        detail=False, methods=['post'], url_path='debt-operations',
+        permission_classes=[IsActiveUser, permissions.IsAdminUser]
+    )
+    def debt_operations(self, request):
+        """
+        Массовая операция с задолженностью связей (только для сотрудников с is_staff).
+
+        Тело запроса: {"operation": "clear" | "adjust" | "transfer", "links": [...], "supplier": ID,
+        "client": ID, "percent": ..., "target": ID связи}. Все выбранные связи меняются одним
+        запросом с записью в журнал DebtOperation (см. apps/network/debt.py).
+        """
+        params = DebtOperationSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        operation, links = params.validated_data['operation'], params.get_links()
+
+        try:
+            if operation == DebtOperation.Kind.ADJUST:
+                batch, changes = debt.adjust(links, params.validated_data['percent'], user=request.user)
+            elif operation == DebtOperation.Kind.TRANSFER:
+                batch, changes = debt.transfer(links, params.validated_data['target'], user=request.user)
+            else:
+                batch, changes = debt.clear(links, user=request.user)
+        except DjangoValidationError as error:
+            return Response({'detail': "; ".join(error.messages)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'operation': batch,
+            'links_changed': len(changes),
+            'total_change': str(sum((delta for _, _, delta in changes), Decimal('0.00'))),
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Потоковая выгрузка узлов (с учетом фильтров списка) вместе с продуктами и поставщиками.
+
+        Параметр export_format: 'ndjson' (по умолчанию) или 'csv'. Ответ формируется построчно
+        из серверного курсора, без пагинации и без сериализации всей выборки в памяти.
+        """
+        export_format = request.query_params.get('export_format', export.NDJSON)
+        if export_format not in export.FORMATS:
+            return Response(
+                {'export_format': [f"Допустимые форматы: {list(export.FORMATS)}."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(NetworkNode.objects.order_by('id'))
+        # Ответ читается после выхода из middleware: БД (реплика) фиксируется сейчас.
+        queryset = queryset.using(queryset.db)
+        app_logger.info(f"Пользователь '{request.user.username}' запустил выгрузку узлов в формате {export_format}.")
+        response = StreamingHttpResponse(
+            export.stream(export_format, queryset), content_type=export.CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="network.{export_format}"'
+        return response
+
+    def _supply_chain_response(self, request, pk, direction):
+        """
+        Вычисляет цепочку поставок на сервере одним рекурсивным запросом.
+
+        Параметры: depth - максимальная глубина, node_type - типы узлов через запятую,
+        shape - 'flat' (список связей) или 'tree' (вложенное дерево).
+        """
+        params = SupplyChainQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        depth = params.validated_data['depth']
+
+        node = get_object_or_404(NetworkNode.objects.only('id', 'name', 'node_type', 'level'), pk=pk)
+        root = {'id': node.id, 'name': node.name, 'node_type': node.node_type, 'level': node.level}
+        edges = hierarchy.fetch_supply_chain(
+            node.id, direction, depth, params.validated_data.get('node_type')
+        )
+        app_logger.info(
+            f"Пользователь '{request.user.username}' запросил цепочку {direction} узла (ID: {node.id}): "
+            f"{len(edges)} связей."
+        )
+
+        if params.validated_data['shape'] == SupplyChainQuerySerializer.SHAPE_TREE:
+            tree = hierarchy.build_supply_tree(root, edges, direction, depth)
+            return Response({'direction': direction, 'tree': tree})
+        return Response({'direction': direction, 'node': root, 'results': edges})
+
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(InstrumentedViewMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
-    ViewSet для модели Product.
+    ViewSet для модели Product. Поддерживает условные запросы по ETag.
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    list_generation_keys = (generations.GLOBAL_KEY, generations.PRODUCTS_KEY)
     permission_classes = [IsActiveUser]
     pagination_class = CustomPagination
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    cursor_ordering = ('id',)
+    filter_backends = [PostgresSearchFilter]
+    search_fields = search.PRODUCT_SEARCH_FIELDS
@@ -0,0 +1,270 @@
+"""
+Потоковый разбор лог-файлов для команды log_analyzer.
+
+Файлы читаются построчно (в том числе ротированные копии .1-.5 и сжатые .gz),
+по каждому файлу собирается LogStats, а результаты по файлам объединяются.
+Индекс смещений хранит для каждого файла (по устройству и inode, которые
+сохраняются при ротации переименованием) прочитанное смещение и собранную
+статистику, поэтому повторный запуск читает только дописанные байты.
+
+Время записей сравнивается как строки вида 'YYYY-MM-DD HH:MM:SS', без разбора
+в datetime: формат логов упорядочен лексикографически.
+"""
+import gzip
+import json
+import os
+import re
+from collections import Counter
+
+INDEX_VERSION = 1
+
+# Верхние границы корзин гистограммы латентности, мс; последняя - бесконечность.
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Размер корзины временной шкалы - длина префикса метки времени.
+TIME_BUCKETS = {'minute': 16, 'hour': 13, 'day': 10}
+
+EVENTS = (
+    ('request', 'Входящий запрос:'),
+    ('request', 'REQUEST_METRICS:'),
+    ('login_success', 'успешно вошел'),
+    ('login_failed', 'Неудачная попытка входа'),
+    ('logout', 'вышел из системы'),
+    ('created', 'создан'),
+    ('updated', 'обновлен'),
+    ('debt_cleared', 'очистил задолженность'),
+    ('slow_request', 'SLOW_REQUEST'),
+    ('slow_request', ' slow=1'),
+)
+
+TEXT_RECORD = re.compile(
+    r'^\[(?P<level>[A-Z]+)\] (?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)[,.]\d+ (?:\S+ \d+ \d+ )?(?P<message>.*)$'
+)
+USER = re.compile(r"(?:(?:ользовател[ья]|дминистратор) '([^']+)'|\buser=(\S+))")
+IP = re.compile(r'(?:\bот |IP: |\bip=)(\d{1,3}(?:\.\d{1,3}){3}|[0-9a-fA-F]*:[0-9a-fA-F:]+)')
+NUMERIC_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def parse_line(line):
+    """Возвращает (уровень, время 'YYYY-MM-DD HH:MM:SS', сообщение) или None для продолжения записи."""
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        timestamp = str(record.get('timestamp', '')).replace('T', ' ')[:19]
+        return record.get('level', ''), timestamp, str(record.get('message', ''))
+    match = TEXT_RECORD.match(line)
+    if match is None:
+        return None
+    return match.group('level'), match.group('ts'), match.group('message')
+
+
+def parse_request_metrics(message):
+    """Поля строки 'REQUEST_METRICS: method=GET path=/x/ status=200 time=0.004s queries=3 ...'."""
+    fields = dict(pair.split('=', 1) for pair in message[len('REQUEST_METRICS:'):].split() if '=' in pair)
+    try:
+        return {
+            'endpoint': f"{fields['method']} {NUMERIC_SEGMENT.sub('/{id}', fields['path'])}",
+            'time_ms': float(fields['time'].rstrip('s')) * 1000,
+            'queries': int(fields.get('queries', 0)),
+        }
+    except (KeyError, ValueError):
+        return None
+
+
+class LogStats:
+    """Объединяемая статистика по записям логов (сериализуется в JSON для индекса)."""
+
+    def __init__(self):
+        self.records = 0
+        self.levels = Counter()
+        self.events = Counter()
+        self.users = {}
+        self.ips = {}
+        self.timeline = {}
+        self.endpoints = {}
+
+    def add(self, level, timestamp, message, time_bucket):
+        self.records += 1
+        self.levels[level] += 1
+        events = [event for event, marker in EVENTS if marker in message]
+        self.events.update(events)
+        if time_bucket:
+            self.timeline.setdefault(timestamp[:time_bucket], Counter())[level] += 1
+
+        if events:
+            user = USER.search(message)
+            if user:
+                self.users.setdefault(user.group(1) or user.group(2), Counter()).update(events)
+            ip = IP.search(message)
+            if ip:
+                self.ips.setdefault(ip.group(1), Counter()).update(events)
+
+        if message.startswith('REQUEST_METRICS:'):
+            metrics = parse_request_metrics(message)
+            if metrics:
+                self._add_latency(metrics)
+
+    def _add_latency(self, metrics):
+        endpoint = self.endpoints.get(metrics['endpoint'])
+        if endpoint is None:
+            endpoint = self.endpoints[metrics['endpoint']] = {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'buckets': [0] * len(LATENCY_BUCKETS),
+            }
+        time_ms = metrics['time_ms']
+        endpoint['count'] += 1
+        endpoint['total_ms'] += time_ms
+        endpoint['max_ms'] = max(endpoint['max_ms'], time_ms)
+        endpoint['queries'] += metrics['queries']
+        endpoint['buckets'][next(i for i, bound in enumerate(LATENCY_BUCKETS) if time_ms <= bound)] += 1
+
+    def merge(self, other):
+        self.records += other.records
+        self.levels.update(other.levels)
+        self.events.update(other.events)
+        for target, source in ((self.users, other.users), (self.ips, other.ips), (self.timeline, other.timeline)):
+            for key, counter in source.items():
+                target.setdefault(key, Counter()).update(counter)
+        for key, endpoint in other.endpoints.items():
+            mine = self.endpoints.get(key)
+            if mine is None:
+                self.endpoints[key] = {**endpoint, 'buckets': list(endpoint['buckets'])}
+                continue
+            for field in ('count', 'total_ms', 'queries'):
+                mine[field] += endpoint[field]
+            mine['max_ms'] = max(mine['max_ms'], endpoint['max_ms'])
+            mine['buckets'] = [a + b for a, b in zip(mine['buckets'], endpoint['buckets'])]
+        return self
+
+    def top_endpoints(self, limit):
+        """Эндпоинты по убыванию p95 (оценка сверху по корзинам гистограммы)."""
+        rows = []
+        for endpoint, data in self.endpoints.items():
+            threshold, cumulative, p95 = 0.95 * data['count'], 0, data['max_ms']
+            for bound, count in zip(LATENCY_BUCKETS, data['buckets']):
+                cumulative += count
+                if cumulative >= threshold:
+                    p95 = min(bound, data['max_ms'])
+                    break
+            rows.append({
+                'endpoint': endpoint,
+                'count': data['count'],
+                'avg_ms': round(data['total_ms'] / data['count'], 2),
+                'p95_ms': round(p95, 2),
+                'max_ms': round(data['max_ms'], 2),
+                'avg_queries': round(data['queries'] / data['count'], 2),
+            })
+        return sorted(rows, key=lambda row: (row['p95_ms'], row['avg_ms']), reverse=True)[:limit]
+
+    def to_dict(self):
+        return {
+            'records': self.records,
+            'levels': dict(self.levels),
+            'events': dict(self.events),
+            'users': {key: dict(value) for key, value in self.users.items()},
+            'ips': {key: dict(value) for key, value in self.ips.items()},
+            'timeline': {key: dict(value) for key, value in self.timeline.items()},
+            'endpoints': self.endpoints,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.records = data['records']
+        stats.levels = Counter(data['levels'])
+        stats.events = Counter(data['events'])
+        stats.users = {key: Counter(value) for key, value in data['users'].items()}
+        stats.ips = {key: Counter(value) for key, value in data['ips'].items()}
+        stats.timeline = {key: Counter(value) for key, value in data['timeline'].items()}
+        stats.endpoints = data['endpoints']
+        return stats
+
+
+def analyze_file(path, offset=0, since=None, until=None, time_bucket=None):
+    """
+    Разбирает файл с offset до последней полной строки.
+
+    Возвращает (новое смещение, LogStats в виде словаря). Функция верхнего уровня,
+    чтобы ее можно было выполнять в пуле процессов.
+    """
+    stats = LogStats()
+    compressed = str(path).endswith('.gz')
+    opener = gzip.open if compressed else open
+    with opener(path, 'rb') as stream:
+        if offset and not compressed:
+            stream.seek(offset)
+        for raw in stream:
+            if not raw.endswith(b'\n') and not compressed:
+                # Запись дописывается прямо сейчас: прочитаем ее при следующем запуске.
+                break
+            offset += len(raw)
+            parsed = parse_line(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+            if parsed is None:
+                continue
+            level, timestamp, message = parsed
+            if (since and timestamp < since) or (until and timestamp >= until):
+                continue
+            stats.add(level, timestamp, message, time_bucket)
+    if compressed:
+        # Сжатые копии не дописываются: смещение - размер файла, признак полностью прочитанного.
+        offset = os.path.getsize(path)
+    return offset, stats.to_dict()
+
+
+def log_files(log_dir, name):
+    """Текущий файл и его ротированные копии (name.1, name.2.gz, ...), от старых к новым."""
+    pattern = re.compile(rf'^{re.escape(name)}(?:\.(\d+))?(?:\.gz)?$')
+    found = []
+    for entry in os.scandir(log_dir):
+        match = pattern.match(entry.name)
+        if match and entry.is_file():
+            found.append((-int(match.group(1) or 0), entry.path))
+    return [path for _, path in sorted(found)]
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return f"{stat.st_dev}:{stat.st_ino}", stat.st_size
+
+
+class OffsetIndex:
+    """
+    Индекс смещений в JSON-файле: {ключ файла: {offset, stats}}.
+
+    Индекс действителен только для тех же параметров разбора (окно времени, корзины);
+    при их изменении он сбрасывается. Записи удаленных файлов не сохраняются.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.entries = {}
+        self.seen = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as stream:
+                    data = json.load(stream)
+            except ValueError:
+                data = {}
+            if data.get('version') == INDEX_VERSION and data.get('params') == params:
+                self.entries = data.get('files', {})
+
+    def plan(self, path):
+        """Возвращает (ключ, размер, смещение, накопленная статистика или None) для файла."""
+        key, size = file_key(path)
+        entry = self.entries.get(key)
+        if entry is None or entry['offset'] > size or (path.endswith('.gz') and entry['offset'] != size):
+            return key, size, 0, None
+        return key, size, entry['offset'], LogStats.from_dict(entry['stats'])
+
+    def update(self, key, offset, stats):
+        self.seen[key] = {'offset': offset, 'stats': stats.to_dict()}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as stream:
+            json.dump({'version': INDEX_VERSION, 'params': self.params, 'files': self.seen}, stream)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,205 @@
+import json
+import math
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.network.generator import SHAPES, generate_network
+from apps.network.models import NetworkNode, Product, SupplierClosure
+
+# Бюджеты по умолчанию: число запросов к БД не должно зависеть от размера графа.
+# Латентность по умолчанию не ограничена - она зависит от машины, ее бюджет задается файлом.
+DEFAULT_BUDGETS = {
+    'nodes-list': {'queries': 5},
+    'nodes-detail': {'queries': 4},
+    # Включая блокировку графа и повторную проверку цикла при создании связи с поставщиком.
+    'nodes-create': {'queries': 15},
+    'nodes-update': {'queries': 9},
+    'nodes-cycle': {'queries': 5},
+    'products-list': {'queries': 3},
+    'products-detail': {'queries': 2},
+}
+
+
+def percentile(values, fraction):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    """
+    Django-команда для регрессионного бенчмарка API.
+
+    Для каждой формы графа (широкий, глубокий, со множественными поставщиками) генерирует
+    сеть заданного размера внутри транзакции, выполняет сценарии API и откатывает транзакцию,
+    так что база данных не меняется. Для каждого сценария измеряются запросы к БД,
+    p50/p95 латентности и пик выделенной памяти. Генерация детерминирована (--seed),
+    поэтому результаты запусков сравнимы; при превышении бюджета команда завершается ошибкой.
+    """
+    help = 'Измеряет запросы к БД, латентность и память эндпоинтов API на синтетических графах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shapes', default='wide,deep,dag', help=f"Формы графа через запятую: {', '.join(SHAPES)}."
+        )
+        parser.add_argument('--nodes', type=int, default=200, help='Число узлов в графе.')
+        parser.add_argument('--iterations', type=int, default=20, help='Число замеров на сценарий.')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора графа.')
+        parser.add_argument('--with-cache', action='store_true', help='Не отключать кэш ответов API.')
+        parser.add_argument('--budgets', help='JSON-файл бюджетов {сценарий: {queries, p50_ms, p95_ms, peak_kb}}.')
+        parser.add_argument('--baseline', help='JSON-результат предыдущего запуска для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=20.0, help='Допустимый рост p95 к baseline, %%.')
+        parser.add_argument('--output', help='Файл для JSON-результатов.')
+
+    def handle(self, *args, **options):
+        shapes = [shape.strip() for shape in options['shapes'].split(',') if shape.strip()]
+        unknown = set(shapes) - set(SHAPES)
+        if unknown:
+            raise CommandError(f"Неизвестные формы графа: {sorted(unknown)}.")
+
+        budgets = DEFAULT_BUDGETS
+        if options['budgets']:
+            budgets = json.loads(Path(options['budgets']).read_text(encoding='utf-8'))
+
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not options['with_cache']:
+            overrides['API_RESPONSE_CACHE_TIMEOUT'] = 0
+
+        results = {
+            'params': {key: options[key] for key in ('nodes', 'iterations', 'seed', 'with_cache')},
+            'shapes': {},
+        }
+        with override_settings(**overrides):
+            for shape in shapes:
+                self.stdout.write(self.style.HTTP_INFO(f"\nГраф '{shape}', {options['nodes']} узлов"))
+                results['shapes'][shape] = self._run_shape(shape, options)
+
+        violations = self._check_budgets(results, budgets)
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text(encoding='utf-8'))
+            violations += self._compare(results, baseline, options['tolerance'])
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+            self.stdout.write(f"Результаты записаны в {options['output']}.")
+
+        if violations:
+            for violation in violations:
+                self.stdout.write(self.style.ERROR(violation))
+            raise CommandError(f"Превышено бюджетов: {len(violations)}.")
+        self.stdout.write(self.style.SUCCESS("\nВсе сценарии уложились в бюджеты."))
+
+    def _run_shape(self, shape, options):
+        with transaction.atomic():
+            products = Product.objects.bulk_create([
+                Product(name=f"Продукт {index}", model=f"BM-{index}", release_date='2024-01-01') for index in range(20)
+            ])
+            layers = generate_network(
+                SHAPES[shape](options['nodes']), seed=options['seed'], tag=f'bench-{shape}',
+                product_ids=[product.pk for product in products], products_per_node=(1, 1),
+            )
+
+            user = get_user_model().objects.create_user(username=f'benchmark-{shape}', password='benchmark')
+            client = APIClient()
+            client.force_authenticate(user=user)
+
+            # Для проверки цикла нужен предок листа: связь лист -> предок замкнула бы цикл.
+            leaf = layers[-1][-1]
+            root = SupplierClosure.objects.filter(descendant_id=leaf).order_by('-depth').values_list(
+                'ancestor_id', flat=True
+            ).first() or leaf
+            counter = iter(range(10 ** 9))
+            scenarios = {
+                'nodes-list': lambda: client.get(reverse('networknode-list'), {'page_size': 50}),
+                'nodes-detail': lambda: client.get(reverse('networknode-detail', args=[leaf])),
+                'nodes-create': lambda: client.post(reverse('networknode-list'), {
+                    'name': 'Новый узел', 'node_type': NetworkNode.NodeType.ENTREPRENEUR,
+                    'email': f'bench-new-{next(counter)}@example.com', 'country': 'Россия', 'city': 'Москва',
+                    'street': 'Тестовая', 'house_number': '1', 'supplier_id': leaf,
+                }, format='json'),
+                'nodes-update': lambda: client.patch(
+                    reverse('networknode-detail', args=[leaf]), {'name': f'Узел {next(counter)}'}, format='json'
+                ),
+                'nodes-cycle': lambda: client.patch(
+                    reverse('networknode-detail', args=[root]), {'supplier_id': leaf}, format='json'
+                ),
+                'products-list': lambda: client.get(reverse('product-list'), {'page_size': 50}),
+                'products-detail': lambda: client.get(reverse('product-detail', args=[products[0].pk])),
+            }
+            expected_status = {'nodes-create': 201, 'nodes-cycle': 400}
+            if root == leaf:
+                scenarios.pop('nodes-cycle')
+
+            measured = {}
+            for name, request in scenarios.items():
+                measured[name] = self._measure(name, request, expected_status.get(name, 200), options['iterations'])
+                self.stdout.write(
+                    f"  {name:<16} запросов {measured[name]['queries']:>3}  "
+                    f"p50 {measured[name]['p50_ms']:>8.2f} мс  p95 {measured[name]['p95_ms']:>8.2f} мс  "
+                    f"память {measured[name]['peak_kb']:>8.1f} КБ"
+                )
+            transaction.set_rollback(True)
+        return measured
+
+    def _measure(self, name, request, expected_status, iterations):
+        response = request()  # Прогрев: импорты, кэши Django.
+        if response.status_code != expected_status:
+            raise CommandError(f"Сценарий {name}: статус {response.status_code}, ожидался {expected_status}.")
+
+        timings, queries = [], 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+
+        # Память меряется отдельным запросом: tracemalloc замедляет выполнение и исказил бы латентность.
+        tracemalloc.start()
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'queries': queries,
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def _check_budgets(self, results, budgets):
+        violations = []
+        for shape, measured in results['shapes'].items():
+            for scenario, limits in budgets.items():
+                for metric, limit in limits.items():
+                    value = measured.get(scenario, {}).get(metric)
+                    if value is not None and value > limit:
+                        violations.append(f"[{shape}] {scenario}: {metric} = {value}, бюджет {limit}.")
+        return violations
+
+    def _compare(self, results, baseline, tolerance):
+        violations = []
+        for shape, measured in results['shapes'].items():
+            for scenario, values in measured.items():
+                previous = baseline.get('shapes', {}).get(shape, {}).get(scenario)
+                if not previous:
+                    continue
+                if values['queries'] > previous['queries']:
+                    violations.append(
+                        f"[{shape}] {scenario}: запросов {values['queries']}, в baseline {previous['queries']}."
+                    )
+                if values['p95_ms'] > previous['p95_ms'] * (1 + tolerance / 100):
+                    violations.append(
+                        f"[{shape}] {scenario}: p95 {values['p95_ms']} мс, в baseline {previous['p95_ms']} мс "
+                        f"(допуск {tolerance}%)."
+                    )
+        return violations
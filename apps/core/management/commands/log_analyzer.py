@@ -1,54 +1,158 @@
-from django.core.management.base import BaseCommand
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
 from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.loganalysis import TIME_BUCKETS, LogStats, OffsetIndex, analyze_file, log_files
+
+LOGS = (
+    ('django.log', "Общий лог (django.log)"),
+    ('security.log', "Лог безопасности (security.log)"),
+    ('business.log', "Лог бизнес-логики (business.log)"),
+    ('errors.log', "Лог ошибок (errors.log)"),
+    ('metrics.log', "Метрики запросов (metrics.log)"),
+)
 
 
 class Command(BaseCommand):
+    """
+    Django-команда для анализа логов приложения.
+
+    Читает текущие и ротированные (в том числе сжатые) файлы потоково, параллельно
+    в нескольких процессах (apps/core/loganalysis.py). Индекс смещений позволяет при
+    повторном запуске читать только новые записи. Помимо счетчиков по уровням и событиям
+    строит срезы по пользователям и IP, временную шкалу и топ эндпоинтов по латентности
+    по строкам REQUEST_METRICS.
+    """
     help = 'Анализ логов приложения'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--log-dir', help='Каталог логов (по умолчанию LOG_DIR).')
+        parser.add_argument('--since', help='Начало окна времени, YYYY-MM-DD[ HH:MM[:SS]].')
+        parser.add_argument('--until', help='Конец окна времени (не включительно).')
+        parser.add_argument('--bucket', choices=sorted(TIME_BUCKETS), help='Шаг временной шкалы.')
+        parser.add_argument('--top', type=int, default=10, help='Размер топов.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Число процессов разбора.')
+        parser.add_argument('--index', help='Файл индекса смещений (по умолчанию <log-dir>/.log_analyzer_index.json).')
+        parser.add_argument('--no-index', action='store_true', help='Читать файлы целиком, не используя индекс.')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON.')
+
     def handle(self, *args, **options):
-        log_file = settings.LOG_DIR / 'django.log'
-        security_log_file = settings.LOG_DIR / 'security.log'
-        business_log_file = settings.LOG_DIR / 'business.log'
-        errors_log_file = settings.LOG_DIR / 'errors.log'
+        log_dir = Path(options['log_dir'] or settings.LOG_DIR)
+        if not log_dir.is_dir():
+            raise CommandError(f"Каталог логов не найден: {log_dir}")
+        params = {
+            'since': self._timestamp(options['since']),
+            'until': self._timestamp(options['until']),
+            'time_bucket': TIME_BUCKETS.get(options['bucket']),
+        }
+        index_path = None if options['no_index'] else (options['index'] or log_dir / '.log_analyzer_index.json')
+        index = OffsetIndex(str(index_path) if index_path else None, params)
+
+        results = self._analyze(log_dir, index, params, options['workers'])
+        index.save()
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                name: {**stats.to_dict(), 'top_endpoints': stats.top_endpoints(options['top'])}
+                for name, stats in results.items()
+            }, ensure_ascii=False, indent=2))
+            return
+        self._report(results, options['top'])
+
+    @staticmethod
+    def _timestamp(value):
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise CommandError(f"Некорректное время: {value}")
+
+    def _analyze(self, log_dir, index, params, workers):
+        """Статистика по каждому логу: накопленная из индекса плюс разбор новых байтов."""
+        results, tasks = {}, []
+        for name, _ in LOGS:
+            results[name] = LogStats()
+            for path in log_files(log_dir, name):
+                key, size, offset, cached = index.plan(path)
+                if cached is not None and offset == size:
+                    index.update(key, offset, cached)
+                    results[name].merge(cached)
+                else:
+                    tasks.append((name, key, path, offset, cached))
+
+        def collect(task, result):
+            name, key, _, _, cached = task
+            offset, data = result
+            stats = LogStats.from_dict(data)
+            if cached is not None:
+                stats = cached.merge(stats)
+            index.update(key, offset, stats)
+            results[name].merge(stats)
 
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                futures = [(task, pool.submit(analyze_file, task[2], task[3], **params)) for task in tasks]
+                for task, future in futures:
+                    collect(task, future.result())
+        else:
+            for task in tasks:
+                collect(task, analyze_file(task[2], task[3], **params))
+        return results
+
+    def _report(self, results, top):
         self.stdout.write(self.style.SUCCESS('--- Анализ лог-файлов ---'))
+        total = LogStats()
+        for name, title in LOGS:
+            stats = results[name]
+            if name != 'errors.log':
+                # errors.log дублирует записи уровня ERROR из остальных логов.
+                total.merge(stats)
+            self.stdout.write(self.style.HTTP_INFO(f"\nАнализ: {title}"))
+            if not stats.records:
+                self.stdout.write(self.style.WARNING('Записей не найдено'))
+                continue
+            self.stdout.write(f'Всего записей: {stats.records}')
+            self.stdout.write(self.style.ERROR(f"Ошибки: {stats.levels['ERROR'] + stats.levels['CRITICAL']}"))
+            self.stdout.write(self.style.WARNING(f"Предупреждения: {stats.levels['WARNING']}"))
 
-        self._analyze_log(log_file, "Общий лог (django.log)")
-        self._analyze_log(security_log_file, "Лог безопасности (security.log)")
-        self._analyze_log(business_log_file, "Лог бизнес-логики (business.log)")
-        self._analyze_log(errors_log_file, "Лог ошибок (errors.log)", level_filter='ERROR')
+            # Специфичная аналитика
+            if name == 'security.log':
+                self.stdout.write(self.style.SUCCESS(f"Успешных входов: {stats.events['login_success']}"))
+                self.stdout.write(self.style.NOTICE(f"Неудачных попыток входа: {stats.events['login_failed']}"))
+            if name == 'business.log':
+                self.stdout.write(f"Создано объектов через API/Admin: {stats.events['created']}")
+                self.stdout.write(f"Обновлено объектов через API/Admin: {stats.events['updated']}")
+                self.stdout.write(f"Операций по очистке долга: {stats.events['debt_cleared']}")
 
-    def _analyze_log(self, log_file, title, level_filter=None):
-        self.stdout.write(self.style.HTTP_INFO(f"\nАнализ: {title}"))
-        if not log_file.exists():
-            self.stdout.write(self.style.WARNING('Файл логов не найден'))
-            return
+        endpoints = total.top_endpoints(top)
+        if endpoints:
+            self.stdout.write(self.style.HTTP_INFO("\nЭндпоинты с наибольшей латентностью (p95):"))
+            for row in endpoints:
+                self.stdout.write(
+                    f"  {row['endpoint']:<50} запросов {row['count']:>7}  avg {row['avg_ms']:>9.2f} мс  "
+                    f"p95 <= {row['p95_ms']:>9.2f} мс  max {row['max_ms']:>9.2f} мс  SQL {row['avg_queries']:>6.2f}"
+                )
+
+        for title, groups in (("Пользователи", total.users), ("IP-адреса", total.ips)):
+            if not groups:
+                continue
+            self.stdout.write(self.style.HTTP_INFO(f"\n{title} по числу событий:"))
+            ranked = sorted(groups.items(), key=lambda item: sum(item[1].values()), reverse=True)[:top]
+            for key, events in ranked:
+                details = ', '.join(f"{event}={count}" for event, count in events.most_common())
+                self.stdout.write(f"  {key:<40} {details}")
 
-        with open(log_file, 'r') as f:
-            logs = f.readlines()
-
-        total_lines = len(logs)
-        error_count = sum(1 for log in logs if '[ERROR]' in log)
-        warning_count = sum(1 for log in logs if '[WARNING]' in log)
-
-        if level_filter:
-            logs = [log for log in logs if f'[{level_filter}]' in log]
-
-        self.stdout.write(f'Всего записей: {total_lines}')
-        self.stdout.write(self.style.ERROR(f'Ошибки: {error_count}'))
-        self.stdout.write(self.style.WARNING(f'Предупреждения: {warning_count}'))
-
-        # Специфичная аналитика
-        if 'security' in str(log_file):
-            logins = sum(1 for log in logs if 'успешно вошел' in log)
-            failed_logins = sum(1 for log in logs if 'Неудачная попытка входа' in log)
-            self.stdout.write(self.style.SUCCESS(f'Успешных входов: {logins}'))
-            self.stdout.write(self.style.NOTICE(f'Неудачных попыток входа: {failed_logins}'))
-
-        if 'business' in str(log_file):
-            creations = sum(1 for log in logs if 'создан' in log)
-            updates = sum(1 for log in logs if 'обновлен' in log)
-            debt_cleared = sum(1 for log in logs if 'очистил задолженность' in log)
-            self.stdout.write(f'Создано объектов через API/Admin: {creations}')
-            self.stdout.write(f'Обновлено объектов через API/Admin: {updates}')
-            self.stdout.write(f'Операций по очистке долга: {debt_cleared}')
+        if total.timeline:
+            self.stdout.write(self.style.HTTP_INFO("\nЗаписи по времени:"))
+            for bucket in sorted(total.timeline):
+                levels = total.timeline[bucket]
+                self.stdout.write(
+                    f"  {bucket:<16} всего {sum(levels.values()):>7}  "
+                    f"ошибок {levels['ERROR'] + levels['CRITICAL']:>5}  предупреждений {levels['WARNING']:>5}"
+                )
@@ -1,15 +1,39 @@
 
-import logging
-from django.contrib import admin
-from django.db.models import QuerySet
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, QuerySet
 from django.http import HttpRequest
 from django.urls import reverse
 from django.utils.html import format_html
 
-from .models import NetworkNode, Product, SupplierLink
+from apps.core.paginator import EstimatedCountPaginator
 
-# Получаем логгер с именем 'business' из настроек settings.py
-business_logger = logging.getLogger('business')
+from . import debt
+from .models import DebtOperation, NetworkNode, Product, SupplierLink
+from .queries import CITY_CHOICES_LIMIT, city_values
+
+
+class CityListFilter(admin.SimpleListFilter):
+    """
+    Фильтр по городу. Варианты берутся запросом queries.city_values и ограничены max_choices
+    первыми по алфавиту; выбранный город показывается всегда, остальные ищутся поиском.
+    """
+    title = 'Город'
+    parameter_name = 'city'
+    max_choices = CITY_CHOICES_LIMIT
+
+    def lookups(self, request, model_admin):
+        cities = city_values(self.max_choices)
+        if self.value() and self.value() not in cities:
+            cities.append(self.value())
+        return [(city, city) for city in cities]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(city=self.value())
+        return queryset
 
 
 @admin.register(Product)
@@ -19,35 +43,83 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'model')
 
 
+class DebtActionForm(helpers.ActionForm):
+    """Параметры массовых операций с задолженностью для действий SupplierLinkAdmin."""
+    percent = forms.DecimalField(
+        label='Процент', required=False, min_value=debt.MIN_PERCENT, max_value=debt.MAX_PERCENT, decimal_places=2
+    )
+    target = forms.IntegerField(label='ID связи-получателя', required=False, min_value=1)
+
+
 @admin.register(SupplierLink)
 class SupplierLinkAdmin(admin.ModelAdmin):
     """
     Админ-панель для модели Связей Поставщиков.
+
+    Действия с задолженностью выполняются одним запросом на все выбранные связи
+    и записываются в журнал DebtOperation (см. apps/network/debt.py).
     """
     list_display = ('supplier', 'client', 'debt')
+    list_select_related = ('supplier', 'client')
     search_fields = ('supplier__name', 'client__name')
     readonly_fields = ('debt',)
-    actions = ['clear_debt']
+    action_form = DebtActionForm
+    actions = ['clear_debt', 'adjust_debt', 'transfer_debt']
+
+    def _action_param(self, request: HttpRequest, name):
+        # Форма действия уже проверена в response_action(), здесь нужны только очищенные значения.
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        return form.cleaned_data.get(name) if form.is_valid() else None
+
+    def _run_debt_operation(self, request: HttpRequest, operation, *args):
+        try:
+            batch, changes = operation(*args, user=request.user)
+        except ValidationError as error:
+            self.message_user(request, "; ".join(error.messages), messages.ERROR)
+            return
+        self.message_user(request, f"Задолженность изменена у {len(changes)} связей (операция {batch}).")
 
     @admin.action(description='Очистить задолженность у выбранных связей')
     def clear_debt(self, request: HttpRequest, queryset: QuerySet[SupplierLink]):
-        """Действие для обнуления задолженности с логированием."""
-
-        # --- Логирование действия ---
-        admin_user = request.user.username
-        # Итерируемся по queryset ПЕРЕД обновлением, чтобы залогировать старые значения
-        for link in queryset:
-            business_logger.info(
-                f"Администратор '{admin_user}' очистил задолженность для узла '{link.client.name}' "
-                f"(поставщик: {link.supplier.name}). Старая задолженность: {link.debt}."
-            )
-        # --- Конец логирования ---
-
-        updated_count = queryset.update(debt=0)
-        self.message_user(
-            request,
-            f"Задолженность была успешно очищена для {updated_count} связей."
-        )
+        """Действие для обнуления задолженности с записью в журнал."""
+        self._run_debt_operation(request, debt.clear, queryset)
+
+    @admin.action(description='Изменить задолженность выбранных связей на процент')
+    def adjust_debt(self, request: HttpRequest, queryset: QuerySet[SupplierLink]):
+        percent = self._action_param(request, 'percent')
+        if percent is None:
+            self.message_user(request, "Укажите процент изменения.", messages.ERROR)
+            return
+        self._run_debt_operation(request, debt.adjust, queryset, percent)
+
+    @admin.action(description='Перенести задолженность выбранных связей на связь-получатель')
+    def transfer_debt(self, request: HttpRequest, queryset: QuerySet[SupplierLink]):
+        target = SupplierLink.objects.filter(pk=self._action_param(request, 'target')).first()
+        if target is None:
+            self.message_user(request, "Укажите ID существующей связи-получателя.", messages.ERROR)
+            return
+        self._run_debt_operation(request, debt.transfer, queryset, target)
+
+
+@admin.register(DebtOperation)
+class DebtOperationAdmin(admin.ModelAdmin):
+    """Журнал операций с задолженностью (только просмотр)."""
+    list_display = ('created_at', 'kind', 'supplier', 'client', 'old_debt', 'new_debt', 'user', 'batch')
+    list_filter = ('kind',)
+    list_select_related = ('supplier', 'client', 'user')
+    search_fields = ('=batch',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(NetworkNode)
@@ -55,18 +127,23 @@ class NetworkNodeAdmin(admin.ModelAdmin):
     """
     Админ-панель для Узлов Сети.
     """
-    list_display = ('name', 'node_type', 'city', 'display_suppliers_and_debt', 'created_at')
-    list_filter = ('node_type', 'city')
+    list_display = ('name', 'node_type', 'level', 'city', 'display_suppliers_and_debt', 'created_at')
+    list_filter = ('node_type', CityListFilter)
     search_fields = ('name', 'country', 'city')
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
     list_per_page = 25
+    # Число строк для пагинации - оценка PostgreSQL на больших выборках,
+    # а второй COUNT(*) по всей таблице ("всего N") не выполняется.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def display_suppliers_and_debt(self, obj: NetworkNode) -> str:
         """
         Формирует HTML для отображения поставщиков и долга в списке узлов.
         """
-        links = obj.client_links.select_related('supplier').all()
+        # Только .all(): любой другой вызов (select_related, filter) минует prefetch из get_queryset.
+        links = obj.client_links.all()
         if not links:
             return "—"
 
@@ -84,4 +161,5 @@ class NetworkNodeAdmin(admin.ModelAdmin):
         """
         Оптимизирует запросы к БД, чтобы избежать проблемы N+1.
         """
-        return super().get_queryset(request).prefetch_related('client_links__supplier')
+        links = SupplierLink.objects.select_related('supplier').only('client_id', 'debt', 'supplier__name')
+        return super().get_queryset(request).prefetch_related(Prefetch('client_links', queryset=links))
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class NetworkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.network'
+
+    def ready(self):
+        """
+        Подключаем сигналы, которые поддерживают денормализованные данные иерархии.
+        """
+        import apps.network.signals  # noqa
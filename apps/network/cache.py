@@ -0,0 +1,61 @@
+"""
+Поколения (generation) кэша ответов API по узлам сети.
+
+Ключи кэшированных ответов и ETag списков включают токены поколений: общего,
+коллекции узлов или продуктов и (для детального ответа) конкретного узла. Запись в сеть не удаляет ответы,
+а выдает затронутым поколениям новые токены, после чего старые ключи больше
+не запрашиваются и вытесняются по TTL. Так инвалидация не требует перебора ключей
+и одинаково работает с локальной памятью, Redis и Memcached.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+GLOBAL_KEY = 'network:gen:all'
+COLLECTION_KEY = 'network:gen:nodes'
+PRODUCTS_KEY = 'network:gen:products'
+
+
+def node_key(node_id):
+    return f'network:gen:node:{node_id}'
+
+
+def get_generations(keys):
+    """Возвращает токены поколений для ключей; отсутствующие (в том числе вытесненные) создаются заново."""
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # Новый случайный токен, а не значение по умолчанию: ответы, сохраненные
+            # под вытесненным поколением, не должны снова стать актуальными.
+            token = uuid.uuid4().hex
+            values[key] = token if cache.add(key, token, None) else cache.get(key, token)
+    return [values[key] for key in keys]
+
+
+def _bump(keys):
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+def _bump_twice(keys):
+    # Первая смена - сразу, вторая - после фиксации транзакции: ответ, прочитанный
+    # конкурентным запросом до фиксации и сохраненный под промежуточным токеном, не переживет commit.
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def invalidate_nodes(node_ids):
+    """Инвалидирует ответы по указанным узлам и все списки узлов."""
+    keys = {node_key(node_id) for node_id in node_ids if node_id is not None}
+    if keys:
+        _bump_twice(keys | {COLLECTION_KEY})
+
+
+def invalidate_all():
+    """Инвалидирует все ответы по узлам (массовые пересчеты, загрузка данных)."""
+    _bump_twice({GLOBAL_KEY})
+
+
+def invalidate_products():
+    """Инвалидирует списки продуктов (ответы узлов с продуктом инвалидируются через invalidate_nodes)."""
+    _bump_twice({PRODUCTS_KEY})
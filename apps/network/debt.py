@@ -0,0 +1,116 @@
+"""
+Массовые операции с задолженностью по связям поставщик-клиент.
+
+Каждая операция - один запрос PostgreSQL на любое число связей: блокировка выбранных
+связей, UPDATE ... RETURNING новых значений и INSERT ... SELECT строк журнала
+DebtOperation из возвращенных строк. Связи без изменения долга не обновляются
+и в журнал не попадают. Затем суммы долга узлов корректируются через
+hierarchy.apply_debt_changes() (сигналы SupplierLink при массовом UPDATE не вызываются).
+
+Связи передаются queryset'ом и попадают в запрос подзапросом, без выгрузки ID в Python.
+"""
+import logging
+import uuid
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import DataError, connections, router, transaction
+from django.db.models import Q
+
+from . import hierarchy
+from .models import DebtOperation, SupplierLink
+
+business_logger = logging.getLogger('business')
+
+LINK_TABLE = SupplierLink._meta.db_table
+AUDIT_TABLE = DebtOperation._meta.db_table
+
+# Текст записи в бизнес-логе; 'очистил задолженность' учитывает log_analyzer (событие debt_cleared).
+_LOG_ACTIONS = {
+    DebtOperation.Kind.CLEAR: 'очистил задолженность',
+    DebtOperation.Kind.ADJUST: 'изменил задолженность на процент',
+    DebtOperation.Kind.TRANSFER: 'перенес задолженность',
+}
+
+# Пределы процента изменения: долг не может стать отрицательным.
+MIN_PERCENT = Decimal(-100)
+MAX_PERCENT = Decimal(1000)
+
+
+def _operation_sql(selection, new_debt):
+    """
+    selection - подзапрос с ID связей, new_debt - выражение нового долга
+    по колонкам id и debt заблокированных связей (CTE selected).
+    """
+    return f"""
+        WITH selected AS (
+            SELECT id, debt FROM {LINK_TABLE} WHERE id IN ({selection}) ORDER BY id FOR UPDATE
+        ), planned AS (
+            SELECT id, debt AS old_debt, {new_debt} AS new_debt FROM selected
+        ), changed AS (
+            UPDATE {LINK_TABLE} AS l
+            SET debt = p.new_debt, version = l.version + 1, updated_at = now()
+            FROM planned AS p
+            WHERE l.id = p.id AND p.new_debt <> p.old_debt
+            RETURNING l.supplier_id, l.client_id, p.old_debt, p.new_debt
+        ), audit AS (
+            INSERT INTO {AUDIT_TABLE} (batch, kind, supplier_id, client_id, old_debt, new_debt, user_id, created_at)
+            SELECT %s, %s, supplier_id, client_id, old_debt, new_debt, %s, now() FROM changed
+        )
+        SELECT supplier_id, client_id, new_debt - old_debt FROM changed
+    """
+
+
+def _run(kind, links, new_debt, new_debt_params, user):
+    """Выполняет операцию и пересчитывает суммы. Возвращает (batch, изменения связей)."""
+    batch = uuid.uuid4()
+    selection, selection_params = links.order_by().values('pk').query.sql_with_params()
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    # Алиас через роутер: сырой SQL иначе не отмечает запись, и клиент не закрепляется за основной БД.
+    using = router.db_for_write(SupplierLink)
+    try:
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    _operation_sql(selection, new_debt),
+                    [*selection_params, *new_debt_params, batch, kind.value, user_id],
+                )
+                changes = cursor.fetchall()
+            changed_ids = hierarchy.apply_debt_changes(changes)
+            # Список связей клиента входит в его представление в API, даже если сумма долга не изменилась.
+            hierarchy.touch_nodes({client_id for _, client_id, _ in changes} - changed_ids)
+    except DataError as error:
+        raise ValidationError("Новая задолженность выходит за допустимые пределы.") from error
+
+    username = user.username if user_id else 'system'
+    total = sum((delta for _, _, delta in changes), Decimal(0))
+    business_logger.info(
+        f"Пользователь '{username}' {_LOG_ACTIONS[kind]} (операция {batch}): "
+        f"изменено связей {len(changes)}, общее изменение {total}."
+    )
+    return batch, changes
+
+
+def clear(links, user=None):
+    """Обнуляет задолженность связей."""
+    return _run(DebtOperation.Kind.CLEAR, links, '0', [], user)
+
+
+def adjust(links, percent, user=None):
+    """Изменяет задолженность связей на percent процентов (с округлением до копеек)."""
+    percent = Decimal(percent)
+    if not MIN_PERCENT <= percent <= MAX_PERCENT:
+        raise ValidationError(f"Процент изменения должен быть от {MIN_PERCENT} до {MAX_PERCENT}.")
+    return _run(DebtOperation.Kind.ADJUST, links, 'ROUND(debt * (100 + %s) / 100, 2)', [percent], user)
+
+
+def transfer(links, target, user=None):
+    """
+    Переносит всю задолженность связей links на связь target того же клиента
+    (смена кредитора): долг исходных связей обнуляется, у target увеличивается на их сумму.
+    """
+    selection = SupplierLink.objects.filter(Q(pk__in=links.values('pk')) | Q(pk=target.pk))
+    if selection.exclude(client_id=target.client_id).exists():
+        raise ValidationError("Задолженность переносится только между связями одного клиента.")
+    new_debt = 'CASE WHEN id = %s THEN debt + (SELECT COALESCE(SUM(debt), 0) FROM selected WHERE id <> %s) ELSE 0 END'
+    return _run(DebtOperation.Kind.TRANSFER, selection, new_debt, [target.pk, target.pk], user)
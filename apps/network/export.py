@@ -0,0 +1,114 @@
+"""
+Потоковая выгрузка сети поставок в NDJSON и CSV.
+
+Узлы читаются серверным курсором (QuerySet.iterator) пачками по chunk_size,
+продукты и поставщики подгружаются одним запросом на пачку. В памяти в каждый
+момент находится только одна пачка, поэтому расход памяти не зависит от размера таблицы.
+Используется эндпоинтом /api/v1/nodes/export/ и командой export_network.
+"""
+import csv
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import NetworkNode, SupplierLink
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+FORMATS = (NDJSON, CSV)
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson; charset=utf-8',
+    CSV: 'text/csv; charset=utf-8',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+NODE_COLUMNS = (
+    'id', 'name', 'node_type', 'email', 'country', 'city', 'street', 'house_number', 'level', 'created_at',
+)
+CSV_HEADER = NODE_COLUMNS + ('products', 'suppliers')
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_node_records(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Генерирует словари узлов со списком ID продуктов и поставщиков (с долгом по связи).
+
+    queryset позволяет выгрузить отфильтрованную выборку; по умолчанию - все узлы по ID.
+    Продукты и поставщики читаются из той же БД, что и узлы.
+    """
+    if queryset is None:
+        queryset = NetworkNode.objects.order_by('id')
+    rows = queryset.values(*NODE_COLUMNS).iterator(chunk_size=chunk_size)
+    through = NetworkNode.products.through
+
+    for batch in _batches(rows, chunk_size):
+        ids = [row['id'] for row in batch]
+
+        products = defaultdict(list)
+        for node_id, product_id in (
+            through.objects.using(queryset.db).filter(networknode_id__in=ids)
+            .order_by('networknode_id', 'product_id')
+            .values_list('networknode_id', 'product_id')
+        ):
+            products[node_id].append(product_id)
+
+        suppliers = defaultdict(list)
+        for client_id, supplier_id, debt in (
+            SupplierLink.objects.using(queryset.db).filter(client_id__in=ids)
+            .order_by('client_id', 'supplier_id')
+            .values_list('client_id', 'supplier_id', 'debt')
+        ):
+            suppliers[client_id].append({'supplier_id': supplier_id, 'debt': debt})
+
+        for row in batch:
+            row['products'] = products.get(row['id'], [])
+            row['suppliers'] = suppliers.get(row['id'], [])
+            yield row
+
+
+def iter_ndjson(records):
+    """Одна строка JSON на узел."""
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку вместо буферизации."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(records):
+    """
+    CSV с заголовком. Продукты - ID через ';', поставщики - пары 'ID:долг' через ';'.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for record in records:
+        yield writer.writerow(
+            [record[column] for column in NODE_COLUMNS] + [
+                ';'.join(str(product_id) for product_id in record['products']),
+                ';'.join(f"{link['supplier_id']}:{link['debt']}" for link in record['suppliers']),
+            ]
+        )
+
+
+def stream(export_format, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Возвращает генератор строк выгрузки в указанном формате."""
+    records = iter_node_records(queryset, chunk_size)
+    if export_format == CSV:
+        return iter_csv(records)
+    return iter_ndjson(records)
@@ -0,0 +1,143 @@
+"""
+Генерация синтетической сети поставок для нагрузочных тестов и бенчмарков.
+
+Граф строится по уровням: на уровне 0 - заводы, у каждого узла следующего уровня
+основной поставщик на предыдущем уровне (не больше fanout клиентов у поставщика)
+и с вероятностью multi_supplier_ratio - дополнительный поставщик с любого более
+высокого уровня, поэтому граф остается ацикличным. Генерация детерминирована при
+одинаковом seed. Строки вставляются через bulk_create пачками, после чего таблица
+замыкания, уровни и суммы долга перестраиваются целиком.
+"""
+import random
+from dataclasses import dataclass
+from decimal import Decimal
+
+from . import hierarchy
+from .models import NetworkNode, SupplierLink
+
+COUNTRIES = ('Россия', 'Беларусь', 'Казахстан', 'Армения', 'Узбекистан')
+CITIES = ('Москва', 'Минск', 'Алматы', 'Ереван', 'Ташкент', 'Казань', 'Новосибирск', 'Самара')
+
+
+@dataclass
+class GraphShape:
+    """Параметры формы графа."""
+    nodes: int
+    depth: int
+    fanout: int
+    multi_supplier_ratio: float = 0.0
+
+    def layer_sizes(self):
+        """Размеры уровней: корни рассчитываются так, чтобы при данном fanout хватило узлов на depth уровней."""
+        capacity = sum(self.fanout ** level for level in range(self.depth + 1))
+        roots = max(1, -(-self.nodes // capacity))
+        sizes, remaining, size = [], self.nodes, roots
+        for _ in range(self.depth + 1):
+            if remaining <= 0:
+                break
+            size = min(size, remaining)
+            sizes.append(size)
+            remaining -= size
+            size *= self.fanout
+        if remaining > 0:
+            sizes[-1] += remaining
+        return sizes
+
+
+# Формы графа для бенчмарков: широкий (один завод и все клиенты), глубокий (цепочка)
+# и многоуровневый со множественными поставщиками.
+SHAPES = {
+    'wide': lambda nodes: GraphShape(nodes=nodes, depth=1, fanout=max(1, nodes - 1)),
+    'deep': lambda nodes: GraphShape(nodes=nodes, depth=max(0, nodes - 1), fanout=1),
+    'dag': lambda nodes: GraphShape(nodes=nodes, depth=4, fanout=4, multi_supplier_ratio=0.5),
+}
+
+
+def _node_type(level):
+    if level == 0:
+        return NetworkNode.NodeType.FACTORY
+    if level == 1:
+        return NetworkNode.NodeType.RETAIL
+    return NetworkNode.NodeType.ENTREPRENEUR
+
+
+def default_node_fields(rng, level, number, tag):
+    """Быстрые адресные поля узла без внешних генераторов."""
+    return {
+        'name': f"Узел {tag}-{number}",
+        'country': rng.choice(COUNTRIES),
+        'city': rng.choice(CITIES),
+        'street': "Тестовая",
+        'house_number': str(number % 200 + 1),
+    }
+
+
+def generate_network(shape, seed=0, chunk_size=5000, tag='seed', stdout=None,
+                     node_fields=default_node_fields, product_ids=(), products_per_node=(0, 0),
+                     debt_range=(0, 10000)):
+    """
+    Создает узлы и связи по форме shape и перестраивает данные иерархии.
+
+    tag входит в email узлов, чтобы повторная генерация не конфликтовала с уже
+    существующими узлами. node_fields(rng, level, number, tag) возвращает название
+    и адрес узла; каждому узлу назначается случайное число продуктов из product_ids
+    в пределах products_per_node. Возвращает список ID узлов по уровням.
+    """
+    rng = random.Random(seed)
+    product_ids = list(product_ids)
+    through = NetworkNode.products.through
+    layers = []
+    number = 0
+    for level, size in enumerate(shape.layer_sizes()):
+        ids = []
+        for start in range(0, size, chunk_size):
+            batch = []
+            for _ in range(min(chunk_size, size - start)):
+                batch.append(NetworkNode(
+                    node_type=_node_type(level), email=f"{tag}-{number}@example.com",
+                    **node_fields(rng, level, number, tag),
+                ))
+                number += 1
+            created = [node.pk for node in NetworkNode.objects.bulk_create(batch)]
+            ids.extend(created)
+            if product_ids:
+                through.objects.bulk_create([
+                    through(networknode_id=node_id, product_id=product_id)
+                    for node_id in created
+                    for product_id in rng.sample(
+                        product_ids, min(len(product_ids), rng.randint(*products_per_node))
+                    )
+                ], batch_size=chunk_size)
+        layers.append(ids)
+        if stdout:
+            stdout.write(f"Уровень {level}: {len(ids)} узлов.")
+
+    links = 0
+    for level in range(1, len(layers)):
+        parents, links_batch = layers[level - 1], []
+        for index, client_id in enumerate(layers[level]):
+            # Список, а не множество: порядок выдачи долгов не должен зависеть от значений ID.
+            supplier_ids = [parents[min(index // max(1, shape.fanout), len(parents) - 1)]]
+            if rng.random() < shape.multi_supplier_ratio:
+                donor_layer = layers[rng.randrange(level)]
+                extra_id = donor_layer[rng.randrange(len(donor_layer))]
+                if extra_id not in supplier_ids:
+                    supplier_ids.append(extra_id)
+            for supplier_id in supplier_ids:
+                links_batch.append(SupplierLink(
+                    supplier_id=supplier_id, client_id=client_id,
+                    debt=Decimal(rng.randrange(debt_range[0] * 100, debt_range[1] * 100 + 1)) / 100,
+                ))
+            if len(links_batch) >= chunk_size:
+                SupplierLink.objects.bulk_create(links_batch)
+                links += len(links_batch)
+                links_batch = []
+        SupplierLink.objects.bulk_create(links_batch)
+        links += len(links_batch)
+    if stdout:
+        stdout.write(f"Создано связей: {links}.")
+
+    # bulk_create не вызывает сигналы, поэтому данные иерархии перестраиваются целиком.
+    hierarchy.rebuild_closure()
+    hierarchy.rebuild_debt_rollups()
+    return layers
@@ -0,0 +1,501 @@
+"""
+Поддержка денормализованных данных иерархии сети поставщиков.
+
+Функции модуля вызываются из сигналов SupplierLink (apps/network/signals.py)
+и пересчитывают только затронутую часть графа, а не всю сеть.
+Запросы написаны на SQL PostgreSQL, так как проект работает только с этой СУБД.
+Узлы, чьи сохраненные значения изменились, инвалидируются в кэше ответов API.
+"""
+from collections import deque
+
+from django.db import connection, transaction
+
+from . import cache
+from .models import NetworkNode, SupplierClosure, SupplierLink
+
+NODE_TABLE = NetworkNode._meta.db_table
+LINK_TABLE = SupplierLink._meta.db_table
+CLOSURE_TABLE = SupplierClosure._meta.db_table
+
+# Все пути, которые появляются (или исчезают) вместе со связью supplier -> client:
+# каждый путь "предок -> supplier" склеивается с каждым путем "client -> потомок".
+# Пути через саму связь в этих множествах отсутствуют, так как граф ацикличен,
+# поэтому запрос дает одинаковый результат до и после изменения связи.
+_PATHS_THROUGH_LINK_SQL = f"""
+    WITH up AS (
+        SELECT %(supplier)s::bigint AS node_id, 0 AS depth, 1::bigint AS paths
+        UNION ALL
+        SELECT ancestor_id, depth, paths FROM {CLOSURE_TABLE} WHERE descendant_id = %(supplier)s
+    ), down AS (
+        SELECT %(client)s::bigint AS node_id, 0 AS depth, 1::bigint AS paths
+        UNION ALL
+        SELECT descendant_id, depth, paths FROM {CLOSURE_TABLE} WHERE ancestor_id = %(client)s
+    )
+    SELECT up.node_id, down.node_id, up.depth + down.depth + 1, SUM(up.paths * down.paths)
+    FROM up CROSS JOIN down
+    GROUP BY up.node_id, down.node_id, up.depth + down.depth + 1
+"""
+
+_ADD_PATHS_SQL = f"""
+    INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth, paths)
+    {_PATHS_THROUGH_LINK_SQL}
+    ON CONFLICT (ancestor_id, descendant_id, depth)
+    DO UPDATE SET paths = {CLOSURE_TABLE}.paths + EXCLUDED.paths
+"""
+
+# Строки, у которых пропадают все пути, удаляются, у остальных уменьшается счетчик.
+# Множества строк не пересекаются, поэтому оба изменения безопасно выполнять одним запросом.
+_REMOVE_PATHS_SQL = f"""
+    WITH delta (ancestor_id, descendant_id, depth, paths) AS ({_PATHS_THROUGH_LINK_SQL}),
+    removed AS (
+        DELETE FROM {CLOSURE_TABLE} AS c USING delta AS d
+        WHERE c.ancestor_id = d.ancestor_id AND c.descendant_id = d.descendant_id
+          AND c.depth = d.depth AND c.paths <= d.paths
+        RETURNING c.id
+    )
+    UPDATE {CLOSURE_TABLE} AS c SET paths = c.paths - d.paths
+    FROM delta AS d
+    WHERE c.ancestor_id = d.ancestor_id AND c.descendant_id = d.descendant_id
+      AND c.depth = d.depth AND c.paths > d.paths
+"""
+
+# Любое изменение строки узла увеличивает ее версию (ETag в API, см. VersionedModel).
+_TOUCH_SQL = "version = n.version + 1, updated_at = now()"
+
+# Уровень узла - длина самого длинного пути от вершины иерархии,
+# то есть максимальная глубина среди строк замыкания, где узел является потомком.
+_NEW_LEVEL_SQL = f"""
+    COALESCE((SELECT MAX(c.depth) FROM {CLOSURE_TABLE} AS c WHERE c.descendant_id = n.id), 0)
+"""
+
+_UPDATE_LEVELS_SQL = f"""
+    UPDATE {NODE_TABLE} AS n SET level = {_NEW_LEVEL_SQL}, {_TOUCH_SQL}
+    WHERE (
+        n.id = ANY(%(node_ids)s)
+        OR n.id IN (SELECT descendant_id FROM {CLOSURE_TABLE} WHERE ancestor_id = ANY(%(node_ids)s))
+    ) AND n.level <> {_NEW_LEVEL_SQL}
+    RETURNING n.id
+"""
+
+
+def link_added(supplier_id, client_id):
+    """Добавляет в замыкание все пути, проходящие через новую связь."""
+    with connection.cursor() as cursor:
+        cursor.execute(_ADD_PATHS_SQL, {'supplier': supplier_id, 'client': client_id})
+
+
+# Пути до узла (вниз) или от узла (вверх) по существующему замыканию, включая пустой путь.
+def _old_paths_sql(node, direction):
+    other, own = ('ancestor_id', 'descendant_id') if direction == UPSTREAM else ('descendant_id', 'ancestor_id')
+    return f"""
+        SELECT {node} AS node_id, 0 AS depth, 1::bigint AS paths
+        UNION ALL
+        SELECT {other}, depth, paths FROM {CLOSURE_TABLE} WHERE {own} = {node}
+    """
+
+
+_NEW_LINKS_SQL = "unnest(%(suppliers)s::bigint[], %(clients)s::bigint[]) AS e(supplier_id, client_id)"
+_FRONT_TABLE = 'network_closure_front'
+
+
+def links_added(links):
+    """
+    Добавляет в замыкание все пути через пакет новых связей (supplier_id, client_id).
+
+    Связи пакета могут образовывать цепочки, поэтому новый путь разбивается по последней
+    новой связи на "фронт" (путь, оканчивающийся новой связью) и старый хвост.
+    Фронты строятся по шагам (шаг - число новых связей в пути) с группировкой
+    во временной таблице, как в rebuild_closure(); шагов столько, какова самая длинная
+    цепочка новых связей, а не сколько связей в пакете. Замыкание до вызова
+    не должно содержать путей через эти связи.
+    """
+    links = list(links)
+    if not links:
+        return
+    params = {
+        'suppliers': [supplier_id for supplier_id, _ in links], 'clients': [client_id for _, client_id in links],
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE {_FRONT_TABLE} (step int, ancestor_id bigint, node_id bigint, depth int, paths bigint)"
+        )
+        cursor.execute(f"""
+            INSERT INTO {_FRONT_TABLE}
+            SELECT 1, up.node_id, e.client_id, up.depth + 1, SUM(up.paths)
+            FROM {_NEW_LINKS_SQL}
+            CROSS JOIN LATERAL ({_old_paths_sql('e.supplier_id', UPSTREAM)}) AS up
+            GROUP BY up.node_id, e.client_id, up.depth
+        """, params)
+        step = 1
+        while cursor.rowcount:
+            cursor.execute(f"""
+                INSERT INTO {_FRONT_TABLE}
+                SELECT %(step)s + 1, f.ancestor_id, e.client_id, f.depth + mid.depth + 1, SUM(f.paths * mid.paths)
+                FROM {_FRONT_TABLE} AS f
+                CROSS JOIN LATERAL ({_old_paths_sql('f.node_id', DOWNSTREAM)}) AS mid
+                JOIN {_NEW_LINKS_SQL} ON e.supplier_id = mid.node_id
+                WHERE f.step = %(step)s
+                GROUP BY f.ancestor_id, e.client_id, f.depth + mid.depth
+            """, {**params, 'step': step})
+            step += 1
+        cursor.execute(f"""
+            INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth, paths)
+            SELECT f.ancestor_id, down.node_id, f.depth + down.depth, SUM(f.paths * down.paths)
+            FROM {_FRONT_TABLE} AS f
+            CROSS JOIN LATERAL ({_old_paths_sql('f.node_id', DOWNSTREAM)}) AS down
+            GROUP BY f.ancestor_id, down.node_id, f.depth + down.depth
+            ON CONFLICT (ancestor_id, descendant_id, depth)
+            DO UPDATE SET paths = {CLOSURE_TABLE}.paths + EXCLUDED.paths
+        """)
+        cursor.execute(f"DROP TABLE {_FRONT_TABLE}")
+
+
+def link_removed(supplier_id, client_id):
+    """Удаляет из замыкания все пути, проходившие через удаленную связь."""
+    with connection.cursor() as cursor:
+        cursor.execute(_REMOVE_PATHS_SQL, {'supplier': supplier_id, 'client': client_id})
+
+
+def forget_node(node_id):
+    """
+    Удаляет строки замыкания удаленного узла.
+
+    Обычно к этому моменту их уже нет: связи узла удаляются раньше него,
+    и их сигналы убирают все пути. Вызов страхует от связей, удаленных в обход ORM.
+    """
+    SupplierClosure.objects.filter(ancestor_id=node_id).delete()
+    SupplierClosure.objects.filter(descendant_id=node_id).delete()
+
+
+def creates_cycle(supplier_id, client_id):
+    """Проверяет, создаст ли связь supplier -> client цикл в графе поставок."""
+    if supplier_id == client_id:
+        return True
+    return SupplierClosure.objects.filter(ancestor_id=client_id, descendant_id=supplier_id).exists()
+
+
+def update_levels(node_ids):
+    """
+    Пересчитывает уровни указанных узлов и всех их потомков одним запросом.
+
+    Замыкание должно быть уже актуальным. Возвращает множество ID узлов,
+    уровень которых изменился.
+    """
+    node_ids = [node_id for node_id in set(node_ids) if node_id is not None]
+    if not node_ids:
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(_UPDATE_LEVELS_SQL, {'node_ids': node_ids})
+        changed_ids = {row[0] for row in cursor.fetchall()}
+    cache.invalidate_nodes(changed_ids)
+    return changed_ids
+
+
+def touch_nodes(node_ids):
+    """
+    Отмечает узлы измененными (версия, время изменения, кэш ответов API).
+
+    Нужна, когда меняется представление узла без изменения его собственных полей:
+    набор продуктов, связи с поставщиками, вложенные продукты.
+    """
+    node_ids = [node_id for node_id in set(node_ids) if node_id is not None]
+    if not node_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {NODE_TABLE} AS n SET {_TOUCH_SQL} WHERE n.id = ANY(%(node_ids)s)", {
+            'node_ids': node_ids,
+        })
+    cache.invalidate_nodes(node_ids)
+
+
+def rebuild_closure():
+    """
+    Полностью перестраивает таблицу замыкания и уровни по текущим связям.
+
+    Пути наращиваются по одному ребру за шаг с группировкой, поэтому число строк
+    на шаге ограничено числом пар узлов, а не числом путей в графе.
+    Возвращает количество строк замыкания.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {CLOSURE_TABLE}")
+        cursor.execute(f"""
+            INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth, paths)
+            SELECT supplier_id, client_id, 1, 1 FROM {LINK_TABLE}
+        """)
+        total = inserted = cursor.rowcount
+        depth = 1
+        max_depth = NetworkNode.objects.count()
+        while inserted:
+            if depth > max_depth:
+                raise ValueError("Граф поставок содержит цикл, построить замыкание невозможно.")
+            cursor.execute(f"""
+                INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth, paths)
+                SELECT c.ancestor_id, l.client_id, c.depth + 1, SUM(c.paths)
+                FROM {CLOSURE_TABLE} AS c
+                JOIN {LINK_TABLE} AS l ON l.supplier_id = c.descendant_id
+                WHERE c.depth = %s
+                GROUP BY c.ancestor_id, l.client_id, c.depth
+            """, [depth])
+            inserted = cursor.rowcount
+            total += inserted
+            depth += 1
+
+        cursor.execute(f"""
+            UPDATE {NODE_TABLE} AS n SET level = {_NEW_LEVEL_SQL}, {_TOUCH_SQL} WHERE n.level <> {_NEW_LEVEL_SQL}
+        """)
+    cache.invalidate_all()
+    return total
+
+
+# --- Сводные суммы задолженности ---
+# Прямые суммы (debt_to_suppliers, debt_from_clients) - по связям самого узла.
+# Суммы по поддереву - по узлу и всем его потомкам из таблицы замыкания.
+# Долг связи входит в debt_to_suppliers клиента и в debt_from_clients поставщика.
+_CLIENT_SIDE = ('debt_to_suppliers', 'subtree_debt_to_suppliers')
+_SUPPLIER_SIDE = ('debt_from_clients', 'subtree_debt_from_clients')
+
+
+def _debt_delta_sql(direct, subtree):
+    """
+    Прибавляет изменения долга к прямой сумме узла и к суммам по поддереву
+    самого узла и всех его предков. UNION убирает повторы предков,
+    достижимых по нескольким путям, поэтому каждый предок учитывает изменение один раз.
+    """
+    return f"""
+        WITH delta (node_id, amount) AS (
+            SELECT * FROM unnest(%(node_ids)s::bigint[], %(amounts)s::numeric[])
+        ), targets AS (
+            SELECT node_id AS target_id, node_id AS source_id FROM delta
+            UNION
+            SELECT c.ancestor_id, c.descendant_id
+            FROM {CLOSURE_TABLE} AS c JOIN delta AS d ON c.descendant_id = d.node_id
+        ), totals AS (
+            SELECT t.target_id,
+                   SUM(CASE WHEN t.target_id = t.source_id THEN d.amount ELSE 0 END) AS direct,
+                   SUM(d.amount) AS subtree
+            FROM targets AS t JOIN delta AS d ON d.node_id = t.source_id
+            GROUP BY t.target_id
+        )
+        UPDATE {NODE_TABLE} AS n
+        SET {direct} = n.{direct} + totals.direct, {subtree} = n.{subtree} + totals.subtree, {_TOUCH_SQL}
+        FROM totals
+        WHERE n.id = totals.target_id AND (totals.direct <> 0 OR totals.subtree <> 0)
+        RETURNING n.id
+    """
+
+
+def _recompute_subtree_debts_sql(targets):
+    """Пересчитывает суммы по поддереву для узлов из подзапроса targets (колонка id)."""
+    return f"""
+        WITH targets AS ({targets}),
+        totals AS (
+            SELECT t.id,
+                   COALESCE(SUM(d.debt_to_suppliers), 0) AS owed,
+                   COALESCE(SUM(d.debt_from_clients), 0) AS receivable
+            FROM targets AS t
+            LEFT JOIN LATERAL (
+                SELECT DISTINCT descendant_id FROM {CLOSURE_TABLE} WHERE ancestor_id = t.id
+            ) AS dd ON TRUE
+            LEFT JOIN {NODE_TABLE} AS d ON d.id = dd.descendant_id
+            GROUP BY t.id
+        )
+        UPDATE {NODE_TABLE} AS n
+        SET subtree_debt_to_suppliers = n.debt_to_suppliers + totals.owed,
+            subtree_debt_from_clients = n.debt_from_clients + totals.receivable,
+            {_TOUCH_SQL}
+        FROM totals
+        WHERE n.id = totals.id AND (
+            n.subtree_debt_to_suppliers <> n.debt_to_suppliers + totals.owed
+            OR n.subtree_debt_from_clients <> n.debt_from_clients + totals.receivable
+        )
+        RETURNING n.id
+    """
+
+
+def _sum_by_node(changes, side):
+    """Суммирует изменения (supplier_id, client_id, delta) по клиентам или поставщикам, в зависимости от стороны."""
+    totals = {}
+    for change in changes:
+        node_id = change[1] if side is _CLIENT_SIDE else change[0]
+        totals[node_id] = totals.get(node_id, 0) + change[2]
+    return {node_id: amount for node_id, amount in totals.items() if amount}
+
+
+def apply_debt_changes(changes):
+    """
+    Инкрементально применяет изменения долга на существующих связях.
+
+    changes - итерируемое из (supplier_id, client_id, delta). Структура графа
+    не меняется, поэтому достаточно прибавить разницу к затронутым суммам:
+    два запроса на любое количество связей. Возвращает ID измененных узлов.
+    """
+    changes = list(changes)
+    changed_ids = set()
+    with connection.cursor() as cursor:
+        for side in (_CLIENT_SIDE, _SUPPLIER_SIDE):
+            totals = _sum_by_node(changes, side)
+            if not totals:
+                continue
+            cursor.execute(_debt_delta_sql(*side), {
+                'node_ids': list(totals), 'amounts': list(totals.values()),
+            })
+            changed_ids.update(row[0] for row in cursor.fetchall())
+    cache.invalidate_nodes(changed_ids)
+    return changed_ids
+
+
+def relink_debts(changes):
+    """
+    Учитывает долг добавленных (delta > 0) или удаленных (delta < 0) связей.
+
+    В отличие от apply_debt_changes() меняется и структура графа, поэтому прямые
+    суммы сдвигаются на delta, а суммы по поддереву пересчитываются для концов
+    связей и всех их предков. Замыкание должно быть уже актуальным.
+    """
+    changes = list(changes)
+    with connection.cursor() as cursor:
+        for side in (_CLIENT_SIDE, _SUPPLIER_SIDE):
+            totals = _sum_by_node(changes, side)
+            if not totals:
+                continue
+            cursor.execute(f"""
+                UPDATE {NODE_TABLE} AS n SET {side[0]} = n.{side[0]} + d.amount
+                FROM unnest(%(node_ids)s::bigint[], %(amounts)s::numeric[]) AS d(node_id, amount)
+                WHERE n.id = d.node_id
+            """, {'node_ids': list(totals), 'amounts': list(totals.values())})
+    node_ids = {change[0] for change in changes} | {change[1] for change in changes}
+    # У концов связей изменился список связей, даже если суммы остались прежними.
+    touch_nodes(node_ids)
+    return recompute_subtree_debts(node_ids)
+
+
+def recompute_subtree_debts(node_ids):
+    """Пересчитывает суммы по поддереву указанных узлов и всех их предков."""
+    node_ids = [node_id for node_id in set(node_ids) if node_id is not None]
+    if not node_ids:
+        return set()
+    targets = f"""
+        SELECT id FROM unnest(%(node_ids)s::bigint[]) AS t(id)
+        UNION
+        SELECT ancestor_id FROM {CLOSURE_TABLE} WHERE descendant_id = ANY(%(node_ids)s)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_recompute_subtree_debts_sql(targets), {'node_ids': node_ids})
+        changed_ids = {row[0] for row in cursor.fetchall()}
+    cache.invalidate_nodes(changed_ids)
+    return changed_ids
+
+
+def rebuild_debt_rollups():
+    """Полностью пересчитывает все сводные суммы задолженности по текущим связям."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH totals AS (
+                SELECT n.id,
+                       COALESCE((SELECT SUM(debt) FROM {LINK_TABLE} WHERE client_id = n.id), 0) AS owed,
+                       COALESCE((SELECT SUM(debt) FROM {LINK_TABLE} WHERE supplier_id = n.id), 0) AS receivable
+                FROM {NODE_TABLE} AS n
+            )
+            UPDATE {NODE_TABLE} AS n
+            SET debt_to_suppliers = totals.owed, debt_from_clients = totals.receivable, {_TOUCH_SQL}
+            FROM totals
+            WHERE n.id = totals.id AND (n.debt_to_suppliers <> totals.owed OR n.debt_from_clients <> totals.receivable)
+        """)
+        cursor.execute(_recompute_subtree_debts_sql(f"SELECT id FROM {NODE_TABLE}"))
+    cache.invalidate_all()
+
+
+UPSTREAM = 'upstream'
+DOWNSTREAM = 'downstream'
+
+# Для цепочки вверх идем от клиента к поставщику, для цепочки вниз - наоборот.
+_CHAIN_COLUMNS = {
+    UPSTREAM: ('client_id', 'supplier_id'),
+    DOWNSTREAM: ('supplier_id', 'client_id'),
+}
+
+
+def fetch_supply_chain(node_id, direction, max_depth, node_types=None):
+    """
+    Возвращает все связи транзитивной цепочки поставок узла одним рекурсивным запросом.
+
+    direction - UPSTREAM (все поставщики) или DOWNSTREAM (все клиенты).
+    node_types ограничивает обход: через узлы других типов цепочка не продолжается.
+    UNION вместо UNION ALL схлопывает повторные пути в графах со множественными
+    поставщиками, поэтому число строк ограничено числом связей, умноженным на глубину.
+    Каждая связь возвращается один раз с минимальной глубиной, на которой она встречается.
+    """
+    near, far = _CHAIN_COLUMNS[direction]
+    params = {'node': node_id, 'max_depth': max_depth}
+    type_filter = ''
+    if node_types:
+        type_filter = 'AND n.node_type = ANY(%(node_types)s)'
+        params['node_types'] = list(node_types)
+
+    sql = f"""
+        WITH RECURSIVE chain (link_id, supplier_id, client_id, debt, depth) AS (
+            SELECT l.id, l.supplier_id, l.client_id, l.debt, 1
+            FROM {LINK_TABLE} AS l
+            JOIN {NODE_TABLE} AS n ON n.id = l.{far}
+            WHERE l.{near} = %(node)s {type_filter}
+          UNION
+            SELECT l.id, l.supplier_id, l.client_id, l.debt, c.depth + 1
+            FROM chain AS c
+            JOIN {LINK_TABLE} AS l ON l.{near} = c.{far}
+            JOIN {NODE_TABLE} AS n ON n.id = l.{far}
+            WHERE c.depth < %(max_depth)s {type_filter}
+        )
+        SELECT c.link_id, c.supplier_id, c.client_id, c.debt, MIN(c.depth) AS depth,
+               n.id, n.name, n.node_type, n.level
+        FROM chain AS c
+        JOIN {NODE_TABLE} AS n ON n.id = c.{far}
+        GROUP BY c.link_id, c.supplier_id, c.client_id, c.debt, n.id, n.name, n.node_type, n.level
+        ORDER BY depth, c.link_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {
+                'link_id': link_id,
+                'supplier_id': supplier_id,
+                'client_id': client_id,
+                'debt': str(debt),  # Как DecimalField в сериализаторах DRF.
+                'depth': depth,
+                'node': {'id': pk, 'name': name, 'node_type': node_type, 'level': level},
+            }
+            for link_id, supplier_id, client_id, debt, depth, pk, name, node_type, level in cursor.fetchall()
+        ]
+
+
+def build_supply_tree(root, edges, direction, max_depth):
+    """
+    Собирает вложенное дерево из плоского списка связей fetch_supply_chain().
+
+    Каждый узел раскрывается один раз - на минимальной глубине (обход в ширину);
+    повторные вхождения узла, достижимого по нескольким цепочкам, выводятся ссылкой
+    {..., 'ref': True} без children. Размер ответа поэтому не больше числа связей,
+    а не числа путей, которое в графах со множественными поставщиками растет экспоненциально.
+    Глубина дерева ограничена max_depth.
+    """
+    near = _CHAIN_COLUMNS[direction][0]
+    children = {}
+    for edge in edges:
+        children.setdefault(edge[near], []).append(edge)
+
+    tree = {**root, 'depth': 0, 'children': []}
+    expanded = {root['id']}
+    queue = deque([tree])
+    while queue:
+        parent = queue.popleft()
+        if parent['depth'] >= max_depth:
+            continue
+        for edge in children.get(parent['id'], []):
+            node = {**edge['node'], 'link_id': edge['link_id'], 'debt': edge['debt'], 'depth': parent['depth'] + 1}
+            if node['id'] in expanded:
+                node['ref'] = True
+            else:
+                expanded.add(node['id'])
+                node['children'] = []
+                queue.append(node)
+            parent['children'].append(node)
+    return tree
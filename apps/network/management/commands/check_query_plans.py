@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.network import query_plans
+
+
+class Command(BaseCommand):
+    """
+    Django-команда для проверки планов запросов фильтров API и админки.
+
+    Выполняет EXPLAIN (без выполнения самих запросов) для путей доступа из
+    apps/network/query_plans.access_paths() и сообщает о последовательных чтениях таблиц
+    больше порога, а также о внешних ключах без индекса. При найденных проблемах
+    завершается с ошибкой, поэтому подходит для CI на копии рабочей БД.
+    """
+    help = 'Проверяет планы запросов фильтров узлов сети на последовательные чтения больших таблиц.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='Сообщать о Seq Scan только по таблицам не меньше этого числа строк (по статистике).'
+        )
+
+    def handle(self, *args, **options):
+        problems = 0
+        for name, queryset in query_plans.access_paths():
+            scans = query_plans.find_seq_scans(queryset, options['min_rows'])
+            if not scans:
+                self.stdout.write(f"OK        {name}")
+                continue
+            problems += 1
+            details = ', '.join(f"{table} (~{rows} строк)" for table, rows in scans)
+            self.stdout.write(self.style.WARNING(f"SEQ SCAN  {name}: {details}"))
+
+        for model, field in query_plans.missing_fk_indexes():
+            problems += 1
+            self.stdout.write(self.style.WARNING(
+                f"NO INDEX  {model._meta.db_table}.{field.column} (внешний ключ {model.__name__}.{field.name})"
+            ))
+
+        if problems:
+            raise CommandError(f"Найдено проблем: {problems}.")
+        self.stdout.write(self.style.SUCCESS("Все пути доступа используют индексы."))
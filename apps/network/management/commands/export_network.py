@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from apps.network import export
+from config.routers import replica_reads
+
+
+class Command(BaseCommand):
+    """
+    Django-команда для ночной выгрузки всей сети поставок.
+
+    Узлы читаются серверным курсором пачками и пишутся в файл построчно,
+    поэтому расход памяти не зависит от размера таблиц. Чтение идет с реплики, если она настроена.
+    """
+    help = 'Выгружает узлы сети с продуктами и поставщиками в NDJSON или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default=export.NDJSON, help='Формат выгрузки.')
+        parser.add_argument('--output', default='-', help="Путь к файлу; '-' - стандартный вывод.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE, help='Размер пачки при чтении из БД.'
+        )
+
+    def handle(self, *args, **options):
+        with replica_reads():
+            self.write_export(options)
+
+    def write_export(self, options):
+        lines = export.stream(options['format'], chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Выгрузка завершена: {options['output']}, {count} строк."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.network import hierarchy
+
+
+class Command(BaseCommand):
+    """
+    Django-команда для полного пересчета денормализованных данных иерархии.
+
+    Используется для существующих баз данных, а также после массовых изменений
+    связей в обход ORM (например, загрузки дампа), когда сигналы не срабатывали.
+    """
+    help = 'Перестраивает таблицу замыкания графа поставок, уровни узлов и суммы долга по текущим связям.'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Перестроение таблицы замыкания...")
+        try:
+            with transaction.atomic():
+                rows = hierarchy.rebuild_closure()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Таблица замыкания перестроена: {rows} строк."))
+
+        self.stdout.write("Пересчет сумм задолженности...")
+        with transaction.atomic():
+            hierarchy.rebuild_debt_rollups()
+        self.stdout.write(self.style.SUCCESS("Суммы задолженности пересчитаны."))
@@ -1,141 +1,120 @@
+import random
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from faker import Faker
-import random
 
-from apps.network.models import NetworkNode, Product, SupplierLink
+from apps.network.generator import GraphShape, default_node_fields, generate_network
+from apps.network.models import DebtOperation, NetworkNode, Product, SupplierClosure, SupplierLink
+
+NAME_PREFIXES = ('Завод', 'Сеть', 'ИП')
 
 
 class Command(BaseCommand):
     """
     Django-команда для заполнения базы данных тестовыми данными.
 
-    Генерирует иерархическую структуру поставщиков с использованием единой модели NetworkNode:
-    - 3 Завода (уровень 0)
-    - 5 Розничных сетей (уровень 1), случайным образом связанных с заводами.
-    - 10 Индивидуальных предпринимателей (уровень 2), случайным образом связанных
-      с розничными сетями.
+    Генерирует иерархическую структуру поставщиков с использованием единой модели NetworkNode
+    (apps/network/generator.py): уровень 0 - заводы, уровень 1 - розничные сети, ниже -
+    индивидуальные предприниматели. Размер, глубина, ветвление и доля узлов с несколькими
+    поставщиками задаются параметрами; по умолчанию создается около 3 заводов, 6 сетей
+    и 9 ИП, как раньше.
 
-    Каждый узел сети получает случайные контакты и набор продуктов.
-    Задолженность генерируется в связях между узлами.
+    Строки вставляются через bulk_create пачками, а таблица замыкания и суммы долга
+    перестраиваются один раз в конце, поэтому загрузка миллиона узлов занимает минуты.
+    При одинаковом --seed данные совпадают.
     """
     help = 'Заполняет базу данных тестовыми иерархическими данными для модели NetworkNode.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=18, help='Число узлов сети.')
+        parser.add_argument('--depth', type=int, default=2, help='Число уровней ниже заводов.')
+        parser.add_argument('--fanout', type=int, default=2, help='Число клиентов у одного основного поставщика.')
+        parser.add_argument(
+            '--multi-supplier-ratio', type=float, default=0.0,
+            help='Доля узлов с дополнительным поставщиком с более высокого уровня (0..1).'
+        )
+        parser.add_argument('--products', type=int, default=20, help='Число продуктов.')
+        parser.add_argument('--products-per-node', type=int, default=5, help='Максимум продуктов у узла.')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер пачки bulk_create.')
+        parser.add_argument(
+            '--fast-names', action='store_true',
+            help='Не использовать Faker для названий и адресов узлов (быстрее на больших объемах).'
+        )
+
+    def handle(self, *args, **options):
+        if options['nodes'] < 1 or options['fanout'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--nodes, --fanout и --chunk-size должны быть положительными.")
+        if min(options['depth'], options['products'], options['products_per_node']) < 0:
+            raise CommandError("--depth, --products и --products-per-node не могут быть отрицательными.")
+        if not 0 <= options['multi_supplier_ratio'] <= 1:
+            raise CommandError("--multi-supplier-ratio должен быть в диапазоне от 0 до 1.")
+
+        shape = GraphShape(
+            nodes=options['nodes'], depth=options['depth'], fanout=options['fanout'],
+            multi_supplier_ratio=options['multi_supplier_ratio'],
+        )
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+
         # Используем транзакцию, чтобы гарантировать целостность данных.
         with transaction.atomic():
             self.stdout.write("Удаление старых данных...")
-            # Очищаем все модели
-            SupplierLink.objects.all().delete()
-            NetworkNode.objects.all().delete()
-            Product.objects.all().delete()
+            self.truncate()
             self.stdout.write(self.style.SUCCESS("Старые данные успешно удалены."))
 
-            fake = Faker('ru_RU')
-
-            # --- Создание Продуктов ---
             self.stdout.write("Создание продуктов...")
-            products = []
-            for _ in range(20):
-                product = Product.objects.create(
+            rng = random.Random(options['seed'])
+            products = Product.objects.bulk_create([
+                Product(
                     name=fake.word().capitalize() + " " + fake.word(),
                     model=fake.bothify(text='??-####'),
-                    release_date=fake.date_between(start_date='-5y', end_date='today')
+                    release_date=fake.date_between(start_date='-5y', end_date='today'),
                 )
-                products.append(product)
+                for _ in range(options['products'])
+            ], batch_size=options['chunk_size'])
             self.stdout.write(self.style.SUCCESS(f"Создано {len(products)} продуктов."))
 
-            # --- Создание Заводов (Уровень 0) ---
-            self.stdout.write("Создание заводов...")
-            factories = []
-            for _ in range(3):
-                factory = NetworkNode.objects.create(
-                    name=f"Завод «{fake.company()}»",
-                    node_type=NetworkNode.NodeType.FACTORY,
-                    email=fake.unique.email(),
-                    country=fake.country(),
-                    city=fake.city(),
-                    street=fake.street_name(),
-                    house_number=fake.building_number(),
-                )
-                # Добавляем заводу случайные продукты
-                factory.products.set(random.sample(products, k=random.randint(5, 15)))
-                factories.append(factory)
-            self.stdout.write(self.style.SUCCESS(f"Создано {len(factories)} заводов."))
-
-            # --- Создание Розничных сетей (Уровень 1) ---
-            self.stdout.write("Создание розничных сетей...")
-            retail_networks = []
-            if factories:
-                for _ in range(5):
-                    supplier_factory = random.choice(factories)
-                    network = NetworkNode.objects.create(
-                        name=f"Сеть «{fake.company()}»",
-                        node_type=NetworkNode.NodeType.RETAIL,
-                        email=fake.unique.email(),
-                        country=fake.country(),
-                        city=fake.city(),
-                        street=fake.street_name(),
-                        house_number=fake.building_number(),
-                    )
-                    # Создаем связь с поставщиком (заводом) и указываем долг
-                    SupplierLink.objects.create(
-                        supplier=supplier_factory,
-                        client=network,
-                        debt=fake.pydecimal(
-                            left_digits=5,
-                            right_digits=2,
-                            positive=True,
-                            min_value=1000,
-                            max_value=50000
-                        )
-                    )
-                    # Копируем некоторые продукты от поставщика
-                    supplier_products = list(supplier_factory.products.all())
-                    if supplier_products:
-                        network.products.set(random.sample(
-                            supplier_products,
-                            k=min(len(supplier_products), random.randint(3, 10))
-                        ))
-
-                    retail_networks.append(network)
-            self.stdout.write(self.style.SUCCESS(f"Создано {len(retail_networks)} розничных сетей."))
-
-            # --- Создание Индивидуальных предпринимателей (Уровень 2) ---
-            self.stdout.write("Создание индивидуальных предпринимателей...")
-            entrepreneurs = []
-            if retail_networks:
-                for _ in range(10):
-                    supplier_network = random.choice(retail_networks)
-                    ip = NetworkNode.objects.create(
-                        name=f"ИП {fake.last_name()} {fake.first_name()}",
-                        node_type=NetworkNode.NodeType.ENTREPRENEUR,
-                        email=fake.unique.email(),
-                        country=fake.country(),
-                        city=fake.city(),
-                        street=fake.street_name(),
-                        house_number=fake.building_number(),
-                    )
-                    # Создаем связь с поставщиком (розничной сетью) и указываем долг
-                    SupplierLink.objects.create(
-                        supplier=supplier_network,
-                        client=ip,
-                        debt=fake.pydecimal(
-                            left_digits=4,
-                            right_digits=2,
-                            positive=True,
-                            min_value=500,
-                            max_value=10000
-                        )
-                    )
-                    # Копируем продукты от поставщика
-                    supplier_products = list(supplier_network.products.all())
-                    if supplier_products:
-                        ip.products.set(
-                            random.sample(supplier_products, k=min(len(supplier_products), random.randint(2, 5))))
-
-                    entrepreneurs.append(ip)
-            self.stdout.write(self.style.SUCCESS(f"Создано {len(entrepreneurs)} индивидуальных предпринимателей."))
-
-        self.stdout.write(self.style.SUCCESS("\nБаза данных успешно заполнена тестовыми данными!"))
+            self.stdout.write(f"Создание сети: уровни {shape.layer_sizes()}...")
+            node_fields = default_node_fields if options['fast_names'] else self.faker_node_fields(fake)
+            layers = generate_network(
+                shape, seed=rng.randrange(2 ** 32), chunk_size=options['chunk_size'], stdout=self.stdout,
+                node_fields=node_fields, product_ids=[product.pk for product in products],
+                products_per_node=(min(1, options['products_per_node']), options['products_per_node']),
+                debt_range=(500, 50000),
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nБаза данных успешно заполнена тестовыми данными: {sum(map(len, layers))} узлов!"
+        ))
+
+    def truncate(self):
+        # delete() загружает строки и вызывает сигналы иерархии для каждой связи;
+        # на больших объемах это часы, поэтому таблицы сети очищаются одной командой.
+        # Журнал операций с долгом ссылается на узлы и очищается вместе с ними.
+        tables = [
+            DebtOperation._meta.db_table,
+            SupplierClosure._meta.db_table,
+            SupplierLink._meta.db_table,
+            NetworkNode.products.through._meta.db_table,
+            NetworkNode._meta.db_table,
+            Product._meta.db_table,
+        ]
+        with connection.cursor() as cursor:
+            # Отложенные проверки внешних ключей текущей транзакции иначе запрещают TRUNCATE.
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"TRUNCATE {', '.join(map(connection.ops.quote_name, tables))}")
+
+    @staticmethod
+    def faker_node_fields(fake):
+        def node_fields(rng, level, number, tag):
+            company = f"{fake.last_name()} {fake.first_name()}" if level > 1 else f"«{fake.company()}»"
+            return {
+                'name': f"{NAME_PREFIXES[min(level, 2)]} {company}",
+                'country': fake.country(),
+                'city': fake.city(),
+                'street': fake.street_name(),
+                'house_number': fake.building_number(),
+            }
+        return node_fields
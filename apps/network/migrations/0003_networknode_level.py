@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+def fill_levels(apps, schema_editor):
+    """Вычисляет уровни существующих узлов, двигаясь от узлов без поставщиков вниз."""
+    NetworkNode = apps.get_model('network', 'NetworkNode')
+    SupplierLink = apps.get_model('network', 'SupplierLink')
+
+    # Прежняя проверка циклов следовала только за первым поставщиком, поэтому в данных
+    # возможны циклы: без ограничения волн обход по циклу не завершается.
+    max_level = NetworkNode.objects.count()
+    level = 0
+    reached = set()
+    frontier = set(
+        NetworkNode.objects.filter(client_links__isnull=True).values_list('pk', flat=True)
+    )
+    while frontier:
+        if level > max_level:
+            raise ValueError(
+                "Граф поставок содержит цикл, вычислить уровни невозможно. "
+                f"Узлы на цикле или ниже него: {sorted(frontier)[:20]}. Удалите связи цикла и повторите миграцию."
+            )
+        # Узел получает уровень последней волны, в которой он был достигнут,
+        # то есть длину самого длинного пути от вершины иерархии.
+        NetworkNode.objects.filter(pk__in=frontier).update(level=level)
+        reached |= frontier
+        frontier = set(
+            SupplierLink.objects.filter(supplier_id__in=frontier).values_list('client_id', flat=True)
+        )
+        level += 1
+
+    # Узлы цикла без вершины иерархии (и их клиенты) не достигаются ни одной волной.
+    unreached = set(SupplierLink.objects.values_list('client_id', flat=True)) - reached
+    if unreached:
+        raise ValueError(
+            "Граф поставок содержит цикл без узла верхнего уровня, вычислить уровни невозможно. "
+            f"Узлы на цикле или ниже него: {sorted(unreached)[:20]}. Удалите связи цикла и повторите миграцию."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0002_auto_20251027_1806'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='level',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Уровень иерархии'),
+        ),
+        migrations.RunPython(fill_levels, migrations.RunPython.noop),
+    ]
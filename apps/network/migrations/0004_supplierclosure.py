@@ -0,0 +1,88 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_closure(apps, schema_editor):
+    """
+    Строит замыкание по существующим связям, наращивая пути на одно ребро за шаг.
+
+    Цикл в прежних данных (проверка при сохранении раньше следовала только за первым
+    поставщиком) дает строку с ancestor = descendant на шаге, равном длине цикла:
+    миграция прерывается с перечнем связей цикла, а не строит замыкание до глубины N.
+    """
+    SupplierLink = apps.get_model('network', 'SupplierLink')
+    SupplierClosure = apps.get_model('network', 'SupplierClosure')
+    closure = SupplierClosure._meta.db_table
+    link = SupplierLink._meta.db_table
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {closure} (ancestor_id, descendant_id, depth, paths) "
+            f"SELECT supplier_id, client_id, 1, 1 FROM {link}"
+        )
+        inserted = cursor.rowcount
+        depth = 1
+        while inserted:
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {closure} WHERE depth = %s AND ancestor_id = descendant_id)", [depth]
+            )
+            if cursor.fetchone()[0]:
+                _raise_cycle(cursor, closure, link)
+            cursor.execute(
+                f"INSERT INTO {closure} (ancestor_id, descendant_id, depth, paths) "
+                f"SELECT c.ancestor_id, l.client_id, c.depth + 1, SUM(c.paths) "
+                f"FROM {closure} AS c JOIN {link} AS l ON l.supplier_id = c.descendant_id "
+                f"WHERE c.depth = %s GROUP BY c.ancestor_id, l.client_id, c.depth",
+                [depth]
+            )
+            inserted = cursor.rowcount
+            depth += 1
+
+
+def _raise_cycle(cursor, closure, link):
+    # Связь supplier -> client лежит на цикле, если от клиента есть путь обратно к поставщику.
+    cursor.execute(
+        f"SELECT DISTINCT l.id, l.supplier_id, l.client_id FROM {link} AS l "
+        f"JOIN {closure} AS c ON c.ancestor_id = l.client_id AND c.descendant_id = l.supplier_id "
+        f"ORDER BY l.id LIMIT 50"
+    )
+    links = ', '.join(f"#{pk} ({supplier_id} -> {client_id})" for pk, supplier_id, client_id in cursor.fetchall())
+    raise ValueError(
+        "Граф поставок содержит цикл, построить замыкание невозможно. "
+        f"Связи на цикле (ID связи, поставщик -> клиент): {links}. Удалите их и повторите миграцию."
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0003_networknode_level'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Длина пути')),
+                ('paths', models.PositiveBigIntegerField(default=1, verbose_name='Количество путей')),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='descendant_paths', to='network.networknode', verbose_name='Предок')),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ancestor_paths', to='network.networknode', verbose_name='Потомок')),
+            ],
+            options={
+                'verbose_name': 'Путь в графе поставок',
+                'verbose_name_plural': 'Пути в графе поставок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='supplierclosure',
+            index=models.Index(fields=['descendant', 'ancestor'], name='network_closure_desc_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='supplierclosure',
+            unique_together={('ancestor', 'descendant', 'depth')},
+        ),
+        migrations.RunPython(fill_closure, migrations.RunPython.noop),
+    ]
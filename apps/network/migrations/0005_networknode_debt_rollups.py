@@ -0,0 +1,65 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:36
+
+from django.db import migrations, models
+
+
+def fill_debt_rollups(apps, schema_editor):
+    """Считает прямые суммы долга по связям и суммы по поддереву по таблице замыкания."""
+    node = apps.get_model('network', 'NetworkNode')._meta.db_table
+    link = apps.get_model('network', 'SupplierLink')._meta.db_table
+    closure = apps.get_model('network', 'SupplierClosure')._meta.db_table
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {node} AS n
+            SET debt_to_suppliers = COALESCE((SELECT SUM(debt) FROM {link} WHERE client_id = n.id), 0),
+                debt_from_clients = COALESCE((SELECT SUM(debt) FROM {link} WHERE supplier_id = n.id), 0)
+        """)
+        cursor.execute(f"""
+            UPDATE {node} AS n
+            SET subtree_debt_to_suppliers = n.debt_to_suppliers + totals.owed,
+                subtree_debt_from_clients = n.debt_from_clients + totals.receivable
+            FROM (
+                SELECT t.id,
+                       COALESCE(SUM(d.debt_to_suppliers), 0) AS owed,
+                       COALESCE(SUM(d.debt_from_clients), 0) AS receivable
+                FROM {node} AS t
+                LEFT JOIN LATERAL (
+                    SELECT DISTINCT descendant_id FROM {closure} WHERE ancestor_id = t.id
+                ) AS dd ON TRUE
+                LEFT JOIN {node} AS d ON d.id = dd.descendant_id
+                GROUP BY t.id
+            ) AS totals
+            WHERE n.id = totals.id
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0004_supplierclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='debt_from_clients',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Долг клиентов'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='debt_to_suppliers',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Долг перед поставщиками'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='subtree_debt_from_clients',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Долг клиентов (поддерево)'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='subtree_debt_to_suppliers',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Долг перед поставщиками (поддерево)'),
+        ),
+        migrations.RunPython(fill_debt_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0005_networknode_debt_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='networknode',
+            index=models.Index(fields=['created_at', 'id'], name='network_node_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def versioned_fields(model_name):
+    return [
+        migrations.AddField(
+            model_name=model_name,
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Время изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name=model_name,
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия'),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0006_networknode_created_id_idx'),
+    ]
+
+    operations = [
+        *versioned_fields('product'),
+        *versioned_fields('supplierlink'),
+        *versioned_fields('networknode'),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:18
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся без блокировки записи в таблицы (CREATE INDEX CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ('network', '0007_row_versions'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('city', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), '||', django.contrib.postgres.search.SearchVector('country', config='simple', weight='B'), django.contrib.postgres.search.SearchConfig('simple')), name='network_node_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='network_node_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['city'], name='network_node_city_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['country'], name='network_node_country_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='simple', weight='A'), '||', django.contrib.postgres.search.SearchVector('model', config='simple', weight='A'), django.contrib.postgres.search.SearchConfig('simple')), name='network_product_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='network_product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['model'], name='network_product_model_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
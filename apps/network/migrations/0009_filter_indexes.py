@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:21
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся без блокировки записи в таблицы (CREATE INDEX CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ('network', '0008_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='supplierlink',
+            name='supplier',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='supplier_links', to='network.networknode', verbose_name='Поставщик'),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=models.Index(fields=['country', 'city'], name='network_node_country_city_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=models.Index(fields=['city', 'created_at'], name='network_node_city_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=models.Index(fields=['node_type', 'created_at'], name='network_node_type_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='networknode',
+            index=models.Index(condition=models.Q(('debt_to_suppliers__gt', 0)), fields=['debt_to_suppliers'], name='network_node_debtors_idx'),
+        ),
+    ]
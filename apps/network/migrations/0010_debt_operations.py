@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('network', '0009_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.UUIDField(db_index=True, verbose_name='Операция')),
+                ('kind', models.CharField(choices=[('clear', 'Очистка'), ('adjust', 'Изменение на процент'), ('transfer', 'Перенос на другую связь')], max_length=16, verbose_name='Тип операции')),
+                ('old_debt', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Долг до операции')),
+                ('new_debt', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Долг после операции')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время операции')),
+                ('client', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='network.networknode', verbose_name='Клиент')),
+                ('supplier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='network.networknode', verbose_name='Поставщик')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Операция с задолженностью',
+                'verbose_name_plural': 'Операции с задолженностью',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
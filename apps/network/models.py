@@ -1,9 +1,52 @@
-
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+
+from . import search
+
+# Ключ транзакционной advisory-блокировки графа поставок (см. lock_supply_graph)
+SUPPLY_GRAPH_LOCK_ID = 524_107_301
+
+
+def lock_supply_graph():
+    """
+    Блокирует изменение графа поставок до конца текущей транзакции.
+
+    Проверка цикла и вставка связи выполняются под этой блокировкой: иначе две параллельные
+    записи (одиночная связь и пакетная загрузка или две загрузки) могут пройти проверку
+    по одному и тому же снимку замыкания и вместе образовать цикл.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SUPPLY_GRAPH_LOCK_ID])
+
+
+class VersionedModel(models.Model):
+    """
+    Базовая модель с версией строки и временем изменения (для ETag и Last-Modified в API).
+
+    Версия увеличивается выражением на стороне БД, поэтому параллельные сохранения
+    не получают одинаковую версию. Массовые UPDATE в обход save() увеличивают ее сами.
+    """
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время изменения")
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Версия")
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (update_fields is not None and not update_fields):
+            super().save(*args, **kwargs)
+            return
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        self.version = F('version') + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
 
 
-class Product(models.Model):
+class Product(VersionedModel):
     """Модель продукта."""
     name = models.CharField(max_length=255, verbose_name="Название")
     model = models.CharField(max_length=255, verbose_name="Модель")
@@ -15,13 +58,16 @@ class Product(models.Model):
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
+        # Поиск в API (apps/network/search.py)
+        indexes = search.search_indexes('network_product', search.PRODUCT_SEARCH_FIELDS)
 
 
-class SupplierLink(models.Model):
+class SupplierLink(VersionedModel):
     """Промежуточная модель для связи Поставщик-Клиент."""
     supplier = models.ForeignKey(
         'NetworkNode',
         on_delete=models.CASCADE,
+        db_index=False,  # Покрывается уникальным индексом (supplier, client).
         related_name='supplier_links',
         verbose_name="Поставщик"
     )
@@ -46,36 +92,59 @@ class SupplierLink(models.Model):
     def __str__(self):
         return f"{self.supplier} -> {self.client}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминает загруженные из БД значения, чтобы сигналы видели, что изменилось."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def clean(self):
         """Проверяет наличие циклических зависимостей перед сохранением."""
         super().clean()
+        error = self.cycle_error()
+        if error:
+            raise ValidationError(error)
 
+    def cycle_error(self):
+        """Текст ошибки, если связь замыкает цикл, иначе None."""
         # Предотвращаем создание связи, где узел является поставщиком самому себе.
-        if self.supplier == self.client:
-            raise ValidationError("Узел не может быть поставщиком самому себе.")
+        if self.supplier_id == self.client_id:
+            return "Узел не может быть поставщиком самому себе."
 
         # === Проверка на циклическую зависимость ===
         # Цель: не допустить создания цепочки, где узел A поставляет B, B поставляет C, а C снова поставляет A.
-        # Алгоритм: итеративно поднимаемся вверх по иерархии от нового поставщика (self.supplier).
-        # Если в этой цепочке мы встречаем клиента (self.client), значит, создается цикл.
-        parent = self.supplier
-        while parent is not None:
-            # Если один из вышестоящих поставщиков совпадает с нашим клиентом, это цикл.
-            if parent == self.client:
-                raise ValidationError("Обнаружена циклическая зависимость в цепочке поставок.")
-
-            # Ищем поставщика для текущего узла `parent`, чтобы подняться на уровень выше.
-            # Примечание: Эта проверка является упрощенной и находит только первый путь вверх.
-            # Для графов со множественными поставщиками потребовался бы более сложный обход.
-            link = SupplierLink.objects.filter(client=parent).first()
-            if link:
-                parent = link.supplier
-            else:
-                # Если поставщика нет, мы достигли вершины этой ветки иерархии.
-                parent = None
-
-
-class NetworkNode(models.Model):
+        # Цикл возникает, если клиент уже находится выше поставщика по любой из цепочек.
+        # Благодаря таблице замыкания это один запрос по индексу даже для графов
+        # со множественными поставщиками.
+        if SupplierClosure.objects.filter(ancestor_id=self.client_id, descendant_id=self.supplier_id).exists():
+            return "Обнаружена циклическая зависимость в цепочке поставок."
+        return None
+
+    def save(self, *args, **kwargs):
+        """
+        Новая связь или смена ее концов сохраняются под блокировкой графа с повторной проверкой
+        цикла: clean() и сериализаторы проверяют до транзакции записи.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        if not self._state.adding and (self.supplier_id, self.client_id) == (
+            loaded.get('supplier_id', self.supplier_id), loaded.get('client_id', self.client_id)
+        ):
+            super().save(*args, **kwargs)
+            return
+        # Сигналы post_save (замыкание, уровни) выполняются в той же транзакции, под блокировкой.
+        # Без точки сохранения (лишних запросов); ошибка проверки выбрасывается уже после блока,
+        # поэтому не помечает внешнюю транзакцию для отката.
+        with transaction.atomic(savepoint=False):
+            lock_supply_graph()
+            error = self.cycle_error()
+            if error is None:
+                super().save(*args, **kwargs)
+        if error:
+            raise ValidationError(error)
+
+
+class NetworkNode(VersionedModel):
     """
     Модель узла сети.
     Может быть заводом, розничной сетью или индивидуальным предпринимателем.
@@ -110,30 +179,175 @@ class NetworkNode(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
 
+    # Уровень иерархии хранится в БД и пересчитывается сигналами SupplierLink
+    # (см. apps/network/hierarchy.py), поэтому чтение уровня не требует запросов.
+    # Уровень 0: узел без поставщиков (например, завод).
+    # Уровень N: узел, чей самый "высокий" поставщик имеет уровень N-1.
+    level = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name="Уровень иерархии"
+    )
+
+    # Сводные суммы задолженности. Прямые суммы - по связям самого узла,
+    # суммы по поддереву - по узлу и всем его нижестоящим клиентам (каждый учитывается один раз).
+    debt_to_suppliers = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0, editable=False,
+        verbose_name="Долг перед поставщиками"
+    )
+    debt_from_clients = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0, editable=False,
+        verbose_name="Долг клиентов"
+    )
+    subtree_debt_to_suppliers = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0, editable=False,
+        verbose_name="Долг перед поставщиками (поддерево)"
+    )
+    subtree_debt_from_clients = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0, editable=False,
+        verbose_name="Долг клиентов (поддерево)"
+    )
+
+    # Поля, которые поддерживаются сигналами. Обычный save() существующего узла
+    # их не перезаписывает, чтобы устаревшее значение в памяти не затерло пересчитанное.
+    MAINTAINED_FIELDS = (
+        'level',
+        'debt_to_suppliers', 'debt_from_clients',
+        'subtree_debt_to_suppliers', 'subtree_debt_from_clients',
+    )
+
     def __str__(self):
         return self.name
 
-    def get_level(self):
-        """
-        Рекурсивно вычисляет уровень узла в иерархии.
-        """
-        # === Вычисление уровня иерархии ===
-        # Уровень 0: узел без поставщиков (например, завод).
-        # Уровень N: узел, чей самый "высокий" поставщик имеет уровень N-1.
-        # Алгоритм: рекурсивно находим максимальный уровень среди всех поставщиков и добавляем 1.
-
-        # `self.client_links` - это все связи, где данный узел является клиентом.
-        # То есть, это все его поставщики.
-        supplier_links = self.client_links.all()
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
-        if not supplier_links.exists():
-            return 0  # Базовый случай рекурсии: нет поставщиков - уровень 0.
+    def get_level(self):
+        """Возвращает сохраненный уровень узла в иерархии."""
+        return self.level
 
-        # Для каждого поставщика рекурсивно вызываем get_level() и находим максимальное значение.
-        max_supplier_level = max(link.supplier.get_level() for link in supplier_links)
+    def get_upstream(self):
+        """Возвращает всех вышестоящих поставщиков узла (по всем цепочкам) одним запросом."""
+        return NetworkNode.objects.filter(
+            pk__in=SupplierClosure.objects.filter(descendant=self).values('ancestor_id')
+        )
 
-        return max_supplier_level + 1
+    def get_downstream(self):
+        """Возвращает всех нижестоящих клиентов узла (по всем цепочкам) одним запросом."""
+        return NetworkNode.objects.filter(
+            pk__in=SupplierClosure.objects.filter(ancestor=self).values('descendant_id')
+        )
 
     class Meta:
         verbose_name = "Узел сети"
         verbose_name_plural = "Узлы сети"
+        indexes = [
+            # Ключ постраничного вывода по курсору (см. apps/api/pagination.KeysetPagination).
+            models.Index(fields=['created_at', 'id'], name='network_node_created_id_idx'),
+            # Фильтры API (country, city) и админки (node_type, city) с сортировкой админки по -created_at;
+            # проверка планов: manage.py check_query_plans.
+            models.Index(fields=['country', 'city'], name='network_node_country_city_idx'),
+            models.Index(fields=['city', 'created_at'], name='network_node_city_created_idx'),
+            models.Index(fields=['node_type', 'created_at'], name='network_node_type_created_idx'),
+            # Фильтр и сортировка по долгу перед поставщиками: в индексе только узлы с долгом.
+            models.Index(
+                fields=['debt_to_suppliers'], name='network_node_debtors_idx', condition=Q(debt_to_suppliers__gt=0)
+            ),
+            # Поиск в API (apps/network/search.py)
+            *search.search_indexes('network_node', search.NODE_SEARCH_FIELDS),
+        ]
+
+
+class SupplierClosure(models.Model):
+    """
+    Таблица замыкания графа поставок.
+
+    Для каждой пары (предок, потомок) и длины пути между ними хранит число
+    различных путей такой длины. Счетчик путей позволяет корректно удалять
+    связи в графах со множественными поставщиками: строка исчезает только
+    тогда, когда пропадает последний путь. Поддерживается сигналами SupplierLink.
+    """
+    ancestor = models.ForeignKey(
+        NetworkNode,
+        # Строки удаляются сигналами при удалении связей узла (см. apps/network/signals.py),
+        # каскад на уровне ORM нарушил бы порядок пересчета.
+        on_delete=models.DO_NOTHING,
+        db_index=False,  # Покрывается уникальным индексом (ancestor, descendant, depth).
+        related_name='descendant_paths',
+        verbose_name="Предок"
+    )
+    descendant = models.ForeignKey(
+        NetworkNode,
+        on_delete=models.DO_NOTHING,
+        db_index=False,  # Покрывается индексом (descendant, ancestor).
+        related_name='ancestor_paths',
+        verbose_name="Потомок"
+    )
+    depth = models.PositiveIntegerField(verbose_name="Длина пути")
+    paths = models.PositiveBigIntegerField(default=1, verbose_name="Количество путей")
+
+    class Meta:
+        verbose_name = "Путь в графе поставок"
+        verbose_name_plural = "Пути в графе поставок"
+        unique_together = ('ancestor', 'descendant', 'depth')
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor'], name='network_closure_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class DebtOperation(models.Model):
+    """
+    Журнал массовых операций с задолженностью (apps/network/debt.py): одна строка
+    на каждую измененную связь. Строки одной операции объединены полем batch.
+    Пишется тем же запросом, что меняет долг, поэтому не расходится с данными.
+    """
+
+    class Kind(models.TextChoices):
+        CLEAR = 'clear', 'Очистка'
+        ADJUST = 'adjust', 'Изменение на процент'
+        TRANSFER = 'transfer', 'Перенос на другую связь'
+
+    batch = models.UUIDField(db_index=True, verbose_name="Операция")
+    kind = models.CharField(max_length=16, choices=Kind.choices, verbose_name="Тип операции")
+    # Ссылки на узлы, а не на связь: журнал переживает удаление связи.
+    supplier = models.ForeignKey(
+        NetworkNode,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name="Поставщик"
+    )
+    client = models.ForeignKey(
+        NetworkNode,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name="Клиент"
+    )
+    old_debt = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Долг до операции")
+    new_debt = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Долг после операции")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name="Пользователь"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время операции")
+
+    class Meta:
+        verbose_name = "Операция с задолженностью"
+        verbose_name_plural = "Операции с задолженностью"
+        ordering = ('-id',)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.supplier_id} -> {self.client_id}: {self.old_debt} -> {self.new_debt}"
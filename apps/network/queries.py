@@ -0,0 +1,36 @@
+"""
+Запросы на чистом SQL к узлам сети, общие для админки и проверки планов запросов.
+
+Модуль не зависит от админки и API, поэтому его можно импортировать
+из команд управления (apps/network/query_plans.py).
+"""
+from django.db import connection
+
+from .models import NetworkNode
+
+# Сколько первых по алфавиту городов показывает фильтр админки.
+CITY_CHOICES_LIMIT = 100
+
+# Различные города в алфавитном порядке "прыжками" по индексу (city, created_at):
+# каждый шаг рекурсии - один поиск по индексу следующего значения после текущего,
+# поэтому запрос читает по строке на город, а не всю таблицу, как SELECT DISTINCT.
+# Рекурсия вычисляется лениво и останавливается на LIMIT.
+CITY_VALUES_SQL = f"""
+    WITH RECURSIVE cities(city) AS (
+        (SELECT city FROM {NetworkNode._meta.db_table} ORDER BY city LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT node.city FROM {NetworkNode._meta.db_table} node
+            WHERE node.city > cities.city ORDER BY node.city LIMIT 1
+        )
+        FROM cities WHERE cities.city IS NOT NULL
+    )
+    SELECT city FROM cities WHERE city IS NOT NULL LIMIT %s
+"""
+
+
+def city_values(limit):
+    """Первые limit различных городов узлов в алфавитном порядке."""
+    with connection.cursor() as cursor:
+        cursor.execute(CITY_VALUES_SQL, [limit])
+        return [city for city, in cursor.fetchall()]
@@ -0,0 +1,98 @@
+"""
+Проверка планов запросов для основных путей доступа к узлам сети.
+
+access_paths() перечисляет запросы, которые строят фильтры и сортировки API и админки
+(queryset или пара (sql, params) для запросов на чистом SQL); новые фильтры
+регистрируются здесь же. find_seq_scans() ищет в плане EXPLAIN
+последовательные чтения таблиц, в которых по статистике PostgreSQL (pg_class.reltuples)
+не меньше min_rows строк. missing_fk_indexes() находит внешние ключи без индекса,
+начинающегося с их колонки. Используется командой check_query_plans.
+"""
+from django.apps import apps
+from django.db import connection, models
+
+from .models import NetworkNode, SupplierLink
+from .queries import CITY_CHOICES_LIMIT, CITY_VALUES_SQL
+
+ADMIN_PAGE_SIZE = 25
+API_PAGE_SIZE = 10
+
+
+def _sample(field, default):
+    # Значение из данных, чтобы планировщик оценивал реальную селективность.
+    value = NetworkNode.objects.exclude(**{field: default}).values_list(field, flat=True).first()
+    return default if value is None else value
+
+
+def access_paths():
+    """Пары (название, queryset или (sql, params)) для фильтров API и админки."""
+    country, city, node_type = _sample('country', ''), _sample('city', ''), _sample('node_type', -1)
+    nodes = NetworkNode.objects.all()
+    api = nodes.order_by('id')
+    admin = nodes.order_by('-created_at')
+    return [
+        ('api: список', api[:API_PAGE_SIZE]),
+        ('api: country', api.filter(country=country)[:API_PAGE_SIZE]),
+        ('api: city', api.filter(city=city)[:API_PAGE_SIZE]),
+        ('api: country + city', api.filter(country=country, city=city)[:API_PAGE_SIZE]),
+        ('api: level', api.filter(level=1)[:API_PAGE_SIZE]),
+        ('api: курсор по created_at', nodes.order_by('-created_at', '-id')[:API_PAGE_SIZE]),
+        (
+            'api: должники по убыванию долга',
+            nodes.filter(debt_to_suppliers__gte=1000).order_by('-debt_to_suppliers')[:API_PAGE_SIZE],
+        ),
+        ('api: связи узлов страницы', SupplierLink.objects.filter(client_id__in=[1, 2, 3])),
+        ('admin: список', admin[:ADMIN_PAGE_SIZE]),
+        ('admin: node_type', admin.filter(node_type=node_type)[:ADMIN_PAGE_SIZE]),
+        ('admin: city', admin.filter(city=city)[:ADMIN_PAGE_SIZE]),
+        ('admin: значения фильтра city', (CITY_VALUES_SQL, [CITY_CHOICES_LIMIT])),
+    ]
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+
+def table_rows(tables):
+    """Оценка числа строк таблиц по статистике (без COUNT)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relkind = 'r' AND relname = ANY(%s)",
+            [list(tables)],
+        )
+        return dict(cursor.fetchall())
+
+
+def seq_scan_tables(explained):
+    """Таблицы, которые план (результат EXPLAIN (FORMAT JSON)) читает последовательно."""
+    return [node['Relation Name'] for node in _plan_nodes(explained['Plan']) if node['Node Type'] == 'Seq Scan']
+
+
+def find_seq_scans(queryset, min_rows):
+    """Список (таблица, строк в таблице) для последовательных чтений больших таблиц в плане."""
+    sql, params = queryset if isinstance(queryset, tuple) else queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        [explained] = cursor.fetchone()[0]
+    scans = seq_scan_tables(explained)
+    rows = table_rows(scans) if scans else {}
+    return [(table, rows.get(table, 0)) for table in scans if rows.get(table, 0) >= min_rows]
+
+
+def missing_fk_indexes(app_labels=('network',)):
+    """Внешние ключи (модель, поле) без индекса, в котором их колонка идет первой."""
+    missing = []
+    with connection.cursor() as cursor:
+        for app_label in app_labels:
+            for model in apps.get_app_config(app_label).get_models(include_auto_created=True):
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                leading = {
+                    column for info in constraints.values() if info['index'] or info['unique']
+                    for column in info['columns'][:1]
+                }
+                for field in model._meta.local_fields:
+                    if isinstance(field, models.ForeignKey) and field.column not in leading:
+                        missing.append((model, field))
+    return missing
@@ -0,0 +1,79 @@
+"""
+Поиск по узлам сети и продуктам средствами PostgreSQL.
+
+Режимы:
+- fts: полнотекстовый поиск (синтаксис websearch: слова, "фразы", -исключения)
+  с ранжированием по ts_rank, совпадения в названии весят больше;
+- prefix: автодополнение, каждое слово запроса ищется как префикс лексемы;
+- fuzzy: поиск с опечатками по сходству триграмм (pg_trgm), ранжирование по сходству.
+
+fts и prefix используют GIN-индекс по выражению tsvector, fuzzy - GIN-индексы
+gin_trgm_ops по каждому полю (см. Meta.indexes моделей). Выражение в запросе
+строится теми же функциями, что и индекс, иначе планировщик индекс не применит.
+Словарь 'simple' без стемминга: названия, города и модели - имена собственные.
+"""
+import operator
+import re
+from functools import reduce
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+SEARCH_CONFIG = 'simple'
+
+FTS = 'fts'
+PREFIX = 'prefix'
+FUZZY = 'fuzzy'
+MODES = (FTS, PREFIX, FUZZY)
+
+# Поле -> вес в tsvector (A - наибольший)
+NODE_SEARCH_FIELDS = {'name': 'A', 'city': 'B', 'country': 'B'}
+PRODUCT_SEARCH_FIELDS = {'name': 'A', 'model': 'A'}
+
+RANK_ANNOTATION = 'search_rank'
+
+
+def search_vector(fields):
+    return reduce(
+        operator.add, (SearchVector(field, weight=weight, config=SEARCH_CONFIG) for field, weight in fields.items())
+    )
+
+
+def search_indexes(prefix, fields):
+    """GIN-индекс по tsvector и триграммные индексы по каждому полю для Meta.indexes."""
+    return [
+        GinIndex(search_vector(fields), name=f'{prefix}_search_idx'),
+        *(
+            GinIndex(fields=[field], opclasses=['gin_trgm_ops'], name=f'{prefix}_{field}_trgm_idx')
+            for field in fields
+        ),
+    ]
+
+
+def prefix_query(text):
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), config=SEARCH_CONFIG, search_type='raw')
+
+
+def search(queryset, fields, text, mode=FTS):
+    """
+    Фильтрует queryset по строке поиска и добавляет аннотацию search_rank
+    (больше - релевантнее). Порядок не меняет.
+    """
+    if mode == FUZZY:
+        similarity = [TrigramSimilarity(field, text) for field in fields]
+        condition = reduce(Q.__or__, (Q(**{f'{field}__trigram_similar': text}) for field in fields))
+        rank = Greatest(*similarity) if len(similarity) > 1 else similarity[0]
+        return queryset.filter(condition).annotate(**{RANK_ANNOTATION: rank})
+
+    query = prefix_query(text) if mode == PREFIX else SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    if query is None:
+        return queryset.none()
+    vector = search_vector(fields)
+    return queryset.alias(search_document=vector).filter(search_document=query).annotate(
+        **{RANK_ANNOTATION: SearchRank(vector, query)}
+    )
@@ -0,0 +1,104 @@
+from decimal import Decimal
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache, hierarchy
+from .models import NetworkNode, Product, SupplierLink
+
+
+def _as_decimal(value):
+    # Значение по умолчанию у SupplierLink.debt задано как float (0.00).
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+@receiver(post_save, sender=SupplierLink)
+def supplier_link_saved(sender, instance, created, raw=False, **kwargs):
+    """Обновляет замыкание, уровни и суммы долга после сохранения связи."""
+    if raw:
+        return
+
+    debt = _as_decimal(instance.debt)
+    loaded = getattr(instance, '_loaded_values', {})
+    old_supplier_id = loaded.get('supplier_id', instance.supplier_id)
+    old_client_id = loaded.get('client_id', instance.client_id)
+    old_debt = _as_decimal(loaded.get('debt', debt))
+
+    if created:
+        hierarchy.link_added(instance.supplier_id, instance.client_id)
+        hierarchy.update_levels({instance.client_id})
+        hierarchy.relink_debts([(instance.supplier_id, instance.client_id, debt)])
+    elif (old_supplier_id, old_client_id) != (instance.supplier_id, instance.client_id):
+        hierarchy.link_removed(old_supplier_id, old_client_id)
+        hierarchy.link_added(instance.supplier_id, instance.client_id)
+        # Старый клиент мог потерять поставщика, новый - получить более длинную цепочку.
+        hierarchy.update_levels({instance.client_id, old_client_id})
+        hierarchy.relink_debts([
+            (old_supplier_id, old_client_id, -old_debt),
+            (instance.supplier_id, instance.client_id, debt),
+        ])
+    elif debt != old_debt:
+        # Изменился только долг - структура графа прежняя, достаточно прибавить разницу.
+        hierarchy.apply_debt_changes([(instance.supplier_id, instance.client_id, debt - old_debt)])
+
+    instance._loaded_values = {
+        **loaded, 'supplier_id': instance.supplier_id, 'client_id': instance.client_id, 'debt': debt
+    }
+
+
+@receiver(post_delete, sender=SupplierLink)
+def supplier_link_deleted(sender, instance, **kwargs):
+    """Убирает пути удаленной связи, пересчитывает уровни и суммы долга."""
+    hierarchy.link_removed(instance.supplier_id, instance.client_id)
+    hierarchy.update_levels({instance.client_id})
+    hierarchy.relink_debts([(instance.supplier_id, instance.client_id, -_as_decimal(instance.debt))])
+
+
+@receiver(post_delete, sender=NetworkNode)
+def network_node_deleted(sender, instance, **kwargs):
+    """Страхует от оставшихся строк замыкания удаленного узла."""
+    hierarchy.forget_node(instance.pk)
+    cache.invalidate_nodes({instance.pk})
+
+
+# --- Версии узлов и кэш ответов API (изменения связей учитывает apps/network/hierarchy.py) ---
+
+@receiver(post_save, sender=NetworkNode)
+def network_node_saved(sender, instance, **kwargs):
+    # Версию узла увеличивает сам save().
+    cache.invalidate_nodes({instance.pk})
+
+
+@receiver(m2m_changed, sender=NetworkNode.products.through)
+def network_node_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Отмечает измененными узлы, у которых изменился набор продуктов (с любой стороны связи)."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            hierarchy.touch_nodes({instance.pk})
+    elif action == 'pre_clear':
+        # После очистки pk_set пуст, поэтому узлы продукта запоминаются заранее.
+        instance._cleared_node_ids = set(instance.network_nodes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        hierarchy.touch_nodes(getattr(instance, '_cleared_node_ids', set()))
+    elif action in ('post_add', 'post_remove'):
+        hierarchy.touch_nodes(pk_set)
+
+
+def _product_node_ids(product):
+    through = NetworkNode.products.through
+    return set(through.objects.filter(product_id=product.pk).values_list('networknode_id', flat=True))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    """Продукт вложен в ответы узлов, поэтому его изменение отмечает измененными узлы с этим продуктом."""
+    cache.invalidate_products()
+    if not created:
+        hierarchy.touch_nodes(_product_node_ids(instance))
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Строки связи с узлами удаляются каскадом до post_delete.
+    cache.invalidate_products()
+    hierarchy.touch_nodes(_product_node_ids(instance))
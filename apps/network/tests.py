@@ -0,0 +1,646 @@
+import json
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.core.paginator import EstimatedCountPaginator
+
+from . import debt, export, generator, hierarchy, queries, query_plans, search
+from .models import DebtOperation, NetworkNode, Product, SupplierClosure, SupplierLink
+
+User = get_user_model()
+
+
+def make_node(name, node_type=NetworkNode.NodeType.RETAIL):
+    """Создает узел сети с минимально необходимыми полями."""
+    return NetworkNode.objects.create(
+        name=name,
+        node_type=node_type,
+        email=f"{name.lower()}@example.com",
+        country="Россия",
+        city="Москва",
+        street="Тверская",
+        house_number="1",
+    )
+
+
+class NodeLevelTests(TestCase):
+    """
+    Тесты поддержки сохраненного уровня иерархии.
+    """
+
+    def setUp(self):
+        # factory -> retail -> shop -> kiosk
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        self.retail = make_node("Retail")
+        self.shop = make_node("Shop", NetworkNode.NodeType.ENTREPRENEUR)
+        self.kiosk = make_node("Kiosk", NetworkNode.NodeType.ENTREPRENEUR)
+        SupplierLink.objects.create(supplier=self.factory, client=self.retail)
+        SupplierLink.objects.create(supplier=self.retail, client=self.shop)
+        SupplierLink.objects.create(supplier=self.shop, client=self.kiosk)
+
+    def levels(self):
+        return dict(NetworkNode.objects.values_list('name', 'level'))
+
+    def test_levels_follow_links(self):
+        self.assertEqual(self.levels(), {'Factory': 0, 'Retail': 1, 'Shop': 2, 'Kiosk': 3})
+
+    def test_longest_supplier_path_wins(self):
+        SupplierLink.objects.create(supplier=self.factory, client=self.kiosk)
+        self.assertEqual(self.levels()['Kiosk'], 3)
+
+    def test_deleting_link_updates_subtree(self):
+        SupplierLink.objects.get(supplier=self.retail, client=self.shop).delete()
+        self.assertEqual(self.levels(), {'Factory': 0, 'Retail': 1, 'Shop': 0, 'Kiosk': 1})
+
+    def test_moving_subtree_updates_descendants(self):
+        link = SupplierLink.objects.get(supplier=self.retail, client=self.shop)
+        link.supplier = self.factory
+        link.save()
+        self.assertEqual(self.levels()['Shop'], 1)
+        self.assertEqual(self.levels()['Kiosk'], 2)
+
+    def test_changing_link_client_updates_old_client(self):
+        other = make_node("Other")
+        link = SupplierLink.objects.get(supplier=self.shop, client=self.kiosk)
+        link.client = other
+        link.save()
+        self.assertEqual(self.levels()['Kiosk'], 0)
+        self.assertEqual(self.levels()['Other'], 3)
+
+    def test_deleting_supplier_node_updates_clients(self):
+        self.retail.delete()
+        self.assertEqual(self.levels(), {'Factory': 0, 'Shop': 0, 'Kiosk': 1})
+
+    def test_save_does_not_overwrite_maintained_level(self):
+        stale = NetworkNode.objects.get(pk=self.kiosk.pk)
+        SupplierLink.objects.filter(client=self.kiosk).delete()
+        stale.name = "Renamed kiosk"
+        stale.save()
+        self.kiosk.refresh_from_db()
+        self.assertEqual(self.kiosk.name, "Renamed kiosk")
+        self.assertEqual(self.kiosk.level, 0)
+
+    def test_level_migration_rejects_cycles(self):
+        fill_levels = import_module('apps.network.migrations.0003_networknode_level').fill_levels
+        # bulk_create не вызывает сигналы с проверкой циклов, как в данных до ее исправления.
+        SupplierLink.objects.bulk_create([SupplierLink(supplier=self.kiosk, client=self.retail)])
+        with self.assertRaisesMessage(ValueError, "содержит цикл"):
+            fill_levels(apps, None)
+
+    def test_level_migration_rejects_cycles_without_root(self):
+        first, second = make_node("First"), make_node("Second")
+        fill_levels = import_module('apps.network.migrations.0003_networknode_level').fill_levels
+        SupplierLink.objects.bulk_create([
+            SupplierLink(supplier=first, client=second), SupplierLink(supplier=second, client=first),
+        ])
+        with self.assertRaisesMessage(ValueError, "без узла верхнего уровня"):
+            fill_levels(apps, None)
+
+
+class SupplierClosureTests(TestCase):
+    """
+    Тесты таблицы замыкания графа поставок со множественными поставщиками.
+    """
+
+    def setUp(self):
+        # Ромб: factory -> (left, right) -> shop, а также отдельный second_factory -> right.
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        self.second_factory = make_node("SecondFactory", NetworkNode.NodeType.FACTORY)
+        self.left = make_node("Left")
+        self.right = make_node("Right")
+        self.shop = make_node("Shop", NetworkNode.NodeType.ENTREPRENEUR)
+        SupplierLink.objects.create(supplier=self.factory, client=self.left)
+        SupplierLink.objects.create(supplier=self.second_factory, client=self.right)
+        SupplierLink.objects.create(supplier=self.factory, client=self.right)
+        SupplierLink.objects.create(supplier=self.left, client=self.shop)
+        SupplierLink.objects.create(supplier=self.right, client=self.shop)
+
+    def closure(self):
+        return set(SupplierClosure.objects.values_list('ancestor__name', 'descendant__name', 'depth', 'paths'))
+
+    def test_counts_paths_in_diamond(self):
+        self.assertIn(('Factory', 'Shop', 2, 2), self.closure())
+        self.assertIn(('SecondFactory', 'Shop', 2, 1), self.closure())
+
+    def test_upstream_and_downstream(self):
+        self.assertEqual(
+            set(self.shop.get_upstream().values_list('name', flat=True)),
+            {'Factory', 'SecondFactory', 'Left', 'Right'}
+        )
+        self.assertEqual(set(self.factory.get_downstream().values_list('name', flat=True)), {'Left', 'Right', 'Shop'})
+
+    def test_cycle_through_second_supplier_is_detected(self):
+        """Цикл через второго поставщика узла, который старый обход не находил."""
+        link = SupplierLink(supplier=self.shop, client=self.second_factory)
+        with self.assertRaises(ValidationError):
+            link.clean()
+        self.assertTrue(hierarchy.creates_cycle(self.shop.id, self.second_factory.id))
+        self.assertFalse(hierarchy.creates_cycle(self.left.id, self.right.id))
+
+    def test_save_rechecks_cycle(self):
+        """Сохранение связи в обход clean() тоже не создает цикл (повторная проверка под блокировкой)."""
+        with self.assertRaises(ValidationError):
+            SupplierLink.objects.create(supplier=self.shop, client=self.factory)
+        with self.assertRaises(ValidationError):
+            SupplierLink.objects.create(supplier=self.shop, client=self.shop)
+        self.assertFalse(SupplierLink.objects.filter(supplier=self.shop).exists())
+
+    def test_closure_migration_reports_cycle_links(self):
+        """Миграция замыкания прерывается на цикле в прежних данных и называет связи цикла."""
+        fill_closure = import_module('apps.network.migrations.0004_supplierclosure').fill_closure
+        SupplierClosure.objects.all().delete()
+        # Цикл shop -> second_factory -> right -> shop в обход проверки при сохранении.
+        SupplierLink.objects.bulk_create([SupplierLink(supplier=self.shop, client=self.second_factory)])
+        with self.assertRaises(ValueError) as raised:
+            fill_closure(apps, SimpleNamespace(connection=connection))
+        for supplier, client in ((self.shop, self.second_factory), (self.second_factory, self.right),
+                                 (self.right, self.shop)):
+            self.assertIn(f"({supplier.pk} -> {client.pk})", str(raised.exception))
+        self.assertNotIn(f"({self.factory.pk} -> {self.left.pk})", str(raised.exception))
+
+    def test_removing_one_path_keeps_the_other(self):
+        SupplierLink.objects.get(supplier=self.left, client=self.shop).delete()
+        self.assertIn(('Factory', 'Shop', 2, 1), self.closure())
+        self.assertNotIn(('Left', 'Shop', 1, 1), self.closure())
+
+    def test_deleting_node_removes_its_paths(self):
+        self.right.delete()
+        self.assertEqual(self.closure(), {
+            ('Factory', 'Left', 1, 1), ('Left', 'Shop', 1, 1), ('Factory', 'Shop', 2, 1),
+        })
+
+    def test_moving_link_matches_rebuild(self):
+        link = SupplierLink.objects.get(supplier=self.factory, client=self.left)
+        link.supplier = self.second_factory
+        link.save()
+        link.client = self.right
+        link.supplier = self.left
+        link.save()
+        incremental = self.closure()
+        levels = dict(NetworkNode.objects.values_list('name', 'level'))
+
+        call_command('rebuild_hierarchy', stdout=StringIO())
+        self.assertEqual(self.closure(), incremental)
+        self.assertEqual(dict(NetworkNode.objects.values_list('name', 'level')), levels)
+        self.assertEqual(levels['Shop'], 2)
+
+    def test_batch_of_links_matches_rebuild(self):
+        """Пакет связей с цепочками и ромбами внутри пакета и через существующие связи."""
+        top, middle, bottom = make_node("Top"), make_node("Middle"), make_node("Bottom")
+        batch = [
+            (top.id, self.factory.id), (top.id, self.second_factory.id),
+            (self.shop.id, middle.id), (self.right.id, middle.id), (middle.id, bottom.id), (self.left.id, bottom.id),
+        ]
+        # bulk_create не вызывает сигналы: замыкание обновляется только links_added().
+        SupplierLink.objects.bulk_create([SupplierLink(supplier_id=s, client_id=c) for s, c in batch])
+        # Точка сохранения, создание и удаление таблицы фронтов, вставка в замыкание и шаги по числу новых
+        # связей в самой длинной цепочке (top -> second_factory, right -> middle, middle -> bottom) плюс пустой.
+        with self.assertNumQueries(9):
+            hierarchy.links_added(batch)
+        incremental = self.closure()
+
+        hierarchy.rebuild_closure()
+        self.assertEqual(self.closure(), incremental)
+        self.assertIn(('Top', 'Bottom', 5, 3), incremental)
+
+
+class SupplyTreeTests(TestCase):
+    """Тесты сборки вложенного дерева цепочки поставок."""
+
+    @staticmethod
+    def ladder(layers):
+        # Каждый из двух узлов слоя поставляет обоим узлам следующего: 2 ** layers путей до нижнего слоя.
+        edges, link_id = [], 0
+        for layer in range(layers):
+            suppliers = [0] if layer == 0 else [2 * layer - 1, 2 * layer]
+            for supplier in suppliers:
+                for client in (2 * layer + 1, 2 * layer + 2):
+                    link_id += 1
+                    edges.append({
+                        'link_id': link_id, 'supplier_id': supplier, 'client_id': client, 'debt': '0.00',
+                        'depth': layer + 1, 'node': {'id': client, 'name': str(client), 'node_type': 1, 'level': 0},
+                    })
+        return edges
+
+    @staticmethod
+    def count_nodes(tree):
+        return 1 + sum(SupplyTreeTests.count_nodes(child) for child in tree.get('children', ()))
+
+    def test_shared_suppliers_expanded_once(self):
+        edges = self.ladder(40)
+        tree = hierarchy.build_supply_tree({'id': 0, 'name': 'root'}, edges, hierarchy.DOWNSTREAM, max_depth=50)
+        self.assertEqual(self.count_nodes(tree), len(edges) + 1)
+        first, second = tree['children']
+        self.assertEqual(len(first['children']), 2)
+        self.assertEqual([child.get('ref') for child in second['children']], [True, True])
+
+    def test_depth_limit(self):
+        root = {'id': 0, 'name': 'root'}
+        tree = hierarchy.build_supply_tree(root, self.ladder(5), hierarchy.DOWNSTREAM, max_depth=2)
+        self.assertEqual([child['children'] for child in tree['children'][0]['children']], [[], []])
+
+
+class DebtRollupTests(TestCase):
+    """
+    Тесты инкрементального пересчета сводных сумм задолженности.
+    """
+
+    def setUp(self):
+        # factory -> (left, right) -> shop: долг магазина учитывается в поддереве завода один раз.
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        self.left = make_node("Left")
+        self.right = make_node("Right")
+        self.shop = make_node("Shop", NetworkNode.NodeType.ENTREPRENEUR)
+        SupplierLink.objects.create(supplier=self.factory, client=self.left, debt=Decimal("100.00"))
+        SupplierLink.objects.create(supplier=self.factory, client=self.right, debt=Decimal("50.00"))
+        self.left_shop = SupplierLink.objects.create(supplier=self.left, client=self.shop, debt=Decimal("10.00"))
+        SupplierLink.objects.create(supplier=self.right, client=self.shop, debt=Decimal("5.00"))
+
+    def rollups(self):
+        return {
+            name: tuple(values) for name, *values in NetworkNode.objects.values_list(
+                'name', 'debt_to_suppliers', 'debt_from_clients',
+                'subtree_debt_to_suppliers', 'subtree_debt_from_clients'
+            )
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        hierarchy.rebuild_debt_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_sums_after_creation(self):
+        rollups = self.rollups()
+        self.assertEqual(rollups['Factory'], (0, 150, 165, 165))
+        self.assertEqual(rollups['Shop'], (15, 0, 15, 0))
+        self.assertEqual(rollups['Left'], (100, 10, 115, 10))
+        self.assertMatchesRebuild()
+
+    def test_debt_change_is_incremental(self):
+        link = SupplierLink.objects.get(pk=self.left_shop.pk)
+        link.debt = Decimal("30.00")
+        with self.assertNumQueries(4):  # UPDATE и чтение версии связи, по одному запросу на каждую сторону
+            link.save()
+        self.assertEqual(self.rollups()['Factory'], (0, 150, 185, 185))
+        self.assertMatchesRebuild()
+
+    def test_moving_and_deleting_links(self):
+        link = SupplierLink.objects.get(pk=self.left_shop.pk)
+        link.supplier = self.factory
+        link.save()
+        self.assertMatchesRebuild()
+        link.delete()
+        self.assertEqual(self.rollups()['Shop'], (5, 0, 5, 0))
+        self.assertMatchesRebuild()
+        self.right.delete()
+        self.assertEqual(self.rollups()['Factory'], (0, 100, 100, 100))
+        self.assertMatchesRebuild()
+
+    def test_admin_clear_debt_updates_rollups(self):
+        admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.client.force_login(admin_user)
+        links = SupplierLink.objects.filter(client=self.shop)
+        self.client.post(reverse('admin:network_supplierlink_changelist'), {
+            'action': 'clear_debt', '_selected_action': [link.pk for link in links],
+        })
+        self.assertEqual(self.rollups()['Shop'], (0, 0, 0, 0))
+        self.assertEqual(self.rollups()['Factory'], (0, 150, 150, 150))
+        self.assertMatchesRebuild()
+
+
+class NetworkExportTests(TestCase):
+    """
+    Тесты потоковой выгрузки сети.
+    """
+
+    def setUp(self):
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        for name in ("Left", "Right", "Shop"):
+            SupplierLink.objects.create(supplier=self.factory, client=make_node(name))
+
+    def test_queries_per_chunk(self):
+        """Связанные данные подгружаются двумя запросами на пачку, а не на каждый узел."""
+        with self.assertNumQueries(1 + 2 * 2):
+            records = list(export.iter_node_records(chunk_size=2))
+        self.assertEqual([len(record['suppliers']) for record in records], [0, 1, 1, 1])
+
+    def test_command_writes_ndjson(self):
+        out = StringIO()
+        call_command('export_network', '--chunk-size', '3', stdout=out)
+        names = [json.loads(line)['name'] for line in out.getvalue().splitlines()]
+        self.assertEqual(names, ['Factory', 'Left', 'Right', 'Shop'])
+
+
+class RowVersionTests(TestCase):
+    """
+    Тесты версий строк, на которых основаны ETag в API.
+    """
+
+    def setUp(self):
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        self.shop = make_node("Shop")
+
+    def version(self, node):
+        return NetworkNode.objects.values_list('version', flat=True).get(pk=node.pk)
+
+    def test_save_increments_version(self):
+        self.assertEqual(self.factory.version, 1)
+        self.factory.name = "Renamed"
+        self.factory.save()
+        self.assertEqual(self.factory.version, 2)
+        self.factory.save(update_fields=['name'])
+        self.assertEqual(self.version(self.factory), 3)
+
+    def test_hierarchy_changes_increment_version(self):
+        before = self.version(self.shop)
+        link = SupplierLink.objects.create(supplier=self.factory, client=self.shop)
+        after_link = self.version(self.shop)
+        self.assertGreater(after_link, before)
+        link.delete()
+        self.assertGreater(self.version(self.shop), after_link)
+
+
+class GeneratorTests(TestCase):
+    """
+    Тесты генератора синтетической сети и бенчмарка API.
+    """
+
+    def test_layer_sizes(self):
+        self.assertEqual(generator.SHAPES['wide'](10).layer_sizes(), [1, 9])
+        self.assertEqual(generator.SHAPES['deep'](4).layer_sizes(), [1, 1, 1, 1])
+        self.assertEqual(generator.GraphShape(nodes=10, depth=2, fanout=2).layer_sizes(), [2, 4, 4])
+
+    def test_generated_graph_matches_incremental_maintenance(self):
+        shape = generator.GraphShape(nodes=30, depth=3, fanout=3, multi_supplier_ratio=0.5)
+        layers = generator.generate_network(shape, seed=1, chunk_size=7)
+        self.assertEqual(sum(len(layer) for layer in layers), 30)
+        self.assertEqual(
+            set(NetworkNode.objects.filter(pk__in=layers[-1]).values_list('level', flat=True)), {3}
+        )
+        closure = set(SupplierClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'paths'))
+        hierarchy.rebuild_closure()
+        self.assertEqual(set(SupplierClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'paths')),
+                         closure)
+
+    def test_generation_is_deterministic(self):
+        shape = generator.SHAPES['dag'](20)
+        generator.generate_network(shape, seed=5, tag='first')
+        generator.generate_network(shape, seed=5, tag='second')
+        links = [
+            list(SupplierLink.objects.filter(client__email__startswith=tag).order_by('client_id', 'supplier_id')
+                 .values_list('debt', flat=True))
+            for tag in ('first', 'second')
+        ]
+        self.assertEqual(links[0], links[1])
+
+    def test_benchmark_command_passes_budgets(self):
+        out = StringIO()
+        call_command('benchmark_api', '--nodes', '15', '--iterations', '2', stdout=out)
+        self.assertIn('nodes-cycle', out.getvalue())
+        self.assertFalse(NetworkNode.objects.exists())
+
+    def test_seed_data_replaces_network(self):
+        make_node("Старый")
+        call_command('seed_data', '--nodes', '40', '--depth', '3', '--fanout', '3', '--multi-supplier-ratio', '0.5',
+                     '--products', '5', '--chunk-size', '8', stdout=StringIO())
+        self.assertEqual(NetworkNode.objects.count(), 40)
+        self.assertFalse(NetworkNode.objects.filter(name="Старый").exists())
+        self.assertTrue(NetworkNode.products.through.objects.exists())
+        self.assertEqual(NetworkNode.objects.filter(level=3).count(), 27)
+        self.assertGreater(SupplierLink.objects.count(), 38)
+
+        fields = ('name', 'level', 'subtree_debt_from_clients')
+        state = list(NetworkNode.objects.order_by('email').values_list(*fields))
+        call_command('seed_data', '--nodes', '40', '--depth', '3', '--fanout', '3', '--multi-supplier-ratio', '0.5',
+                     '--products', '5', '--chunk-size', '8', stdout=StringIO())
+        self.assertEqual(list(NetworkNode.objects.order_by('email').values_list(*fields)), state)
+
+
+class SearchIndexTests(TestCase):
+    """Запросы поиска совпадают с выражениями индексов (apps/network/search.py)."""
+
+    def plan(self, queryset):
+        with connection.cursor() as cursor:
+            # На пустой таблице последовательное чтение дешевле; проверяем только применимость индекса.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_full_text_and_prefix_use_tsvector_index(self):
+        for mode in (search.FTS, search.PREFIX):
+            with self.subTest(mode=mode):
+                nodes = search.search(NetworkNode.objects.all(), search.NODE_SEARCH_FIELDS, 'москва', mode)
+                self.assertIn('network_node_search_idx', self.plan(nodes))
+                products = search.search(Product.objects.all(), search.PRODUCT_SEARCH_FIELDS, 'rt', mode)
+                self.assertIn('network_product_search_idx', self.plan(products))
+
+    def test_fuzzy_uses_trigram_indexes(self):
+        nodes = search.search(NetworkNode.objects.all(), search.NODE_SEARCH_FIELDS, 'москва', search.FUZZY)
+        plan = self.plan(nodes)
+        for field in search.NODE_SEARCH_FIELDS:
+            self.assertIn(f'network_node_{field}_trgm_idx', plan)
+
+
+class QueryPlanTests(TestCase):
+    """Тесты проверки планов запросов (check_query_plans)."""
+
+    def test_foreign_keys_are_indexed(self):
+        self.assertEqual(query_plans.missing_fk_indexes(), [])
+
+    def test_seq_scan_detected_above_threshold(self):
+        queryset = NetworkNode.objects.filter(street='Ленина')
+        self.assertEqual(query_plans.find_seq_scans(queryset, min_rows=0), [('network_networknode', 0)])
+        self.assertEqual(query_plans.find_seq_scans(queryset, min_rows=1), [])
+
+    def test_seq_scan_tables_in_nested_plan(self):
+        explained = {'Plan': {'Node Type': 'Limit', 'Plans': [{
+            'Node Type': 'Nested Loop', 'Plans': [
+                {'Node Type': 'Seq Scan', 'Relation Name': 'network_supplierlink'},
+                {'Node Type': 'Index Scan', 'Relation Name': 'network_networknode'},
+            ],
+        }]}}
+        self.assertEqual(query_plans.seq_scan_tables(explained), ['network_supplierlink'])
+
+    def test_command_passes_below_threshold(self):
+        # В тестовой БД таблицы меньше порога по умолчанию, поэтому результат не зависит от выбранных планов.
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('admin: city', out.getvalue())
+        self.assertIn('Все пути доступа используют индексы.', out.getvalue())
+
+    def test_command_reports_problems(self):
+        # Планы почти пустых таблиц зависят от статистики, поэтому индексы отключаются явно
+        # (SET LOCAL действует до отката транзакции теста).
+        with connection.cursor() as cursor:
+            for setting in ('enable_indexscan', 'enable_indexonlyscan', 'enable_bitmapscan'):
+                cursor.execute(f'SET LOCAL {setting} = off')
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_query_plans', '--min-rows', '0', stdout=out)
+        self.assertIn('SEQ SCAN  admin: city: network_networknode', out.getvalue())
+
+
+class NetworkNodeAdminTests(TestCase):
+    """Тесты списка узлов в админке: запросы на страницу, фильтр по городу и пагинация."""
+
+    def setUp(self):
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        admin_user = User.objects.create_superuser(username='admin', password='password123')
+        self.client.force_login(admin_user)
+
+    def add_clients(self, count):
+        for i in range(count):
+            client = make_node(f"Client{NetworkNode.objects.count()}")
+            SupplierLink.objects.create(supplier=self.factory, client=client, debt=Decimal(i))
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:network_networknode_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_supplier_column_uses_prefetch(self):
+        self.add_clients(2)
+        few, response = self.changelist_queries()
+        self.assertContains(response, 'Factory</a> (Долг: 1.00 ₽)')
+        self.add_clients(8)
+        many, _ = self.changelist_queries()
+        self.assertEqual(few, many)
+
+    def test_city_filter(self):
+        self.add_clients(2)
+        kazan = make_node("Kazan")
+        NetworkNode.objects.filter(pk=kazan.pk).update(city="Казань")
+        self.assertEqual(queries.city_values(10), ["Казань", "Москва"])
+        self.assertEqual(queries.city_values(1), ["Казань"])
+
+        _, response = self.changelist_queries(city="Казань")
+        self.assertEqual(list(response.context['cl'].result_list), [kazan])
+        self.assertContains(response, '?city=%D0%9C%D0%BE%D1%81%D0%BA%D0%B2%D0%B0')
+
+    def test_estimated_count(self):
+        # ANALYZE меняет pg_class вне транзакции теста, поэтому берем таблицу, статистику
+        # которой другие тесты не проверяют.
+        for i in range(4):
+            Product.objects.create(name=f"Product{i}", model="M", release_date="2024-01-01")
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Product._meta.db_table}')
+        Product.objects.create(name="Late", model="M", release_date="2024-01-01")
+        products = Product.objects.all()
+        with override_settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=1):
+            # Статистика собрана до последней вставки.
+            self.assertEqual(EstimatedCountPaginator(products, 25).count, 4)
+        with override_settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=100):
+            self.assertEqual(EstimatedCountPaginator(products, 25).count, 5)
+        with override_settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=0):
+            self.assertEqual(EstimatedCountPaginator(products, 25).count, 5)
+
+
+class DebtOperationTests(TestCase):
+    """Тесты массовых операций с задолженностью и журнала DebtOperation."""
+
+    def setUp(self):
+        # factory -> retail -> shop, а также second -> shop: у магазина два поставщика.
+        self.factory = make_node("Factory", NetworkNode.NodeType.FACTORY)
+        self.second = make_node("Second", NetworkNode.NodeType.FACTORY)
+        self.retail = make_node("Retail")
+        self.shop = make_node("Shop", NetworkNode.NodeType.ENTREPRENEUR)
+        create = SupplierLink.objects.create
+        self.retail_link = create(supplier=self.factory, client=self.retail, debt=Decimal("100.00"))
+        self.shop_link = create(supplier=self.retail, client=self.shop, debt=Decimal("10.00"))
+        self.second_link = create(supplier=self.second, client=self.shop, debt=Decimal("5.00"))
+        self.user = User.objects.create_superuser(username='debt_admin', password='password123')
+
+    def debts(self):
+        return dict(SupplierLink.objects.values_list('pk', 'debt'))
+
+    def assertMatchesRebuild(self):
+        rollups = list(NetworkNode.objects.order_by('pk').values_list(
+            'debt_to_suppliers', 'debt_from_clients', 'subtree_debt_to_suppliers', 'subtree_debt_from_clients'
+        ))
+        hierarchy.rebuild_debt_rollups()
+        self.assertEqual(rollups, list(NetworkNode.objects.order_by('pk').values_list(
+            'debt_to_suppliers', 'debt_from_clients', 'subtree_debt_to_suppliers', 'subtree_debt_from_clients'
+        )))
+
+    def test_clear_writes_audit_in_one_statement(self):
+        links = SupplierLink.objects.filter(client=self.shop)
+        with self.assertNumQueries(5):  # операция с журналом, суммы клиентов и поставщиков, точка сохранения
+            batch, changes = debt.clear(links, user=self.user)
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(self.debts()[self.shop_link.pk], 0)
+        audit = DebtOperation.objects.filter(batch=batch)
+        self.assertEqual(
+            sorted(audit.values_list('supplier_id', 'old_debt', 'new_debt', 'user_id', 'kind')),
+            [
+                (self.second.pk, Decimal("5.00"), 0, self.user.pk, 'clear'),
+                (self.retail.pk, Decimal("10.00"), 0, self.user.pk, 'clear'),
+            ],
+        )
+        self.assertEqual(NetworkNode.objects.get(pk=self.shop.pk).debt_to_suppliers, 0)
+        self.assertMatchesRebuild()
+
+        # Повторная очистка ничего не меняет и не пишет в журнал.
+        _, changes = debt.clear(links)
+        self.assertEqual(changes, [])
+        self.assertEqual(DebtOperation.objects.count(), 2)
+
+    def test_adjust_by_percent(self):
+        debt.adjust(SupplierLink.objects.all(), Decimal("-12.5"))
+        self.assertEqual(
+            self.debts(),
+            {
+                self.retail_link.pk: Decimal("87.50"),
+                self.shop_link.pk: Decimal("8.75"),
+                self.second_link.pk: Decimal("4.38"),
+            },
+        )
+        self.assertMatchesRebuild()
+        with self.assertRaises(ValidationError):
+            debt.adjust(SupplierLink.objects.all(), -101)
+
+    def test_overflow_rolls_back(self):
+        SupplierLink.objects.filter(pk=self.retail_link.pk).update(debt=Decimal("9999999.00"))
+        with self.assertRaises(ValidationError):
+            # Долг связи выходит за max_digits поля: операция откатывается целиком.
+            debt.adjust(SupplierLink.objects.all(), 1000)
+        self.assertEqual(self.debts()[self.shop_link.pk], Decimal("10.00"))
+        self.assertFalse(DebtOperation.objects.exists())
+
+    def test_transfer_between_suppliers_of_one_client(self):
+        version = NetworkNode.objects.get(pk=self.shop.pk).version
+        batch, changes = debt.transfer(SupplierLink.objects.filter(pk=self.second_link.pk), self.shop_link)
+        self.assertEqual(self.debts()[self.shop_link.pk], Decimal("15.00"))
+        self.assertEqual(self.debts()[self.second_link.pk], 0)
+        self.assertEqual(DebtOperation.objects.filter(batch=batch, kind='transfer').count(), 2)
+        # Сумма долга магазина не изменилась, но изменился его список связей.
+        self.assertGreater(NetworkNode.objects.get(pk=self.shop.pk).version, version)
+        self.assertMatchesRebuild()
+
+        with self.assertRaises(ValidationError):
+            debt.transfer(SupplierLink.objects.filter(pk=self.retail_link.pk), self.shop_link)
+
+    def test_admin_actions(self):
+        self.client.force_login(self.user)
+        url = reverse('admin:network_supplierlink_changelist')
+        self.client.post(url, {
+            'action': 'adjust_debt', 'percent': '100', '_selected_action': [self.retail_link.pk],
+        })
+        self.assertEqual(self.debts()[self.retail_link.pk], Decimal("200.00"))
+        self.client.post(url, {
+            'action': 'transfer_debt', 'target': self.shop_link.pk, '_selected_action': [self.second_link.pk],
+        })
+        self.assertEqual(self.debts()[self.shop_link.pk], Decimal("15.00"))
+        self.assertEqual(DebtOperation.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.client.get(reverse('admin:network_debtoperation_changelist')).status_code, 200)
+        self.assertMatchesRebuild()
@@ -0,0 +1,145 @@
+"""
+Аутентификация по токену с кэшированием пары токен -> пользователь.
+
+TokenAuthentication выполняет запрос к authtoken_token с join на users_user на каждый
+вызов API. CachedTokenAuthentication держит результат в ограниченном LRU-кэше процесса
+с TTL и, если задан TOKEN_AUTH_SHARED_CACHE, во втором уровне - общем кэше Django
+(например, Redis), который видят все процессы. Кэшируются только успешные проверки.
+
+Удаление токена и изменение активности, пароля или прав пользователя сбрасывают
+записи сигналами (apps/users/signals.py). С общим кэшем запись процесса проверяется
+на каждом попадании по поколению токена в общем кэше (короткая строка, а не пользователь),
+поэтому сброс сразу действует во всех процессах. Без общего кэша другие процессы
+увидят сброс по истечении TOKEN_AUTH_CACHE_TTL. Массовые update() сигналы
+не вызывают - после них нужен clear_token_cache().
+"""
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = TokenCache(settings.TOKEN_AUTH_CACHE_SIZE)
+
+
+def _shared_cache():
+    alias = settings.TOKEN_AUTH_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    # Сам токен в ключ кэша не попадает.
+    return f"auth:token:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def _generation_key(key):
+    return f"auth:token-gen:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def _generation(shared, key):
+    """Текущее поколение токена в общем кэше; отсутствующее создается."""
+    generation_key = _generation_key(key)
+    generation = uuid.uuid4().hex
+    return generation if shared.add(generation_key, generation, None) else shared.get(generation_key, generation)
+
+
+def invalidate_tokens(keys):
+    """Сбрасывает кэш для токенов сразу и еще раз после фиксации транзакции."""
+    keys = list(keys)
+    if not keys:
+        return
+
+    def invalidate():
+        for key in keys:
+            _local.delete(key)
+        shared = _shared_cache()
+        if shared is not None:
+            # Без поколения записи процессов не проходят проверку на следующем попадании.
+            shared.delete_many([name for key in keys for name in (_shared_key(key), _generation_key(key))])
+
+    # Повтор после commit: конкурентный запрос мог прочитать и закэшировать строку до фиксации.
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def invalidate_user(user_id):
+    invalidate_tokens(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+def clear_token_cache():
+    _local.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с двухуровневым кэшем (см. описание модуля)."""
+
+    def authenticate_credentials(self, key):
+        ttl = settings.TOKEN_AUTH_CACHE_TTL
+        if not ttl:
+            return super().authenticate_credentials(key)
+
+        shared = _shared_cache()
+        entry = _local.get(key)
+        if entry is not None and shared is not None and shared.get(_generation_key(key)) != entry[1]:
+            # Токен или пользователь изменились в другом процессе.
+            entry = None
+        if entry is None:
+            generation = _generation(shared, key) if shared is not None else None
+            cached = shared.get(_shared_key(key)) if shared is not None else None
+            if cached is None:
+                # Неверный токен или неактивный пользователь - исключение, такие ответы не кэшируются.
+                cached = super().authenticate_credentials(key)
+                if shared is not None:
+                    shared.set(_shared_key(key), cached, ttl)
+            entry = (cached, generation)
+            _local.set(key, entry, ttl)
+        cached = entry[0]
+
+        # Копии: объекты из кэша общие для потоков, а представления могут менять request.user.
+        user, token = copy.copy(cached[0]), copy.copy(cached[1])
+        token.user = user
+        return user, token
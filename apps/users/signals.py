@@ -1,10 +1,18 @@
 import logging
+from django.conf import settings
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_user
 
 # Получаем наш логгер безопасности
 security_logger = logging.getLogger('security')
 
+# Поля пользователя, от которых зависит результат аутентификации и проверки прав
+AUTH_FIELDS = ('is_active', 'password', 'is_staff', 'is_superuser')
+
 
 @receiver(user_logged_in)
 def log_user_login(sender, request, user, **kwargs):
@@ -30,3 +38,33 @@ def log_user_login_failed(sender, credentials, request, **kwargs):
     security_logger.warning(
         f"Неудачная попытка входа для пользователя '{username}' с IP: {ip_address}"
     )
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Удаленный токен больше не должен приниматься из кэша аутентификации."""
+    invalidate_tokens([instance.key])
+
+
+def _auth_state(instance):
+    # Через __dict__: отложенные поля не загружаются отдельными запросами.
+    return tuple(instance.__dict__.get(field) for field in AUTH_FIELDS)
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def user_loaded(sender, instance, **kwargs):
+    instance._auth_state = _auth_state(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Деактивация, смена пароля или прав сбрасывают закэшированные токены; прочие сохранения
+    (в том числе обновление last_login при каждом входе) кэш не трогают.
+    """
+    state, previous = _auth_state(instance), instance._auth_state
+    instance._auth_state = state
+    if created or (update_fields is not None and not set(update_fields) & set(AUTH_FIELDS)):
+        return
+    if state != previous:
+        invalidate_user(instance.pk)
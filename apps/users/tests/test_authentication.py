@@ -0,0 +1,109 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.users import authentication
+from apps.users.authentication import clear_token_cache
+
+User = get_user_model()
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Тесты кэширования аутентификации по токену."""
+
+    def setUp(self):
+        clear_token_cache()
+        self.user = User.objects.create_user(username='token_user', password='password123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('product-list')
+
+    def tearDown(self):
+        clear_token_cache()
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        return response, [query['sql'] for query in captured if 'authtoken_token' in query['sql']]
+
+    def test_second_request_skips_token_query(self):
+        """Тест: Повторный запрос с тем же токеном не обращается к authtoken_token."""
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_deactivation_invalidates_cache(self):
+        """Тест: Деактивированный пользователь сразу теряет доступ."""
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_token_deletion_invalidates_cache(self):
+        """Тест: Удаленный токен сразу перестает приниматься."""
+        self.client.get(self.url)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_invalid_token_is_not_cached(self):
+        """Тест: Неверный токен отклоняется и не попадает в кэш."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @override_settings(TOKEN_AUTH_CACHE_TTL=0)
+    def test_cache_can_be_disabled(self):
+        """Тест: При нулевом TTL токен проверяется в БД на каждый запрос."""
+        self.client.get(self.url)
+        self.assertEqual(len(self.auth_queries()[1]), 1)
+
+    @override_settings(
+        TOKEN_AUTH_SHARED_CACHE='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-auth'}},
+    )
+    def test_shared_tier_serves_other_processes(self):
+        """Тест: Общий кэш отвечает, когда кэш процесса пуст (другой воркер)."""
+        self.client.get(self.url)
+        clear_token_cache()
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    @override_settings(
+        TOKEN_AUTH_SHARED_CACHE='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-auth'}},
+    )
+    def test_shared_tier_invalidates_other_processes(self):
+        """Тест: Деактивация в одном процессе сразу действует на кэш других процессов."""
+        self.client.get(self.url)
+        # Кэш процесса не сбрасывается, как в других воркерах: сброс виден только через общий кэш.
+        with mock.patch.object(authentication._local, 'delete'):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_last_login_update_keeps_cache(self):
+        """Тест: Обновление last_login и других полей, не влияющих на доступ, не сбрасывает кэш."""
+        self.client.get(self.url)
+        update_last_login(None, self.user)
+        self.user.first_name = "Иван"
+        self.user.save()
+        self.assertEqual(self.auth_queries()[1], [])
+
+    def test_password_change_invalidates_cache(self):
+        """Тест: Смена пароля сбрасывает закэшированные токены пользователя."""
+        self.client.get(self.url)
+        self.user.set_password('new-password123')
+        self.user.save()
+        self.assertEqual(len(self.auth_queries()[1]), 1)
@@ -1,6 +1,12 @@
+import gzip
+import json
 import logging
+import tempfile
 from io import StringIO
-from django.test import TestCase, override_settings
+from pathlib import Path
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from config.logging import JsonFormatter, QueuedHandler, flush
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -58,3 +64,121 @@ class AuthLoggingSignalTests(TestCase):
         self.client.post(reverse('admin:login'), {'username': self.username, 'password': 'wrongpassword'})
         log_content = self.log_stream.getvalue()
         self.assertIn(f"Неудачная попытка входа для пользователя '{self.username}'", log_content)
+
+
+class LoggingPipelineTests(TestCase):
+    """Тесты JSON-форматтера, обработчиков с очередью и сэмплирования логов запросов."""
+
+    def test_json_formatter_escapes_and_keeps_extra(self):
+        """Тест: Кавычки в сообщении не ломают JSON, поля extra сохраняются."""
+        record = logging.makeLogRecord({
+            'name': 'metrics', 'levelname': 'INFO', 'levelno': logging.INFO,
+            'msg': 'Узел "Завод" %s', 'args': ('обновлен',), 'path': '/api/v1/nodes/',
+        })
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data['message'], 'Узел "Завод" обновлен')
+        self.assertEqual((data['level'], data['path']), ('INFO', '/api/v1/nodes/'))
+
+    def test_queued_handler_delivers_in_background(self):
+        """Тест: Записи доходят до обернутого обработчика с учетом его уровня."""
+        stream = StringIO()
+        target = logging.StreamHandler(stream)
+        target.setLevel(logging.WARNING)
+        logger = logging.getLogger('tests.queued')
+        handler = QueuedHandler(target)
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            logger.warning("Предупреждение %s", 1)
+            logger.info("Информация")
+            flush()
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(stream.getvalue(), "Предупреждение 1\n")
+
+    @override_settings(LOG_REQUEST_SAMPLE_RATE=0, INSTRUMENTATION_PATHS={'/monitoring/': 0})
+    def test_routine_requests_are_sampled(self):
+        """Тест: При нулевой доле рядовые запросы не логируются, ошибки - логируются одной записью."""
+        with self.assertNoLogs('metrics', level='INFO'):
+            self.client.get(reverse('liveness-check'))
+        with self.assertLogs('metrics', level='INFO') as captured:
+            self.client.get('/missing/')
+        self.assertEqual(len(captured.records), 1)
+        self.assertEqual(captured.records[0].status, 404)
+        self.assertTrue(captured.records[0].getMessage().startswith('REQUEST_METRICS: method=GET path=/missing/'))
+
+    def test_excluded_paths_are_not_instrumented(self):
+        """Тест: Пути мониторинга по умолчанию исключены из инструментации."""
+        with self.assertNoLogs('metrics', level='INFO'):
+            response = self.client.get(reverse('liveness-check'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class LogAnalyzerTests(SimpleTestCase):
+    """Тесты потокового анализа логов (apps/core/loganalysis.py)."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_dir = Path(self.tmp.name)
+        with gzip.open(self.log_dir / 'security.log.2.gz', 'wt', encoding='utf-8') as stream:
+            stream.write(
+                "[WARNING] 2026-01-01 09:00:00,000 signals 1 2 "
+                "Неудачная попытка входа для пользователя 'bob' с IP: 10.0.0.1\n"
+            )
+        (self.log_dir / 'security.log.1').write_text(
+            "[INFO] 2026-01-01 10:00:00,000 signals 1 2 Пользователь 'bob' успешно вошел в систему с IP: 10.0.0.1\n",
+            encoding='utf-8'
+        )
+        (self.log_dir / 'security.log').write_text(
+            "[INFO] 2026-01-02 10:00:00,000 signals 1 2 Пользователь 'amy' успешно вошел в систему с IP: 10.0.0.2\n",
+            encoding='utf-8'
+        )
+        (self.log_dir / 'metrics.log').write_text(''.join(
+            json.dumps({
+                'timestamp': '2026-01-02 10:00:00,000', 'level': 'INFO',
+                'message': f"REQUEST_METRICS: method=GET path=/api/v1/nodes/{pk}/ status=200 time={time}s queries=3",
+            }) + '\n'
+            for pk, time in ((1, '0.020'), (2, '0.040'), (3, '0.300'))
+        ), encoding='utf-8')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def analyze(self, *args):
+        out = StringIO()
+        call_command('log_analyzer', '--log-dir', str(self.log_dir), '--workers', '1', '--json', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_rotated_files_and_aggregations(self):
+        """Тест: Учитываются ротированные и сжатые файлы, срезы по пользователям, IP и эндпоинтам."""
+        result = self.analyze()
+        security = result['security.log']
+        self.assertEqual(security['records'], 3)
+        self.assertEqual(security['events'], {'login_failed': 1, 'login_success': 2})
+        self.assertEqual(security['users']['bob'], {'login_failed': 1, 'login_success': 1})
+        self.assertEqual(security['ips']['10.0.0.2'], {'login_success': 1})
+        endpoint = result['metrics.log']['top_endpoints'][0]
+        self.assertEqual((endpoint['endpoint'], endpoint['count']), ('GET /api/v1/nodes/{id}/', 3))
+        self.assertEqual(endpoint['max_ms'], 300.0)
+
+    def test_time_window(self):
+        """Тест: Окно времени отбрасывает записи вне интервала."""
+        result = self.analyze('--since', '2026-01-01 09:30', '--until', '2026-01-02', '--bucket', 'hour')
+        self.assertEqual(result['security.log']['records'], 1)
+        self.assertEqual(result['security.log']['timeline'], {'2026-01-01 10': {'INFO': 1}})
+
+    def test_rerun_reads_only_appended_records(self):
+        """Тест: Повторный запуск продолжает с сохраненного смещения, в том числе после ротации."""
+        self.analyze()
+        current = self.log_dir / 'security.log'
+        with open(current, 'a', encoding='utf-8') as stream:
+            stream.write("[INFO] 2026-01-03 10:00:00,000 signals 1 2 Пользователь 'amy' вышел из системы.\n")
+            stream.write("[INFO] 2026-01-03 10:00:01,000 signals 1 2 неполная запись")
+        # Ротация: текущий файл становится .1, старая копия .1 удаляется.
+        (self.log_dir / 'security.log.1').unlink()
+        current.rename(self.log_dir / 'security.log.1')
+        current.write_text('', encoding='utf-8')
+
+        security = self.analyze()['security.log']
+        self.assertEqual(security['records'], 3)
+        self.assertEqual(security['users']['amy'], {'login_success': 1, 'logout': 1})
@@ -0,0 +1,4 @@
+"""
+Бэкенд PostgreSQL с проверкой постоянных соединений и необязательным пулом соединений
+процесса. Подключается как ENGINE = 'config.db' (см. DATABASES в config/settings.py).
+"""
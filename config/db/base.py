@@ -0,0 +1,80 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+
+from . import pool as pooling
+from .creation import DatabaseCreation
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Бэкенд postgresql с двумя дополнениями.
+
+    CONN_HEALTH_CHECKS (как в Django 4.1): постоянное соединение (CONN_MAX_AGE > 0)
+    проверяется запросом SELECT 1 перед первым использованием в очередном HTTP-запросе,
+    а разорванное (перезапуск PostgreSQL, обрыв сети) заменяется новым вместо ошибки 500.
+
+    OPTIONS['pool'] (как в Django 5.1): соединения берутся из пула процесса
+    (config/db/pool.py) и возвращаются в него при закрытии. Совместим только
+    с CONN_MAX_AGE = 0.
+    """
+
+    creation_class = DatabaseCreation
+
+    health_check_done = False
+    _pool = None
+
+    @property
+    def pool_options(self):
+        return self.settings_dict['OPTIONS'].get('pool')
+
+    def check_settings(self):
+        super().check_settings()
+        if self.pool_options and self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(
+                "Пул соединений несовместим с постоянными соединениями: задайте CONN_MAX_AGE = 0."
+            )
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        self.health_check_done = True
+        options = self.pool_options
+        if not options:
+            return super().get_new_connection(conn_params)
+
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self._pool = pooling.get_pool(self.alias, conn_params, options, isolation_level)
+        connection = self._pool.acquire()
+        self.isolation_level = connection.isolation_level if isolation_level is None else isolation_level
+        return connection
+
+    def _close(self):
+        pool, self._pool = self._pool, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        if self.in_atomic_block:
+            # Закрытое внутри atomic соединение остается у обертки до выхода из блока.
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Вызывается в начале и в конце HTTP-запроса: следующее использование проверит соединение.
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if self.connection is None or self.health_check_done or self.in_atomic_block:
+            return
+        if not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        self.close_if_health_check_failed()
+        super().ensure_connection()
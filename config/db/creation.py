@@ -0,0 +1,10 @@
+from django.db.backends.postgresql import creation
+
+from . import pool as pooling
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Свободные соединения пула к тестовой БД помешали бы DROP DATABASE.
+        pooling.close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,220 @@
+"""
+Пул соединений psycopg2 внутри процесса.
+
+Соединение берется из пула при первом запросе к БД и возвращается в пул, когда Django
+закрывает соединение (в конце HTTP-запроса при CONN_MAX_AGE = 0). Если все соединения
+заняты, поток ждет освобождения не дольше timeout секунд. Перед выдачей соединение,
+простоявшее без дела дольше check_idle секунд, проверяется запросом SELECT 1;
+соединения старше max_lifetime и лишние простаивающие дольше max_idle закрываются.
+Пул принадлежит процессу: после fork (gunicorn с preload) создается новый.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Свободное соединение не появилось за отведенное время."""
+
+
+def connect(conn_params, isolation_level=None):
+    """Новое соединение psycopg2, настроенное так же, как в стандартном бэкенде Django."""
+    connection = psycopg2.connect(**conn_params)
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+class ConnectionPool:
+    def __init__(self, factory, max_size=10, min_size=0, timeout=10.0, max_lifetime=3600.0,
+                 max_idle=600.0, check_idle=30.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.min_size = min_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+        self.condition = threading.Condition()
+        # Свободные соединения: (соединение, момент возврата); новые справа.
+        self.idle = deque()
+        self.created = {}
+        self.size = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        while True:
+            connection, released = self._reserve(started + self.timeout)
+            if connection is None:
+                connection = self._open()
+                break
+            if self._usable(connection, released):
+                break
+            self.discard(connection)
+
+        waited = time.monotonic() - started
+        with self.condition:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+    def _reserve(self, deadline):
+        # Свободное соединение или право открыть новое (None); иначе ожидание.
+        with self.condition:
+            self.waiting += 1
+            try:
+                while True:
+                    if self.idle:
+                        # Последнее возвращенное: реже требует проверки, а старые успевают закрыться по max_idle.
+                        return self.idle.pop()
+                    if self.size < self.max_size:
+                        self.size += 1
+                        return None, None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f"Нет свободного соединения в пуле ({self.max_size}) за {self.timeout} с"
+                        )
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def _open(self):
+        try:
+            connection = self.factory()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created[connection] = time.monotonic()
+            self.connects += 1
+        return connection
+
+    def _usable(self, connection, released):
+        now = time.monotonic()
+        if connection.closed or now - self.created.get(connection, now) >= self.max_lifetime:
+            return False
+        if now - released < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def release(self, connection):
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию."""
+        if connection.closed:
+            self.discard(connection)
+            return
+        try:
+            if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            self.discard(connection)
+            return
+
+        now = time.monotonic()
+        expired = []
+        with self.condition:
+            self.idle.append((connection, now))
+            while self.idle and self.size - len(expired) > self.min_size and now - self.idle[0][1] >= self.max_idle:
+                expired.append(self.idle.popleft()[0])
+            self.condition.notify()
+        for stale in expired:
+            self.discard(stale)
+
+    def discard(self, connection):
+        """Закрывает соединение и освобождает его место в пуле."""
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self.condition:
+            self.created.pop(connection, None)
+            self.size -= 1
+            self.discarded += 1
+            self.condition.notify()
+
+    def close(self):
+        """Закрывает свободные соединения (занятые закроются при возврате)."""
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+            self.min_size = 0
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self.condition:
+            in_use = self.size - len(self.idle)
+            return {
+                'max_size': self.max_size,
+                'min_size': self.min_size,
+                'size': self.size,
+                'in_use': in_use,
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                'saturation': round(in_use / self.max_size, 3) if self.max_size else 0.0,
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'discarded': self.discarded,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+# Пулы родительского процесса после fork: закрытие или сборка мусора их соединений
+# отправили бы серверу Terminate по общему с родителем сокету.
+_inherited = []
+
+
+def get_pool(alias, conn_params, options, isolation_level=None):
+    """Пул для псевдонима БД и параметров подключения (тестовая БД получает отдельный пул)."""
+    global _pid
+    key = (alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        if _pid != os.getpid():
+            _inherited.append(dict(_pools))
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(lambda: connect(conn_params, isolation_level), **options)
+        return pool
+
+
+def pool_stats(alias=None):
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if alias is None or key[0] == alias]
+    return [{'alias': key[0], **pool.stats()} for key, pool in pools]
+
+
+def close_pools(alias=None):
+    """Закрывает свободные соединения пулов процесса (всех или одного псевдонима) и забывает пулы."""
+    with _pools_lock:
+        keys = [key for key in _pools if alias is None or key[0] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,80 @@
+"""
+Разбивка времени обработки запроса по фазам (Server-Timing).
+
+InstrumentationMiddleware создает RequestTimings и делает его текущим через contextvar;
+код, который хочет учесть свою фазу (аутентификация, сериализация), оборачивается
+в phase(name) и не зависит от того, включено ли измерение для этого запроса.
+Все замеры - по монотонным часам time.perf_counter().
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Накопленное время фаз одного запроса в секундах."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        return self.total
+
+    def header(self, descriptions=None):
+        """Значение заголовка Server-Timing: total и фазы в миллисекундах."""
+        descriptions = descriptions or {}
+        metrics = [('total', self.total)] + sorted(self.phases.items())
+        parts = []
+        for name, seconds in metrics:
+            part = f"{name};dur={seconds * 1000:.2f}"
+            if name in descriptions:
+                part += f';desc="{descriptions[name]}"'
+            parts.append(part)
+        return ', '.join(parts)
+
+
+def current():
+    return _current.get()
+
+
+def activate(timings):
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Учитывает время блока в фазе name текущего запроса (вне запроса ничего не делает)."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def sample_rate(path):
+    """
+    Доля логируемых запросов для пути по самому длинному префиксу из INSTRUMENTATION_PATHS.
+
+    None - путь не инструментируется вовсе (нет метрик, заголовка и строки лога).
+    """
+    rules = settings.INSTRUMENTATION_PATHS
+    prefix = max((prefix for prefix in rules if path.startswith(prefix)), key=len, default=None)
+    return rules[prefix] if prefix is not None else settings.LOG_REQUEST_SAMPLE_RATE
@@ -0,0 +1,144 @@
+"""
+Неблокирующее логирование: структурированный JSON-форматтер и обработчики с очередью.
+
+QueuedHandler оборачивает обычный обработчик (файл, консоль): поток запроса только
+кладет подготовленную запись в очередь, а запись в файлы и ротацию выполняет один
+фоновый поток. При переполнении очереди записи отбрасываются и считаются,
+поток запроса не ждет. Поток запускается лениво и перезапускается после fork
+(gunicorn --preload), где потоки родителя не наследуются.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+QUEUE_SIZE = 10000
+
+# Атрибуты LogRecord; все остальные - поля из extra, они попадают в JSON как есть.
+STANDARD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON-объект в строке; кавычки и переводы строк экранируются."""
+
+    def format(self, record):
+        data = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in record.__dict__.items() if key not in STANDARD_ATTRS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _Listener:
+    """Общий фоновый поток, передающий записи из очереди целевым обработчикам."""
+
+    def __init__(self, size):
+        self.size = size
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def put(self, handler, record):
+        if self.pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait((handler, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # После fork очередь родителя могла остаться с захваченной блокировкой - создаем новую.
+            self.queue = queue.Queue(self.size)
+            self.thread = threading.Thread(target=self._run, name='log-listener', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                handler, record = item
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Ждет, пока фоновый поток запишет все записи из очереди."""
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.join()
+
+    def stop(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+        self.pid = None
+
+
+_listener = _Listener(QUEUE_SIZE)
+atexit.register(_listener.stop)
+
+
+def flush():
+    _listener.flush()
+
+
+def dropped_records():
+    return _listener.dropped
+
+
+class QueuedHandler(logging.Handler):
+    """
+    Передает записи обработчику handler через очередь.
+
+    В LOGGING задается ссылкой 'cfg://handlers.<имя>'; имя обертки должно идти
+    по алфавиту после оборачиваемого обработчика, чтобы тот был уже создан.
+    """
+
+    def __init__(self, handler, level=logging.NOTSET):
+        super().__init__(level)
+        self.handler = handler
+
+    def prepare(self, record):
+        # Сообщение и трассировка вычисляются сразу: аргументы могут измениться
+        # до того, как фоновый поток доберется до записи.
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if record.levelno < self.handler.level:
+            return
+        try:
+            _listener.put(self.handler, self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        _listener.flush()
+        self.handler.flush()
@@ -1,32 +1,134 @@
 import logging
+import random
 import time
 
-# Логгер 'apps' теперь будет использоваться для логирования всех запросов
-logger = logging.getLogger('apps')
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
 
+from health import prometheus
+from health.profiling import QueryProfile, record
+
+from . import instrumentation, routers
+
+# Одна структурированная запись на запрос в логгер 'metrics' (metrics.log в JSON)
+logger = logging.getLogger('metrics')
+
+
+def _username(request):
+    # Ленивый пользователь сессии не вычисляется ради лога: это был бы лишний запрос к БД.
+    user = getattr(request, 'user', None)
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None
+    return user.get_username() if user.is_authenticated else None
+
+
+class InstrumentationMiddleware:
+    """
+    Единая инструментация запроса: разбивка времени по фазам (total, db, auth, serialize)
+    в заголовке Server-Timing, метрики Prometheus, агрегаты профилировщика запросов к БД
+    и одна структурированная запись лога.
+
+    Правила по префиксам путей - INSTRUMENTATION_PATHS: None исключает путь,
+    число задает долю запросов, для которых пишется запись лога. Ответы с ошибками
+    и медленные запросы логируются всегда.
+    """
 
-class RequestLoggingMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Фиксируем время начала обработки запроса
-        start_time = time.time()
+        rate = instrumentation.sample_rate(request.path)
+        if rate is None:
+            return self.get_response(request)
+
+        timings = instrumentation.RequestTimings()
+        # Запросы к БД считаются через execute_wrapper: connection.queries пуст без DEBUG.
+        profile = QueryProfile()
+        token = instrumentation.activate(timings)
+        try:
+            with profile.profile():
+                response = self.get_response(request)
+        finally:
+            instrumentation.deactivate(token)
+        duration = timings.finish()
+        timings.add('db', profile.db_time)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        fingerprints = record(f"{request.method} {view_name}", request.path, duration, profile)
+        prometheus.observe(view_name, request.method, response.status_code, duration, profile)
+        response['Server-Timing'] = timings.header({'db': f"{profile.count} queries"})
+
+        if fingerprints is not None or response.status_code >= 400 or random.random() < rate:
+            self.log(request, response, view_name, timings, profile, fingerprints)
+        return response
+
+    def process_template_response(self, request, response):
+        # Рендеринг (JSON-кодирование ответа DRF) выполняется после выхода из представления.
+        timings = instrumentation.current()
+        if timings is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: timings.add('serialize', time.perf_counter() - started)
+            )
+        return response
+
+    def log(self, request, response, view_name, timings, profile, fingerprints):
+        remote_addr = request.META.get('REMOTE_ADDR')
+        username = _username(request)
+        fields = [
+            f"method={request.method}",
+            f"path={request.path}",
+            f"status={response.status_code}",
+            f"time={timings.total:.3f}s",
+            f"queries={profile.count}",
+            *(f"{name}_time={seconds:.3f}s" for name, seconds in sorted(timings.phases.items())),
+            f"max_repeats={profile.max_repeats}",
+            f"ip={remote_addr}",
+        ]
+        if username:
+            fields.append(f"user={username}")
+        if fingerprints is not None:
+            fields.append("slow=1")
+        message = f"REQUEST_METRICS: {' '.join(fields)}"
+        extra = {
+            'method': request.method, 'path': request.path, 'view': view_name,
+            'status': response.status_code, 'duration_ms': round(timings.total * 1000, 2),
+            'queries': profile.count, 'max_repeats': profile.max_repeats,
+            'remote_addr': remote_addr, 'user': username,
+            'user_agent': request.META.get('HTTP_USER_AGENT', 'Unknown'),
+            **{f"{name}_ms": round(seconds * 1000, 2) for name, seconds in timings.phases.items()},
+        }
+        if fingerprints is not None:
+            extra['top_sql'] = [{'sql': sql, 'count': count} for sql, count in fingerprints.most_common(3)]
+            logger.warning(message, extra=extra)
+        else:
+            logger.info(message, extra=extra)
+
 
-        # Логируем основную информацию о входящем запросе
-        logger.info(
-            f"Входящий запрос: {request.method} {request.path} "
-            f"от {request.META.get('REMOTE_ADDR')} "
-            f"User-Agent: {request.META.get('HTTP_USER_AGENT', 'Unknown')}"
-        )
+class ReplicaRoutingMiddleware:
+    """
+    Безопасные запросы (GET, HEAD, OPTIONS) к путям из REPLICA_READ_PATHS читают с реплики
+    (config/routers.py). После записи клиент получает cookie PIN_COOKIE на REPLICA_STICKY_SECONDS:
+    пока она действует, его чтения идут на основную БД и он видит свои изменения несмотря
+    на отставание реплик.
+    """
 
-        response = self.get_response(request)
+    PIN_COOKIE = 'db_pin'
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica = None
+        pinned = self.PIN_COOKIE in request.COOKIES
+        if request.method in self.SAFE_METHODS and not pinned and request.path.startswith(settings.REPLICA_READ_PATHS):
+            replica = routers.choose_replica()
 
-        # Вычисляем длительность обработки и логируем информацию об ответе
-        duration = time.time() - start_time
-        logger.info(
-            f"Ответ: {request.method} {request.path} -> {response.status_code} "
-            f"(время: {duration:.2f}с)"
-        )
+        with routers.routing(replica) as state:
+            response = self.get_response(request)
 
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(self.PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True)
         return response
@@ -0,0 +1,80 @@
+"""
+Маршрутизация чтений на реплики PostgreSQL.
+
+Чтения идут на реплику только внутри replica_reads(): для безопасных запросов к путям
+из REPLICA_READ_PATHS это делает config.middleware.ReplicaRoutingMiddleware, для ночной
+выгрузки - команда export_network. Все остальное, включая любые чтения после первой
+записи в том же контексте, обслуживает основная БД. Записи всегда идут на основную БД,
+даже для объектов, прочитанных с реплики.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, replica=None):
+        # Псевдоним реплики на весь контекст (один запрос видит одну реплику) или None
+        self.replica = replica
+        self.wrote = False
+
+
+def choose_replica():
+    replicas = settings.DATABASE_REPLICAS
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def routing(replica=None):
+    """Контекст маршрутизации; без реплики только отмечает записи (см. RoutingState.wrote)."""
+    state = RoutingState(replica)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def reading_from_replica():
+    """
+    Идут ли чтения текущего контекста на реплику. Данные реплики могут отставать от основной БД,
+    поэтому прочитанное с нее не сохраняется в кэш ответов и не получает ETag по поколениям:
+    иначе устаревший ответ был бы закреплен под токеном, выданным уже после записи.
+    """
+    state = _state.get()
+    return state is not None and state.replica is not None and not state.wrote
+
+
+def replica_reads():
+    """Чтения внутри контекста идут на случайную реплику из DATABASE_REPLICAS до первой записи."""
+    return routing(choose_replica())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Чтение своих записей: дальше в этом контексте читаем с основной БД.
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему репликацией с основной БД.
+        return False if db in settings.DATABASE_REPLICAS else None
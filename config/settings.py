@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Поиск: SearchVector, триграммы
 
     # Third-party apps
     'rest_framework',
@@ -45,23 +46,24 @@ INSTALLED_APPS = [
     # Local apps
     'apps.core',  # Для менеджмент-команд
     'apps.users.apps.UsersConfig',  # Изменено для поддержки сигналов
-    'apps.network',
+    'apps.network.apps.NetworkConfig',  # Сигналы поддержки иерархии
     'apps.api',
     'health',  # Наше новое приложение для мониторинга
 ]
 
 MIDDLEWARE = [
-    # Наше новое middleware для логирования запросов должно быть первым
-    'config.middleware.RequestLoggingMiddleware',
+    # Инструментация (время по фазам, метрики, лог запроса) должна быть первой
+    'config.middleware.InstrumentationMiddleware',
+    # Чтения безопасных запросов API с реплик; охватывает все обращения к БД в запросе
+    'config.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.contrib.csrf.CsrfViewMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'health.middleware.MetricsMiddleware',  # Middleware для сбора метрик
 ]
 
 # --- НАСТРОЙКИ CORS ---
@@ -103,17 +105,56 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
+# Постоянные соединения: время жизни в секундах (0 - новое соединение на каждый запрос)
+# и проверка соединения перед первым использованием в запросе (config/db/base.py)
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Пул соединений процесса (config/db/pool.py): DB_POOL_MAX_SIZE > 0 включает пул
+# и заменяет постоянные соединения; таймаут ожидания и время жизни соединения в секундах
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+DB_POOL_OPTIONS = {
+    'max_size': DB_POOL_MAX_SIZE,
+    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 0)),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'config.db',
         'NAME': os.environ.get('PGDATABASE'),
         'USER': os.environ.get('PGUSER'),
         'PASSWORD': os.environ.get('PGPASSWORD'),
         'HOST': os.environ.get('PGHOST'),
         'PORT': os.environ.get('PGPORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        'OPTIONS': {'pool': DB_POOL_OPTIONS} if DB_POOL_MAX_SIZE else {},
     }
 }
 
+# Реплики для чтения (config/routers.py): DB_REPLICAS - хосты через запятую в виде host или host:port,
+# остальные параметры подключения как у основной БД. В окружении тестов DB_REPLICAS не задается:
+# отдельное соединение не видит незафиксированных данных TestCase. Тестовые БД на репликах
+# не создаются ни одним раннером (MIRROR).
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['config.routers.ReplicaRouter']
+
+# Пути, безопасные запросы к которым читают с реплик, и время (с), в течение которого
+# клиент после записи читает с основной БД
+REPLICA_READ_PATHS = ('/api/', '/monitoring/business/')
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -143,7 +184,7 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.users.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -155,6 +196,64 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Кэш Django: для развертывания с несколькими процессами задается общий бэкенд, например
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache и CACHE_LOCATION=memcached:11211.
+# По умолчанию - память процесса (разработка, тесты).
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', LOCAL_CACHE_BACKENDS[0]),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Число процессов-воркеров (gunicorn.conf.py передает фактическое значение воркерам)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Токены поколений (apps/network/cache.py) в кэше процесса не видны другим воркерам: запись в одном
+# не инвалидирует ответы и ETag списков в остальных. Без общего кэша при нескольких воркерах
+# кэш ответов и ETag списков отключены.
+CACHE_GENERATIONS_SHARED = CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS or WEB_CONCURRENCY <= 1
+
+# Кэш ответов API по узлам сети в секундах; 0 отключает кэширование.
+API_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('API_RESPONSE_CACHE_TIMEOUT', 300)) if CACHE_GENERATIONS_SHARED else 0
+
+# Пакетная загрузка узлов и связей (POST /api/v1/nodes/bulk/)
+BULK_UPSERT_MAX_ROWS = int(os.environ.get('BULK_UPSERT_MAX_ROWS', 10000))
+BULK_UPSERT_CHUNK_SIZE = int(os.environ.get('BULK_UPSERT_CHUNK_SIZE', 500))
+
+# Порог медленного запроса (мс): для таких запросов сохраняются отпечатки SQL (/monitoring/queries/)
+QUERY_PROFILER_SLOW_MS = int(os.environ.get('QUERY_PROFILER_SLOW_MS', 500))
+
+# Доля запросов, для которых пишутся рядовые строки лога запроса (0..1); ошибки пишутся всегда
+LOG_REQUEST_SAMPLE_RATE = float(os.environ.get('LOG_REQUEST_SAMPLE_RATE', 1.0))
+
+# Инструментация по префиксам путей: None - не измерять, число - доля логируемых запросов
+INSTRUMENTATION_PATHS = {
+    '/monitoring/': None,
+    '/admin/': float(os.environ.get('ADMIN_LOG_SAMPLE_RATE', LOG_REQUEST_SAMPLE_RATE)),
+}
+
+# Кэш аутентификации по токену: размер кэша процесса, TTL в секундах (0 отключает кэш)
+# и псевдоним общего кэша Django для второго уровня (пусто - только кэш процесса)
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+TOKEN_AUTH_SHARED_CACHE = os.environ.get('TOKEN_AUTH_SHARED_CACHE', '')
+
+# Токен доступа к внутренним эндпоинтам /monitoring/ (кроме проб health/) для Prometheus и скриптов:
+# заголовок 'Authorization: Bearer <токен>'; пусто - доступ только сотрудникам по сессии
+MONITORING_TOKEN = os.environ.get('MONITORING_TOKEN', '')
+
+# Время жизни кэша бизнес-метрик (/monitoring/business/) в секундах
+BUSINESS_METRICS_CACHE_TIMEOUT = int(os.environ.get('BUSINESS_METRICS_CACHE_TIMEOUT', 60))
+
+# Начиная с этого числа строк (по оценке планировщика) списки админки не считают точный COUNT(*);
+# 0 - всегда точный подсчет
+ADMIN_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get('ADMIN_COUNT_ESTIMATE_THRESHOLD', 10000))
+
 # --- LOGGING CONFIGURATION ---
 
 LOG_DIR = BASE_DIR / 'logs'
@@ -173,10 +272,7 @@ LOGGING = {
             'style': '{',
         },
         'json': {
-            'format': (
-                '{"timestamp": "%(asctime)s", "level": "%(levelname)s", '
-                '"module": "%(module)s", "message": "%(message)s"}'
-            )
+            '()': 'config.logging.JsonFormatter',
         },
     },
     'handlers': {
@@ -225,51 +321,57 @@ LOGGING = {
             'backupCount': 5,
             'formatter': 'json',  # JSON формат для легкого парсинга
         },
+        # Обертки с очередью: потоки запросов не ждут записи в файлы и ротации (config/logging.py).
+        # Имена queued_* идут по алфавиту после оборачиваемых обработчиков - так они уже созданы.
+        **{
+            f'queued_{name}': {'class': 'config.logging.QueuedHandler', 'handler': f'cfg://handlers.{name}'}
+            for name in ('console', 'file_general', 'file_security', 'file_business', 'file_errors', 'file_metrics')
+        },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file_general', 'file_errors'],
+            'handlers': ['queued_console', 'queued_file_general', 'queued_file_errors'],
             'level': 'INFO',
             'propagate': False,
         },
         'django.request': {
-            'handlers': ['file_errors'],
+            'handlers': ['queued_file_errors'],
             'level': 'ERROR',
             'propagate': False,
         },
         'django.security': {
-            'handlers': ['file_security'],
+            'handlers': ['queued_file_security'],
             'level': 'INFO',
             'propagate': False,
         },
         'security': {
-            'handlers': ['file_security', 'console'],
+            'handlers': ['queued_file_security', 'queued_console'],
             'level': 'INFO',
             'propagate': False,
         },
         'business': {
-            'handlers': ['file_business', 'console'],
+            'handlers': ['queued_file_business', 'queued_console'],
             'level': 'INFO',
             'propagate': False,
         },
         'apps': {
-            'handlers': ['console', 'file_general'],
+            'handlers': ['queued_console', 'queued_file_general'],
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
         'health': {
-            'handlers': ['console', 'file_general'],
+            'handlers': ['queued_console', 'queued_file_general'],
             'level': 'INFO',
             'propagate': False,
         },
         'metrics': {
-            'handlers': ['console', 'file_metrics'],
+            'handlers': ['queued_console', 'queued_file_metrics'],
             'level': 'INFO',
             'propagate': False,
         },
     },
     'root': {
-        'handlers': ['console', 'file_general', 'file_errors'],
+        'handlers': ['queued_console', 'queued_file_general', 'queued_file_errors'],
         'level': 'INFO',
     },
 }
@@ -0,0 +1,33 @@
+"""
+Настройки gunicorn, загружаются автоматически из рабочего каталога.
+
+Только для процессов gunicorn задается PROMETHEUS_MULTIPROC_DIR (если не задана в окружении):
+воркеры пишут метрики в файлы этого каталога (health/prometheus.py). Переменная задается
+до импорта prometheus_client: режим значений выбирается при импорте, а воркеры наследуют
+модули мастера. Перед запуском каталог очищается от файлов прошлого запуска,
+а при завершении воркера его gauge-метрики помечаются как неактуальные.
+
+Число воркеров передается приложению в WEB_CONCURRENCY (в том числе заданное флагом --workers):
+без общего кэша при нескольких воркерах кэш ответов API отключается (config/settings.py).
+"""
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus'))
+
+
+def on_starting(server):
+    # Воркеры загружают приложение после fork и читают окружение мастера.
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,114 +1,113 @@
-import psutil
-from django.http import JsonResponse
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q, Sum
+from django.http import HttpResponse, JsonResponse
 from django.views import View
 import logging
-from django.apps import apps
 from django.contrib.auth import get_user_model
-from apps.network.models import NetworkNode, Product  # Уточненный импорт
+from apps.network.models import NetworkNode, Product, SupplierLink  # Уточненный импорт
+
+from . import prometheus
+from .views import MonitoringAccessMixin
 
 logger = logging.getLogger('metrics')
 User = get_user_model()
 
+BUSINESS_METRICS_KEY = 'health:business-metrics'
+BUSINESS_METRICS_LOCK_KEY = 'health:business-metrics:lock'
+BUSINESS_METRICS_LOCK_TIMEOUT = 30
+BUSINESS_METRICS_TOP_LOCATIONS = 50
 
-class MetricsView(View):
+
+class MetricsView(MonitoringAccessMixin, View):
     """
-    Prometheus-подобные метрики для мониторинга
+    Метрики в формате Prometheus: гистограммы времени запросов и числа запросов к БД
+    по представлениям (health/prometheus.py); без PROMETHEUS_MULTIPROC_DIR - также метрики процесса.
     """
 
     def get(self, request):
-        metrics = {}
-
-        # Системные метрики
-        metrics.update(self._get_system_metrics())
+        payload, content_type = prometheus.render()
+        return HttpResponse(payload, content_type=content_type)
 
-        # Метрики приложения
-        metrics.update(self._get_application_metrics())
 
-        # Метрики базы данных (может быть медленным, будьте осторожны)
-        # metrics.update(self._get_database_metrics())
-
-        return JsonResponse(metrics)
+def collect_business_metrics():
+    """
+    Бизнес-метрики: по одному агрегирующему запросу на таблицу (условные COUNT вместо
+    отдельного count() на каждый срез) и группировки по городам и уровням.
+    """
+    users = User.objects.aggregate(total=Count('pk'), active=Count('pk', filter=Q(is_active=True)))
+    types = NetworkNode.NodeType
+    nodes = NetworkNode.objects.aggregate(
+        total=Count('pk'),
+        factories=Count('pk', filter=Q(node_type=types.FACTORY)),
+        retailers=Count('pk', filter=Q(node_type=types.RETAIL)),
+        entrepreneurs=Count('pk', filter=Q(node_type=types.ENTREPRENEUR)),
+        max_level=Max('level'),
+    )
+    locations = NetworkNode.objects.values('country', 'city').annotate(nodes=Count('pk')).order_by('-nodes')
+    links = SupplierLink.objects.aggregate(total=Count('pk'), total_debt=Sum('debt'))
+    links_by_level = (
+        SupplierLink.objects.values(level=F('client__level'))
+        .annotate(links=Count('pk'), debt=Sum('debt')).order_by('level')
+    )
+    return {
+        'users': users,
+        'network_nodes': nodes,
+        'nodes_by_location': list(locations[:BUSINESS_METRICS_TOP_LOCATIONS]),
+        'links': {
+            'total': links['total'],
+            'total_debt': links['total_debt'] or Decimal('0'),
+            'by_client_level': list(links_by_level),
+        },
+        'products': Product.objects.aggregate(total=Count('pk')),
+    }
+
+
+def get_business_metrics():
+    """
+    Метрики из кэша. По истечении BUSINESS_METRICS_CACHE_TIMEOUT пересчет выполняет один
+    процесс (блокировка через cache.add), остальные до его окончания получают прежние значения,
+    поэтому частый опрос не приводит к одновременным полным проходам по таблицам.
+    Пока идет самый первый расчет и прежних значений нет, возвращает None без ожидания.
+    """
+    cached = cache.get(BUSINESS_METRICS_KEY)
+    timeout = settings.BUSINESS_METRICS_CACHE_TIMEOUT
+    if cached is not None and time.time() - cached['computed_at'] < timeout:
+        return cached
 
-    def _get_system_metrics(self):
-        """
-        Системные метрики
-        """
-        try:
-            # Использование CPU
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-
-            # Использование памяти
-            memory = psutil.virtual_memory()
-
-            # Дисковое пространство
-            disk = psutil.disk_usage('/')
-
-            return {
-                'system_cpu_percent': cpu_percent,
-                'system_memory_total': memory.total,
-                'system_memory_available': memory.available,
-                'system_memory_used_percent': memory.percent,
-                'system_disk_total': disk.total,
-                'system_disk_used': disk.used,
-                'system_disk_free': disk.free,
-                'system_disk_used_percent': (disk.used / disk.total) * 100,
-            }
-        except Exception as e:
-            logger.error(f"Error getting system metrics: {str(e)}")
-            return {}
+    if not cache.add(BUSINESS_METRICS_LOCK_KEY, 1, BUSINESS_METRICS_LOCK_TIMEOUT):
+        # Расчет уже идет в другом процессе: ожидание заняло бы воркер на время полного прохода.
+        return cached
 
-    def _get_application_metrics(self):
-        """
-        Метрики приложения
-        """
-        try:
-            # Количество пользователей
-            total_users = User.objects.count()
-            active_users = User.objects.filter(is_active=True).count()
-
-            # Количество моделей в приложениях
-            model_counts = {}
-            for app_config in apps.get_app_configs():
-                if app_config.name.startswith('apps.'):
-                    model_count = len(app_config.get_models())
-                    model_counts[app_config.label] = model_count
-
-            return {
-                'application_users_total': total_users,
-                'application_users_active': active_users,
-                'application_models_by_app': model_counts,
-            }
-        except Exception as e:
-            logger.error(f"Error getting application metrics: {str(e)}")
-            return {}
+    try:
+        cached = {'computed_at': time.time(), 'business': collect_business_metrics()}
+        # Хранится дольше TTL, чтобы во время пересчета было что отдать.
+        cache.set(BUSINESS_METRICS_KEY, cached, timeout * 10 or None)
+    finally:
+        cache.delete(BUSINESS_METRICS_LOCK_KEY)
+    return cached
 
 
-class BusinessMetricsView(View):
+class BusinessMetricsView(MonitoringAccessMixin, View):
     """
-    Бизнес-метрики приложения
+    Бизнес-метрики приложения (кэшируются, см. get_business_metrics)
     """
 
     def get(self, request):
         try:
-            metrics = {
-                'business': {
-                    'users': {
-                        'total': User.objects.count(),
-                        'active': User.objects.filter(is_active=True).count(),
-                    },
-                    'network_nodes': {
-                        'total': NetworkNode.objects.count(),
-                        'factories': NetworkNode.objects.filter(type='factory').count(),
-                        'retailers': NetworkNode.objects.filter(type='retail').count(),
-                        'entrepreneurs': NetworkNode.objects.filter(type='individual_entrepreneur').count(),
-                    },
-                    'products': {
-                        'total': Product.objects.count(),
-                    }
-                }
-            }
-
-            return JsonResponse(metrics)
+            metrics = get_business_metrics()
+            if metrics is None:
+                response = JsonResponse({'error': 'Метрики рассчитываются, повторите запрос позже'}, status=503)
+                response['Retry-After'] = 1
+                return response
+            return JsonResponse({
+                'business': metrics['business'],
+                'computed_at': metrics['computed_at'],
+                'timestamp': time.time(),
+            })
         except Exception as e:
             logger.error(f"Error getting business metrics: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
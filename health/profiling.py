@@ -0,0 +1,157 @@
+"""
+Профилирование запросов к БД в продакшене через connection.execute_wrapper.
+
+В отличие от connection.queries (заполняется только при DEBUG), обертка работает всегда:
+на каждый запрос к БД приходится замер времени и обновление счетчика шаблонов SQL.
+Django передает обертке SQL с плейсхолдерами, поэтому повторы одного шаблона в рамках
+HTTP-запроса (N+1) видны без разбора текста. Нормализация в отпечатки (fingerprint)
+выполняется только для медленных запросов. Агрегаты по представлениям хранятся
+в памяти процесса и отдаются эндпоинтом /monitoring/queries/.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# Сколько шаблонов SQL хранить для одного HTTP-запроса и сколько отпечатков - для представления.
+MAX_STATEMENTS = 500
+MAX_FINGERPRINTS = 20
+SLOW_SAMPLES = 10
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Нормализует SQL: литералы и плейсхолдеры заменяются на ?, списки IN сворачиваются."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Обертка выполнения запросов: число запросов, время в БД и повторы шаблонов SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.count += 1
+            if len(self.statements) < MAX_STATEMENTS or sql in self.statements:
+                self.statements[sql] += 1
+
+    def profile(self):
+        """Контекст, подключающий обертку ко всем соединениям (в том числе к репликам)."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    @property
+    def max_repeats(self):
+        return max(self.statements.values(), default=0)
+
+    def fingerprints(self):
+        """Отпечатки запросов с числом выполнений, по убыванию."""
+        counts = Counter()
+        for sql, count in self.statements.items():
+            counts[fingerprint(sql)] += count
+        return counts
+
+
+class ViewStats:
+    """Накопленные показатели одного представления."""
+
+    def __init__(self):
+        self.requests = 0
+        self.total_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.max_repeats = 0
+        self.db_time = 0.0
+        self.slow = 0
+        self.fingerprints = Counter()
+        self.slow_samples = deque(maxlen=SLOW_SAMPLES)
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'avg_time_ms': round(self.total_time / requests * 1000, 2),
+            'avg_queries': round(self.queries / requests, 2),
+            'max_queries': self.max_queries,
+            'max_repeated_statement': self.max_repeats,
+            'avg_db_time_ms': round(self.db_time / requests * 1000, 2),
+            'slow_requests': self.slow,
+            'slow_fingerprints': [
+                {'sql': sql, 'count': count} for sql, count in self.fingerprints.most_common(MAX_FINGERPRINTS)
+            ],
+            'slow_samples': list(self.slow_samples),
+        }
+
+
+_lock = threading.Lock()
+_views = {}
+
+
+def record(view, path, duration, profile):
+    """
+    Учитывает HTTP-запрос в агрегатах представления.
+
+    Возвращает отпечатки SQL, если запрос медленный (порог QUERY_PROFILER_SLOW_MS), иначе None.
+    """
+    slow = duration * 1000 >= settings.QUERY_PROFILER_SLOW_MS
+    fingerprints = profile.fingerprints() if slow else None
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = ViewStats()
+        stats.requests += 1
+        stats.total_time += duration
+        stats.queries += profile.count
+        stats.max_queries = max(stats.max_queries, profile.count)
+        stats.max_repeats = max(stats.max_repeats, profile.max_repeats)
+        stats.db_time += profile.db_time
+        if slow:
+            stats.slow += 1
+            stats.fingerprints.update(fingerprints)
+            # Ограничиваем число отпечатков, чтобы память не росла с разнообразием запросов.
+            if len(stats.fingerprints) > MAX_FINGERPRINTS * 5:
+                stats.fingerprints = Counter(dict(stats.fingerprints.most_common(MAX_FINGERPRINTS)))
+            stats.slow_samples.append({
+                'path': path,
+                'time_ms': round(duration * 1000, 2),
+                'queries': profile.count,
+                'db_time_ms': round(profile.db_time * 1000, 2),
+                'top_fingerprints': [
+                    {'sql': sql, 'count': count} for sql, count in fingerprints.most_common(5)
+                ],
+            })
+    return fingerprints
+
+
+def get_stats():
+    """Агрегаты по представлениям текущего процесса, по убыванию суммарного времени в БД."""
+    with _lock:
+        ordered = sorted(_views.items(), key=lambda item: item[1].db_time, reverse=True)
+        return {view: stats.as_dict() for view, stats in ordered}
+
+
+def reset():
+    with _lock:
+        _views.clear()
@@ -0,0 +1,71 @@
+"""
+Метрики HTTP-запросов в формате Prometheus (эндпоинт /monitoring/metrics).
+
+Значения пишет config.middleware.InstrumentationMiddleware. Под gunicorn задается
+переменная окружения PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py): каждый воркер пишет
+метрики в свои mmap-файлы, а экспортер суммирует файлы всех процессов при сборе.
+Если каталог из переменной не существует (runserver, команды manage.py с окружением
+образа), он создается; если создать его нельзя, метрики остаются в памяти процесса.
+Сбор только читает счетчики и файлы, без обращений к БД и без замеров с ожиданием.
+"""
+import logging
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import multiprocess, values
+
+logger = logging.getLogger('health')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+
+def _multiprocess_dir():
+    """
+    Каталог файлов метрик или None. Режим значений prometheus_client выбирается по переменной
+    окружения при импорте, поэтому при недоступном каталоге он переключается обратно
+    на значения в памяти до создания метрик модуля: иначе первая же запись падает с FileNotFoundError.
+    """
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as error:
+        logger.warning(f"Каталог метрик PROMETHEUS_MULTIPROC_DIR недоступен ({error}), метрики только процесса")
+        values.ValueClass = values.MutexValue
+        return None
+    return directory
+
+
+MULTIPROC_DIR = _multiprocess_dir()
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса.',
+    ['view', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Число запросов к БД на HTTP-запрос.',
+    ['view', 'method'], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Время выполнения запросов к БД на HTTP-запрос.',
+    ['view', 'method'], buckets=LATENCY_BUCKETS,
+)
+
+
+def observe(view, method, status, duration, profile):
+    """Учитывает HTTP-запрос; view - имя маршрута, чтобы число рядов не зависело от URL."""
+    REQUEST_LATENCY.labels(view=view, method=method, status=str(status)).observe(duration)
+    REQUEST_QUERIES.labels(view=view, method=method).observe(profile.count)
+    REQUEST_DB_TIME.labels(view=view, method=method).observe(profile.db_time)
+
+
+def render():
+    """Текст метрик и его Content-Type."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,9 +1,13 @@
 from django.urls import path
+from .metrics import BusinessMetricsView, MetricsView
 from .views import (
     HealthCheckView,
     SimpleHealthCheckView,
     ReadinessCheckView,
-    LivenessCheckView
+    LivenessCheckView,
+    ResponseCacheStatsView,
+    QueryProfileView,
+    DatabaseConnectionsView
 )
 
 urlpatterns = [
@@ -11,4 +15,9 @@ urlpatterns = [
     path('health/simple/', SimpleHealthCheckView.as_view(), name='health-simple'),
     path('health/readiness/', ReadinessCheckView.as_view(), name='readiness-check'),
     path('health/liveness/', LivenessCheckView.as_view(), name='liveness-check'),
+    path('cache/', ResponseCacheStatsView.as_view(), name='cache-stats'),
+    path('database/', DatabaseConnectionsView.as_view(), name='database-connections'),
+    path('queries/', QueryProfileView.as_view(), name='query-profile'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('business/', BusinessMetricsView.as_view(), name='business-metrics'),
 ]
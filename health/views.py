@@ -1,3 +1,4 @@
+import hmac
 import logging
 import time
 import shutil
@@ -8,9 +9,36 @@ from django.conf import settings
 from django.core.cache import cache
 from django.db.migrations.executor import MigrationExecutor
 
+from apps.api.cache import get_stats
+from config.db.pool import pool_stats
+
+from . import profiling
+
 logger = logging.getLogger('health')
 
 
+class MonitoringAccessMixin:
+    """
+    Доступ к внутренним эндпоинтам мониторинга: сотрудникам (is_staff) по сессии
+    или по заголовку 'Authorization: Bearer <MONITORING_TOKEN>' (для Prometheus и скриптов).
+    Пробы здоровья (health/...) остаются открытыми для балансировщика.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.has_monitoring_access(request):
+            return JsonResponse({'error': 'Доступ к мониторингу запрещен'}, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    @staticmethod
+    def has_monitoring_access(request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_active and user.is_staff:
+            return True
+        token = settings.MONITORING_TOKEN
+        scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
 class HealthCheckView(View):
     """
     Комплексная проверка здоровья приложения
@@ -193,3 +221,43 @@ class LivenessCheckView(View):
             'alive': True,
             'timestamp': time.time()
         })
+
+
+class ResponseCacheStatsView(MonitoringAccessMixin, View):
+    """
+    Счетчики попаданий и промахов кэша ответов API
+    """
+    def get(self, request):
+        return JsonResponse({**get_stats(), 'timestamp': time.time()})
+
+
+class QueryProfileView(MonitoringAccessMixin, View):
+    """
+    Агрегаты запросов к БД по представлениям (число, время, отпечатки SQL медленных запросов)
+    """
+    def get(self, request):
+        return JsonResponse({
+            'slow_threshold_ms': settings.QUERY_PROFILER_SLOW_MS,
+            'views': profiling.get_stats(),
+            'timestamp': time.time(),
+        })
+
+
+class DatabaseConnectionsView(MonitoringAccessMixin, View):
+    """
+    Настройки соединений с БД и состояние пулов процесса: заполненность, ожидание, таймауты
+    """
+    def get(self, request):
+        databases = {}
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            pools = pool_stats(alias)
+            databases[alias] = {
+                'engine': settings_dict['ENGINE'],
+                'conn_max_age': settings_dict['CONN_MAX_AGE'],
+                'health_checks': bool(settings_dict.get('CONN_HEALTH_CHECKS')),
+                'pooled': bool(settings_dict['OPTIONS'].get('pool')),
+                'pools': pools,
+                'saturated': any(pool['waiting'] or pool['saturation'] >= 1 for pool in pools),
+            }
+        return JsonResponse({'databases': databases, 'timestamp': time.time()})